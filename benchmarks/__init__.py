@@ -0,0 +1 @@
+""" Offline benchmarks of telegram-messages-dump (see benchmarks/run.py) """
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Import time benchmark of telegram-messages-dump.
+    Measures how long the CLI takes to start, based on 'python -X importtime'.
+    Fails if a heavy module (e.g. Telethon) gets imported before it is needed,
+    or if the import takes longer than a budget.
+
+    Usage:
+      python -m benchmarks.import_time [-r 5] [--max-ms 100] [-o import_time.json]
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from time import perf_counter
+from benchmarks.run import REPO_DIR, _get_commit
+
+# Modules that must not be imported until the dump actually starts
+FORBIDDEN_MODULES = ['telethon', 'pyarrow', 'zstandard']
+
+# 'import time: self [us] | cumulative | imported package'
+_IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\| ( *)(\S+)\s*$')
+
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.import_time',
+        description='Import time benchmark of telegram-messages-dump.')
+    parser.add_argument('-m', '--module', default='telegram_messages_dump.run',
+                        help='Module to import. (Default: telegram_messages_dump.run)')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of runs, the fastest one is kept. (Default: 5)')
+    parser.add_argument('--max-ms', type=float, default=0,
+                        help='Fail if the import takes longer (ms). 0 means no limit.')
+    parser.add_argument('--forbid', default=','.join(FORBIDDEN_MODULES),
+                        help='Comma separated modules that must not be imported. '
+                             '(Default: {})'.format(','.join(FORBIDDEN_MODULES)))
+    parser.add_argument('--top', type=int, default=15,
+                        help='Number of the slowest imports to list. (Default: 15)')
+    parser.add_argument('-o', '--output', default='',
+                        help='Save the results into a JSON file.')
+    args = parser.parse_args()
+
+    runs = [_measure_import(args.module) for _ in range(max(args.repeat, 1))]
+    best = min(runs, key=lambda run: run['cumulative_us'])
+    cli_seconds = min(_measure_cli() for _ in range(max(args.repeat, 1)))
+
+    forbidden = [name for name in args.forbid.split(',') if name.strip()]
+    forbidden_imported = sorted(
+        imported for imported in best['modules']
+        if any(imported == name or imported.startswith(name + '.') for name in forbidden))
+
+    print('Import of {}: {:.1f} ms ({} modules)'.format(
+        args.module, best['cumulative_us'] / 1000, len(best['modules'])))
+    print('CLI startup (--help): {:.1f} ms'.format(cli_seconds * 1000))
+    print('The slowest imports (self time):')
+    for name, self_us in best['slowest'][:args.top]:
+        print('  {:>8.1f} ms  {}'.format(self_us / 1000, name))
+
+    ret_code = 0
+    if forbidden_imported:
+        print('FAILED: {} imported at startup: {}'.format(
+            ', '.join(sorted(set(name.split('.')[0] for name in forbidden_imported))),
+            ', '.join(forbidden_imported[:10])))
+        ret_code = 1
+    if args.max_ms and best['cumulative_us'] / 1000 > args.max_ms:
+        print('FAILED: import takes longer than {} ms.'.format(args.max_ms))
+        ret_code = 1
+
+    if args.output:
+        with open(args.output, 'w') as results_file:
+            json.dump({
+                'commit': _get_commit(),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'module': args.module,
+                'import_ms': best['cumulative_us'] / 1000,
+                'cli_startup_ms': cli_seconds * 1000,
+                'modules_count': len(best['modules']),
+                'forbidden_imported': forbidden_imported,
+                'slowest': [{'module': name, 'self_ms': self_us / 1000}
+                            for name, self_us in best['slowest'][:args.top]],
+            }, results_file, indent=4)
+        print('Results are saved into "{}".'.format(args.output))
+    return ret_code
+
+
+def _measure_import(module):
+    """ Imports a module in a new interpreter with -X importtime
+
+        :return dict with the cumulative import time of the module (us),
+                the names of all the modules imported and the slowest ones
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+    cumulative_us = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME_RE.match(line)
+        if not match:
+            continue
+        self_us, module_cumulative_us, indent, name = match.groups()
+        modules[name] = int(self_us)
+        if name == module and not indent:
+            cumulative_us = int(module_cumulative_us)
+    return {
+        'cumulative_us': cumulative_us,
+        'modules': sorted(modules),
+        'slowest': sorted(modules.items(), key=lambda item: item[1], reverse=True),
+    }
+
+
+def _measure_cli():
+    """ :return Number of seconds 'telegram-messages-dump --help' takes """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+    started = perf_counter()
+    subprocess.run([sys.executable, '-m', 'telegram_messages_dump', '--help'],
+                   cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, check=False)
+    return perf_counter() - started
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Merge benchmark of telegram-messages-dump.
+    Times how temp files are merged into the resulting file: utils.append_file
+    (raw bytes, in-kernel copying where possible) against the old path that decoded
+    every temp file with readlines() and re-encoded it with print.
+    The resulting file is opened in 'w' (a new dump) and in 'a' (--continue) modes.
+
+    Usage:
+      python -m benchmarks.merge [-s 2048] [-f 20] [-r 3] [-d /tmp] [-o merge.json]
+"""
+
+import os
+import sys
+import json
+import codecs
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from time import perf_counter
+from benchmarks.run import _get_commit
+from benchmarks.synthetic import _WORDS
+from telegram_messages_dump.utils import append_file
+
+# Ways to merge a temp file into the resulting file
+METHODS = ['readlines', 'append_file']
+
+# Modes the resulting file is opened in
+FILE_MODES = ['w', 'a']
+
+# Size of the block of lines temp files are made of
+_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.merge',
+        description='Merge benchmark of telegram-messages-dump.')
+    parser.add_argument('-s', '--size-mb', type=int, default=2048,
+                        help='Total size of the temp files (MiB). (Default: 2048)')
+    parser.add_argument('-f', '--files', type=int, default=20,
+                        help='Number of temp files. (Default: 20)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of runs of every case, the fastest one is kept. (Default: 3)')
+    parser.add_argument('-m', '--methods', default=','.join(METHODS),
+                        help='Comma separated merge methods: {}. (Default: all)'.format(
+                            ', '.join(METHODS)))
+    parser.add_argument('-d', '--dir', default=None,
+                        help='Directory for the temp and resulting files. '
+                             '(Default: the system temp directory)')
+    parser.add_argument('-o', '--output', default='',
+                        help='Save the results into a JSON file.')
+    args = parser.parse_args()
+
+    methods = [name.strip() for name in args.methods.split(',') if name.strip()]
+    for method in methods:
+        if method not in METHODS:
+            parser.error('Unknown method "{}".'.format(method))
+
+    work_dir = tempfile.mkdtemp(prefix='tmd-merge-', dir=args.dir)
+    try:
+        temp_files = _make_temp_files(work_dir, args.files, args.size_mb * 1024 * 1024)
+        total_size = sum(os.path.getsize(path) for path in temp_files)
+        print('Merging {} temp files, {:.1f} MiB in total, in "{}"'.format(
+            len(temp_files), total_size / 1024 / 1024, work_dir))
+
+        cases = []
+        for file_mode in FILE_MODES:
+            for method in methods:
+                seconds = min(_measure(method, file_mode, temp_files, work_dir)
+                              for _ in range(max(args.repeat, 1)))
+                case = {
+                    'method': method,
+                    'mode': file_mode,
+                    'seconds': seconds,
+                    'mb_per_second': total_size / 1000 / 1000 / seconds,
+                }
+                cases.append(case)
+                print('  {:<12} {!r}: {:>8.2f} s {:>10.1f} MB/s'.format(
+                    method, file_mode, seconds, case['mb_per_second']))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as results_file:
+            json.dump({
+                'commit': _get_commit(),
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'files_count': len(temp_files),
+                'total_size': total_size,
+                'cases': cases,
+            }, results_file, indent=4)
+        print('Results are saved into "{}".'.format(args.output))
+    return 0
+
+
+def _merge_readlines(temp_file_path, resulting_file):
+    """ The merge of a temp file before utils.append_file """
+    with codecs.open(temp_file_path, 'r', 'utf-8') as ctf:
+        for line in ctf.readlines():
+            print(line, file=resulting_file, end='')
+
+
+def _merge_append_file(temp_file_path, resulting_file):
+    """ The merge of a temp file as the dumper does it now """
+    append_file(temp_file_path, resulting_file.stream)
+
+
+def _make_temp_files(work_dir, files_count, total_size):
+    """ Writes temp files of formatted messages (UTF-8 lines with non-ASCII text)
+
+        :return list of paths
+    """
+    rnd = random.Random(0)
+    lines = []
+    block_size = 0
+    while block_size < _BLOCK_SIZE:
+        line = '{} | {} | {}\n'.format(
+            len(lines), rnd.randint(1, 10 ** 9),
+            ' '.join(rnd.choice(_WORDS) for _ in range(rnd.randint(5, 60))))
+        lines.append(line)
+        block_size += len(line.encode('utf-8'))
+    block = ''.join(lines).encode('utf-8')
+
+    file_size = max(total_size // max(files_count, 1), 1)
+    temp_files = []
+    for number in range(files_count):
+        path = os.path.join(work_dir, 'temp_{:04}'.format(number))
+        with open(path, 'wb') as temp_file:
+            written = 0
+            while written < file_size:
+                temp_file.write(block)
+                written += len(block)
+        temp_files.append(path)
+    return temp_files
+
+
+def _measure(method, file_mode, temp_files, work_dir):
+    """ Merges temp files into a resulting file the way the dumper does
+
+        :return Number of seconds the merge takes
+    """
+    resulting_path = os.path.join(work_dir, 'result')
+    if file_mode == 'a':
+        # --continue appends to the file of the previous run
+        with codecs.open(resulting_path, 'w', 'utf-8') as resulting_file:
+            resulting_file.write('previous run\n')
+    merge = _merge_readlines if method == 'readlines' else _merge_append_file
+
+    started = perf_counter()
+    with codecs.open(resulting_path, file_mode, 'utf-8') as resulting_file:
+        resulting_file.flush()
+        for temp_file_path in temp_files:
+            merge(temp_file_path, resulting_file)
+    seconds = perf_counter() - started
+
+    os.remove(resulting_path)
+    return seconds
+
+
+if __name__ == '__main__':
+    sys.exit(main())
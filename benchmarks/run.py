@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Offline benchmarks of telegram-messages-dump.
+    Dumps synthetic chat histories with a fake Telegram client, so no account is needed.
+    Every case (exporter x mode) runs in a separate process to measure its peak memory.
+    Results are stored as JSON to compare them across commits.
+
+    Usage:
+      python -m benchmarks.run [-n 100000] [-e text,jsonl] [-m sync,async,stream] [-o results.json]
+      python -m benchmarks.run --compare old_results.json new_results.json
+"""
+
+import os
+import sys
+import json
+import shlex
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXPORTERS = ['text', 'jsonl', 'csv', 'sqlite', 'parquet']
+
+# Benchmark mode -> dumper options
+MODES = {
+    'sync': [],
+    'async': ['--async'],
+    'stream': ['--stream'],
+}
+
+PHASES = ['fetch', 'format', 'spill', 'merge']
+
+RESULTS_SCHEMA = "http://telegram-messages-dump/schema/benchmark/v/1"
+
+
+def main():
+    """ Entry point """
+    args = _parse_args()
+    if args.child:
+        _run_case(json.loads(args.child))
+        return 0
+    if args.compare:
+        return _compare(*args.compare, threshold=args.threshold)
+    return _run_benchmarks(args)
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Offline benchmarks of telegram-messages-dump.')
+    parser.add_argument('-n', '--messages', type=int, default=100000,
+                        help='Number of messages in the synthetic chat. (Default: 100000)')
+    parser.add_argument('--text-length', type=int, default=120,
+                        help='Median length of a message text. (Default: 120)')
+    parser.add_argument('--text-length-sigma', type=float, default=1.0,
+                        help='Sigma of the log-normal distribution of text lengths. (Default: 1)')
+    parser.add_argument('--media-ratio', type=float, default=0.1,
+                        help='Share of messages with media. (Default: 0.1)')
+    parser.add_argument('--senders', type=int, default=50,
+                        help='Number of distinct senders. (Default: 50)')
+    parser.add_argument('--flood-waits', type=int, default=0,
+                        help='Number of FloodWaitErrors injected. (Default: 0)')
+    parser.add_argument('--flood-wait-seconds', type=int, default=0,
+                        help='Seconds of the injected FloodWaitErrors. (Default: 0)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the synthetic chat. (Default: 0)')
+    parser.add_argument('-e', '--exporters', default=','.join(EXPORTERS),
+                        help='Comma separated exporter names. (Default: all available)')
+    parser.add_argument('-m', '--modes', default=','.join(MODES),
+                        help='Comma separated modes: sync, async, stream. (Default: all)')
+    parser.add_argument('--dumper-args', default='',
+                        help='Extra telegram-messages-dump options, e.g. "--memory-budget=64M".')
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help='Runs per case, the fastest one is kept. (Default: 1)')
+    parser.add_argument('-o', '--output', default='benchmark_results.json',
+                        help='Results file. (Default: benchmark_results.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='Compare two results files instead of running benchmarks.')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Slowdown (%%) reported as a regression by --compare. (Default: 10)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def _run_benchmarks(args):
+    """ Runs every case in a child process and saves the results """
+    history = {
+        'size': args.messages,
+        'text_length': args.text_length,
+        'text_length_sigma': args.text_length_sigma,
+        'media_ratio': args.media_ratio,
+        'senders_count': args.senders,
+        'seed': args.seed,
+    }
+    results = {
+        'schema': RESULTS_SCHEMA,
+        'commit': _get_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'history': history,
+        'flood_waits': args.flood_waits,
+        'dumper_args': args.dumper_args,
+        'cases': [],
+    }
+
+    work_dir = tempfile.mkdtemp(prefix='tmd-bench-')
+    try:
+        for exporter in _split(args.exporters):
+            if not _is_exporter_available(exporter):
+                print('Skipping "{}" exporter as its dependencies are not installed.'
+                      .format(exporter))
+                continue
+            for mode in _split(args.modes):
+                case = {
+                    'name': '{}/{}'.format(exporter, mode),
+                    'exporter': exporter,
+                    'mode': mode,
+                    'history': history,
+                    'flood_waits_count': args.flood_waits,
+                    'flood_wait_seconds': args.flood_wait_seconds,
+                    'dumper_args': MODES[mode] + shlex.split(args.dumper_args),
+                    'out_file': os.path.join(work_dir, 'out'),
+                    'result_file': os.path.join(work_dir, 'result.json'),
+                }
+                runs = [_run_child(case) for _ in range(max(args.repeat, 1))]
+                best = min(runs, key=lambda r: r['seconds'])
+                results['cases'].append(best)
+                _print_case(best)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as results_file:
+        json.dump(results, results_file, indent=4)
+    print('Results are saved into "{}".'.format(args.output))
+    return 0 if all(case['return_code'] == 0 for case in results['cases']) else 1
+
+
+def _run_child(case):
+    """ Runs a case in a new process, so its peak memory is measured separately """
+    for path in (case['out_file'], case['result_file']):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    subprocess.run([sys.executable, '-m', 'benchmarks.run', '--child', json.dumps(case)],
+                   cwd=REPO_DIR, stdout=subprocess.DEVNULL, check=False)
+    try:
+        with open(case['result_file']) as result_file:
+            return json.load(result_file)
+    except (OSError, ValueError):
+        return {'name': case['name'], 'exporter': case['exporter'], 'mode': case['mode'],
+                'return_code': -1, 'seconds': float('inf')}
+
+
+def _run_case(case):
+    """ Runs a case in this process (the child one) and saves its result """
+    from benchmarks.synthetic import SyntheticHistory, FakeTelegramDumper
+    from telegram_messages_dump import run
+    from telegram_messages_dump.chat_dump_settings import ChatDumpSettings
+    from telegram_messages_dump.chat_dump_metadata import DumpMetadata
+
+    history = SyntheticHistory(**case['history'])
+    history_rss = _get_peak_rss()
+
+    sys.argv = ['telegram-messages-dump', '-p', '1', '-c', 'synthetic', '-q', '-l', '0',
+                '-o', case['out_file'], '-e', case['exporter'],
+                '--max-rate', '1000000'] + case['dumper_args']
+    settings = ChatDumpSettings(run.__doc__)
+    exporter = run._load_exporter(settings.exporter)  # pylint: disable=protected-access
+    dumper = FakeTelegramDumper(settings, DumpMetadata(settings.out_file), exporter, history,
+                                case['flood_waits_count'], case['flood_wait_seconds'])
+
+    started = perf_counter()
+    return_code = dumper.run()
+    seconds = perf_counter() - started
+
+    peak_rss = _get_peak_rss()
+    result = {
+        'name': case['name'],
+        'exporter': case['exporter'],
+        'mode': case['mode'],
+        'dumper_args': case['dumper_args'],
+        'return_code': return_code,
+        'messages': dumper.output_total_count,
+        'seconds': seconds,
+        'messages_per_sec': dumper.output_total_count / seconds if seconds else None,
+        'phases': {phase: dumper.phase_timer.seconds.get(phase, 0.0) for phase in PHASES},
+        'requests': dumper.rate_limiter.requests_count,
+        'flood_waits': dumper.rate_limiter.flood_waits_count,
+        'temp_files': dumper.memory_budget.segments_count,
+        'peak_buffered_bytes': dumper.memory_budget.peak_buffered_bytes,
+        'output_bytes': _get_size(case['out_file']),
+        # Peak RSS of the process includes the synthetic history itself
+        'history_rss_bytes': history_rss,
+        'peak_rss_bytes': peak_rss,
+        'dump_rss_bytes': peak_rss - history_rss if peak_rss is not None else None,
+    }
+    with open(case['result_file'], 'w') as result_file:
+        json.dump(result, result_file)
+
+
+def _compare(old_path, new_path, threshold):
+    """ Prints the difference between two results files.
+
+        :return 1 if any case got slower by more than 'threshold' percent, 0 otherwise
+    """
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old_results = json.load(old_file)
+        new_results = json.load(new_file)
+    print('{} ({}) -> {} ({})'.format(old_path, old_results.get('commit'),
+                                      new_path, new_results.get('commit')))
+    if old_results.get('history') != new_results.get('history'):
+        print('WARNING: The results were made with different synthetic chats.')
+
+    old_cases = {case['name']: case for case in old_results['cases']}
+    regressions = 0
+    print('{:<16} {:>12} {:>12} {:>8} {:>12} {:>12}'.format(
+        'case', 'old msg/s', 'new msg/s', 'change', 'old RSS', 'new RSS'))
+    for new_case in new_results['cases']:
+        old_case = old_cases.get(new_case['name'])
+        if not old_case or not old_case.get('messages_per_sec') \
+                or not new_case.get('messages_per_sec'):
+            continue
+        change = (new_case['messages_per_sec'] / old_case['messages_per_sec'] - 1) * 100
+        is_regression = change < -threshold
+        regressions += is_regression
+        print('{:<16} {:>12.0f} {:>12.0f} {:>+7.1f}% {:>12} {:>12}{}'.format(
+            new_case['name'], old_case['messages_per_sec'], new_case['messages_per_sec'],
+            change, _format_mib(old_case.get('dump_rss_bytes')),
+            _format_mib(new_case.get('dump_rss_bytes')), '  REGRESSION' if is_regression else ''))
+    return 1 if regressions else 0
+
+
+def _print_case(case):
+    if case['return_code'] != 0:
+        print('{:<16} FAILED'.format(case['name']))
+        return
+    print('{:<16} {:>9.0f} msg/s {:>7.2f} s  {}  RSS {}'.format(
+        case['name'], case['messages_per_sec'], case['seconds'],
+        '  '.join('{} {:.2f}'.format(phase, case['phases'][phase]) for phase in PHASES),
+        _format_mib(case['dump_rss_bytes'])))
+
+
+def _format_mib(size):
+    return '{:.1f} MiB'.format(size / 1024 ** 2) if size is not None else 'n/a'
+
+
+def _get_peak_rss():
+    """ :return peak resident set size of this process in bytes (None if unknown) """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # It is in kilobytes everywhere but macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def _get_size(path):
+    """ :return size of a file or a directory in bytes """
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(dir_path, file_name))
+                   for dir_path, _, file_names in os.walk(path) for file_name in file_names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _is_exporter_available(exporter_name):
+    try:
+        __import__('telegram_messages_dump.exporters.' + exporter_name)
+    except ImportError:
+        return False
+    return True
+
+
+def _split(names):
+    return [name.strip() for name in names.split(',') if name.strip()]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
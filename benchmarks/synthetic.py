@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains a synthetic chat history and a fake Telegram client serving it """
+
+import bisect
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+from time import perf_counter
+from telethon.errors import FloodWaitError
+from telethon.helpers import TotalList
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
+from telegram_messages_dump.rate_limiter import RateLimiter
+from telegram_messages_dump.telegram_dumper import TelegramDumper
+
+# Telegram doesn't allow longer messages
+MAX_TEXT_LENGTH = 4096
+
+# Words the message texts are made of. Quotes, separators and non-ASCII characters
+# are there to make exporters escape them.
+_WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+          'incididunt ut labore et dolore magna aliqua "quoted" comma, semi;colon '
+          'back\\slash tab\tseparated '
+          'привет мир 你好 مرحبا 😀 👍🏽').split(' ')
+
+
+class SyntheticUser:
+    """ Sender of synthetic messages. Has the attributes of a Telethon User the dumper uses. """
+
+    __slots__ = ('id', 'username', 'title', 'first_name', 'last_name', 'bot')
+
+    def __init__(self, user_id, username, first_name, last_name, bot):
+        self.id = user_id
+        self.username = username
+        self.title = None
+        self.first_name = first_name
+        self.last_name = last_name
+        self.bot = bot
+
+
+class SyntheticMessage:
+    """ Synthetic message. Has the attributes of a Telethon Message the dumper uses. """
+
+    __slots__ = ('id', 'date', 'from_id', 'reply_to_msg_id', 'message', 'media', 'sender')
+
+    def __init__(self, msg_id, date, sender, reply_to_msg_id, message, media):
+        self.id = msg_id
+        self.date = date
+        self.from_id = sender.id
+        self.reply_to_msg_id = reply_to_msg_id
+        self.message = message
+        self.media = media
+        self.sender = sender
+
+
+class SyntheticHistory:
+    """ Chat history generated from a seed, so every run gets exactly the same messages.
+        Message ids go from 1 to 'size' without gaps.
+    """
+
+    def __init__(self, size, text_length=120, text_length_sigma=1.0,
+                 media_ratio=0.1, reply_ratio=0.1, senders_count=50, bots_ratio=0.05, seed=0):
+        """ constructor
+            :param size:                Number of messages
+            :param text_length:         Median length of a message text (characters)
+            :param text_length_sigma:   Sigma of the log-normal distribution of text lengths
+                                        (0 makes all the texts of the same length)
+            :param media_ratio:         Share of messages with media (photos and documents)
+            :param reply_ratio:         Share of messages that are replies
+            :param senders_count:       Number of distinct senders
+            :param bots_ratio:          Share of senders that are bots
+            :param seed:                Seed of the random generator
+        """
+        rnd = random.Random(seed)
+
+        senders = [SyntheticUser(1000 + i,
+                                 'user{}'.format(i) if rnd.random() < 0.5 else None,
+                                 'First{}'.format(i), 'Last "{}"'.format(i),
+                                 rnd.random() < bots_ratio)
+                   for i in range(max(senders_count, 1))]
+
+        # Texts are slices of a long random text, which is way faster than
+        # generating every one of them from words
+        corpus = []
+        corpus_length = 0
+        while corpus_length < MAX_TEXT_LENGTH * 16:
+            word = rnd.choice(_WORDS)
+            corpus.append(word)
+            corpus_length += len(word) + 1
+            if rnd.random() < 0.02:
+                corpus.append('\n')
+        corpus = ' '.join(corpus)
+
+        date = datetime(2018, 1, 1, tzinfo=timezone.utc)
+        media_types = (MessageMediaPhoto(), MessageMediaDocument())
+        self.messages = []
+        for msg_id in range(1, size + 1):
+            length = min(int(rnd.lognormvariate(0, text_length_sigma) * text_length),
+                         MAX_TEXT_LENGTH)
+            offset = rnd.randrange(len(corpus) - length)
+            date += timedelta(seconds=rnd.randrange(1, 600))
+            self.messages.append(SyntheticMessage(
+                msg_id, date, rnd.choice(senders),
+                rnd.randrange(1, msg_id) if msg_id > 1 and rnd.random() < reply_ratio else None,
+                corpus[offset:offset + length],
+                rnd.choice(media_types) if rnd.random() < media_ratio else None))
+        self.ids = [msg.id for msg in self.messages]
+
+    def __len__(self):
+        return len(self.messages)
+
+    def get_messages(self, limit=100, offset_id=0, min_id=0, max_id=0, add_offset=0,
+                     reverse=False):
+        """ Same as TelegramClient.get_messages of a chat with this history.
+
+            :return list of messages (with 'total' attribute)
+        """
+        # Messages with ids in (low, high) range
+        low = min_id
+        high = max_id or len(self.messages) + 1
+        if offset_id:
+            if reverse:
+                low = max(low, offset_id)
+            else:
+                high = min(high, offset_id)
+        begin = bisect.bisect_right(self.ids, low)
+        end = bisect.bisect_left(self.ids, high)
+
+        if reverse:
+            begin += add_offset
+            page = self.messages[begin:min(begin + limit, end)]
+        else:
+            end -= add_offset
+            page = self.messages[max(end - limit, begin):max(end, begin)][::-1]
+        result = TotalList(page)
+        result.total = len(self.messages)
+        return result
+
+
+class PhaseTimer:
+    """ Accumulates wall time spent in phases of a dump. Thread-safe. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {}
+
+    @contextmanager
+    def measure(self, phase):
+        """ Measures the time spent in the 'with' block """
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - started
+            with self._lock:
+                self.seconds[phase] = self.seconds.get(phase, 0.0) + elapsed
+
+
+class _TimedSink:
+    """ Proxy of a sink (see exporters/sink.py) that measures the time spent in it """
+
+    def __init__(self, sink, timer, phase):
+        self._sink = sink
+        self._timer = timer
+        self._phase = phase
+
+    def write_lines(self, lines):
+        with self._timer.measure(self._phase):
+            self._sink.write_lines(lines)
+
+    def write_keyed_lines(self, lines, keys):
+        with self._timer.measure(self._phase):
+            self._sink.write_keyed_lines(lines, keys)
+
+    def append_temp_file(self, temp_file_path):
+        with self._timer.measure(self._phase):
+            self._sink.append_temp_file(temp_file_path)
+
+    def sync(self):
+        with self._timer.measure(self._phase):
+            return self._sink.sync()
+
+
+class FakeTelegramDumper(TelegramDumper):
+    """ TelegramDumper that dumps a synthetic history instead of a real chat.
+        It never connects to Telegram servers and measures the time spent in phases:
+            fetch   - getting pages of messages and extracting their data
+            format  - formatting messages by the exporter (in this process)
+            spill   - writing temp files
+            merge   - writing the resulting file
+        NOTE: Phases overlap in --async mode, so they don't sum up to the total time.
+    """
+
+    def __init__(self, settings, metadata, exporter, history,
+                 flood_waits_count=0, flood_wait_seconds=0):
+        """ constructor
+            :param history:             SyntheticHistory to serve
+            :param flood_waits_count:   Number of FloodWaitErrors spread over the requests
+            :param flood_wait_seconds:  'seconds' of the injected FloodWaitErrors
+        """
+        super().__init__(None, settings, metadata, exporter)
+        self.history = history
+        self.phase_timer = PhaseTimer()
+        self._requests_count = 0
+
+        # Start at full speed, ramping up is not what is measured
+        self.rate_limiter = RateLimiter(rate=self.settings.max_rate,
+                                        max_rate=self.settings.max_rate,
+                                        backoff_ceiling=self.settings.max_backoff)
+
+        self.flood_wait_seconds = flood_wait_seconds
+        requests_total = max(len(history) // 100, 1)
+        self._flood_wait_requests = set(
+            requests_total * (i + 1) // (flood_waits_count + 1)
+            for i in range(flood_waits_count))
+
+    def _init_connect(self):
+        pass
+
+    def _getChannel(self):
+        return 'synthetic'
+
+    def _prefetch_senders(self, peer):
+        pass
+
+    def connect(self):
+        return self._run_like_telethon(self._connect_coro())
+
+    def get_messages(self, *args, **kwargs):
+        return self._run_like_telethon(self._get_messages_coro(*args, **kwargs))
+
+    def _run_like_telethon(self, coro):
+        """ Telethon's sync methods are awaitable when called from a running event loop """
+        if self.loop.is_running():
+            return coro
+        return self.loop.run_until_complete(coro)
+
+    async def _connect_coro(self):
+        return True
+
+    async def _get_messages_coro(self, peer, **kwargs):
+        self._requests_count += 1
+        if self._requests_count in self._flood_wait_requests:
+            self._flood_wait_requests.discard(self._requests_count)
+            raise FloodWaitError(request=None, capture=self.flood_wait_seconds)
+        with self.phase_timer.measure('fetch'):
+            return self.history.get_messages(**kwargs)
+
+    def _to_records(self, messages):
+        with self.phase_timer.measure('fetch'):
+            return super()._to_records(messages)
+
+    def _format_messages(self, messages, is_last_page):
+        with self.phase_timer.measure('format'):
+            return super()._format_messages(messages, is_last_page)
+
+    def _write_temp_file(self, *args, **kwargs):
+        with self.phase_timer.measure('spill'):
+            return super()._write_temp_file(*args, **kwargs)
+
+    @contextmanager
+    def _open_final_file(self, *args, **kwargs):
+        with super()._open_final_file(*args, **kwargs) as resulting_file:
+            # Otherwise the resulting file is written by '_write_final_file' as a whole
+            if self.settings.is_stream_mode:
+                resulting_file = _TimedSink(resulting_file, self.phase_timer, 'merge')
+            yield resulting_file
+
+    def _write_final_file(self, *args, **kwargs):
+        with self.phase_timer.measure('merge'):
+            return super()._write_final_file(*args, **kwargs)
@@ -23,6 +23,10 @@ setup(
     url='https://github.com/Kosat/telegram-messages-dump',
     download_url='https://github.com/Kosat/telegram-messages-dump/releases',
     install_requires=['telethon==1.6.2'],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'zstd': ['zstandard'],
+    },
     license="MIT",
     packages=['telegram_messages_dump', "telegram_messages_dump.exporters"],
     include_package_data=True,
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains classes related to Checkpoint Files"""
+
+import os
+import errno
+import codecs
+import json
+import shutil
+import logging
+from telegram_messages_dump.output_segments import get_line_keys_file_path
+
+
+class DumpCheckpoint:
+    """ Progress of an unfinished dump. It is saved periodically, so a dump that was killed
+        or crashed is resumed from the last checkpoint rather than started from scratch.
+        The checkpoint is kept in '<out>.checkpoint' file and the batches of messages
+        that were spilled to disk are kept in '<out>.segments' directory next to it.
+        Both are removed once the dump is complete.
+    """
+
+    SCHEMA = "http://telegram-messages-dump/schema/checkpoint/v/1"
+
+    # Settings a checkpoint is only valid for
+    SETTINGS_KEYS = ('chat_name', 'exporter', 'compress', 'last_message_id', 'limit',
+                     'is_stream_mode', 'is_indexed')
+
+    SEGMENTS = "segments"
+
+    def __init__(self, out_file_path):
+        self.checkpoint_file_path = out_file_path + '.checkpoint'
+        self.segments_dir_path = out_file_path + '.segments'
+        self.logger = logging.getLogger(__name__)
+
+    def load(self, settings):
+        """ Loads the checkpoint left by an interrupted run of the same dump.
+            :param settings: ChatDumpSettings of the current run
+
+            :return dict with the dump progress, or None if there is nothing to resume from
+        """
+        try:
+            self.logger.debug('Load checkpoint %s.', self.checkpoint_file_path)
+            with codecs.open(self.checkpoint_file_path, 'r', 'utf-8') as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                self.logger.warning('Unable to open the checkpoint "%s". %s',
+                                    self.checkpoint_file_path, ex.strerror)
+            return None
+        except ValueError as ex:
+            self.logger.warning('Unable to load the checkpoint "%s". %s',
+                                self.checkpoint_file_path, ex)
+            return None
+
+        if not isinstance(state, dict) or state.get("schema") != DumpCheckpoint.SCHEMA:
+            self.logger.warning('Checkpoint "%s" is malformed, ignored.',
+                                self.checkpoint_file_path)
+            return None
+        if state.get("settings") != self._get_settings_dict(settings):
+            self.logger.warning('Checkpoint "%s" was made with other settings, ignored.',
+                                self.checkpoint_file_path)
+            return None
+
+        segments = [(os.path.join(self.segments_dir_path, name), batch_latest_message_id)
+                    for name, batch_latest_message_id in state[DumpCheckpoint.SEGMENTS]]
+        if not all(os.path.isfile(path) for path, _ in segments):
+            self.logger.warning('Some files of checkpoint "%s" are missing, ignored.',
+                                self.checkpoint_file_path)
+            return None
+        state[DumpCheckpoint.SEGMENTS] = segments
+        return state
+
+    def save(self, settings, state):
+        """ Atomically replaces the checkpoint file.
+            A failure is not fatal as it only affects the ability to resume.
+            :param settings:    ChatDumpSettings of the current run
+            :param state:       dict with the dump progress. Its 'segments' item is
+                                a list of (segment file path, the latest message id in it)
+        """
+        state = dict(state)
+        state["schema"] = DumpCheckpoint.SCHEMA
+        state["settings"] = self._get_settings_dict(settings)
+        state[DumpCheckpoint.SEGMENTS] = [
+            (os.path.basename(path), batch_latest_message_id)
+            for path, batch_latest_message_id in state.get(DumpCheckpoint.SEGMENTS, ())]
+        try:
+            self.logger.debug('Save checkpoint %s.', self.checkpoint_file_path)
+            tmp_file_path = self.checkpoint_file_path + '.tmp'
+            with codecs.open(tmp_file_path, 'w', 'utf-8') as checkpoint_file:
+                json.dump(state, checkpoint_file, ensure_ascii=False)
+                # The checkpoint must reach the disk before it replaces the previous one
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+            os.replace(tmp_file_path, self.checkpoint_file_path)
+        except OSError as ex:
+            self.logger.warning('Failed to write the checkpoint "%s". %s',
+                                self.checkpoint_file_path, ex.strerror)
+
+    def prepare_segments_dir(self, state):
+        """ Creates the directory for segment files and removes the files in it
+            that don't belong to the checkpoint (e.g. spilled after it was saved).
+            :param state: dict returned by 'load' or None
+        """
+        os.makedirs(self.segments_dir_path, exist_ok=True)
+        segments = set(path for path, _ in state[DumpCheckpoint.SEGMENTS]) if state else set()
+        # Keys of the messages of the segment files are kept along with them (see --index)
+        segments.update([get_line_keys_file_path(path) for path in segments])
+        for file_name in os.listdir(self.segments_dir_path):
+            file_path = os.path.join(self.segments_dir_path, file_name)
+            if file_path not in segments:
+                self.logger.debug('Delete stale segment file %s.', file_path)
+                os.remove(file_path)
+
+    def discard(self):
+        """ Removes the checkpoint file along with the segment files """
+        try:
+            self.logger.debug('Delete checkpoint %s.', self.checkpoint_file_path)
+            os.remove(self.checkpoint_file_path)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                self.logger.warning('Failed to delete the checkpoint "%s". %s',
+                                    self.checkpoint_file_path, ex.strerror)
+        shutil.rmtree(self.segments_dir_path, ignore_errors=True)
+
+    @staticmethod
+    def _get_settings_dict(settings):
+        return {key: getattr(settings, key) for key in DumpCheckpoint.SETTINGS_KEYS}
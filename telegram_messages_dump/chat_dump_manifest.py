@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains classes related to Manifest Files (multi-chat mode)"""
+
+import os.path
+import copy
+import codecs
+import json
+import logging
+from telegram_messages_dump.exceptions import ManifestError
+
+
+class DumpManifest:
+    """ Manifest file reader.
+        A manifest is a JSON array with one object per chat. E.g.:
+        [
+            {"chat": "@python", "out": "python.log", "exp": "jsonl", "limit": 0},
+            {"out": "geeks.log", "continue": true}
+        ]
+        Only "chat" is mandatory unless "continue" is true,
+        in which case "out" is mandatory and the rest is taken from its .meta file.
+    """
+
+    CHAT_NAME = "chat"
+    OUT_FILE = "out"
+    EXPORTER = "exp"
+    LIMIT = "limit"
+    CONTINUE = "continue"
+
+    def __init__(self, manifest_file_path):
+        self.manifest_file_path = manifest_file_path
+        self.logger = logging.getLogger(__name__)
+
+    def load_chat_settings(self, settings):
+        """ Derives per-chat settings from the common ones.
+            :param settings: ChatDumpSettings as specified by user
+
+            :return list of ChatDumpSettings, one per manifest entry
+        """
+        chat_settings_list = [self._make_chat_settings(settings, entry, index)
+                              for index, entry in enumerate(self._loadFromFile())]
+
+        out_files = [os.path.abspath(s.out_file) for s in chat_settings_list]
+        if len(set(out_files)) != len(out_files):
+            raise ManifestError('Output files of the manifest entries must be unique.')
+        return chat_settings_list
+
+    def _loadFromFile(self):
+        """ Loads manifest entries from file """
+        try:
+            self.logger.debug('Load manifest %s.', self.manifest_file_path)
+            with codecs.open(self.manifest_file_path, 'r', 'utf-8') as manifest_file:
+                entries = json.load(manifest_file)
+        except OSError as ex:
+            raise ManifestError('Unable to open the manifest file "{}". {}'
+                                .format(self.manifest_file_path, ex.strerror)) from ex
+        except ValueError as ex:
+            raise ManifestError('Unable to load the manifest file "{}". {}'
+                                .format(self.manifest_file_path, ex)) from ex
+
+        if not isinstance(entries, list) or not entries:
+            raise ManifestError('The manifest file "{}" must contain a non-empty JSON array.'
+                                .format(self.manifest_file_path))
+        return entries
+
+    def _make_chat_settings(self, settings, entry, index):
+        """ Creates a copy of settings specific to one manifest entry """
+        if not isinstance(entry, dict):
+            raise ManifestError('Manifest entry #{} must be a JSON object.'.format(index))
+
+        chat_settings = copy.copy(settings)
+        chat_settings.manifest_file = ''
+        chat_settings.chat_name = str(entry.get(DumpManifest.CHAT_NAME, '')).strip()
+        chat_settings.out_file = str(entry.get(DumpManifest.OUT_FILE, '')).strip()
+        chat_settings.exporter = str(entry.get(DumpManifest.EXPORTER, settings.exporter)).strip()
+        chat_settings.is_incremental_mode = bool(entry.get(DumpManifest.CONTINUE, False))
+        chat_settings.last_message_id = -1
+
+        if chat_settings.is_incremental_mode:
+            # chat name and exporter will be taken from the metadata file
+            if not chat_settings.out_file:
+                raise ManifestError('Manifest entry #{}: "{}" must be specified '
+                                    'when "{}" is set.'.format(index, DumpManifest.OUT_FILE,
+                                                               DumpManifest.CONTINUE))
+            chat_settings.limit = -1
+            return chat_settings
+
+        if not chat_settings.chat_name:
+            raise ManifestError('Manifest entry #{}: "{}" must be specified.'
+                                .format(index, DumpManifest.CHAT_NAME))
+        if not chat_settings.out_file:
+            chat_settings.out_file = settings.default_out_file(chat_settings.chat_name)
+        try:
+            chat_settings.limit = int(entry.get(DumpManifest.LIMIT, settings.limit))
+            if chat_settings.limit < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ManifestError('Manifest entry #{}: "{}" must be a non-negative integer.'
+                                .format(index, DumpManifest.LIMIT))
+        return chat_settings
@@ -16,6 +16,9 @@ class DumpMetadata:
     CHAT_NAME = "chat_name"
     LAST_MESSAGE_ID = "latest_message_id"
     EXPORTER = "exporter_name"
+    COMPRESSION = "compression"
+    ROTATION = "rotation"
+    INDEX = "index"
 
     def __init__(self, out_file_path):
         self.meta_file_path = out_file_path + '.meta'
@@ -30,6 +33,16 @@ class DumpMetadata:
         settings.chat_name = self._meta_dict[DumpMetadata.CHAT_NAME]
         settings.last_message_id = self._meta_dict[DumpMetadata.LAST_MESSAGE_ID]
         settings.exporter = self._meta_dict[DumpMetadata.EXPORTER]
+        # New data has to be compressed the same way as the existing one
+        settings.compress = self._meta_dict.get(DumpMetadata.COMPRESSION, '')
+        # New messages go into the segments of a rotated output the same way as well
+        rotation = self._meta_dict.get(DumpMetadata.ROTATION) or {}
+        settings.rotate_size = rotation.get("size", 0)
+        settings.rotate_count = rotation.get("count", 0)
+        settings.rotate_period = rotation.get("period", '')
+        # A file that is indexed is kept indexed, one that is not may be indexed from now on
+        settings.is_indexed = settings.is_indexed \
+            or self._meta_dict.get(DumpMetadata.INDEX, False)
 
     def _loadFromFile(self):
         """ Loads metadata from file """
@@ -72,10 +85,19 @@ class DumpMetadata:
                      new_dict[DumpMetadata.LAST_MESSAGE_ID]
             if DumpMetadata.EXPORTER in new_dict:
                 self._meta_dict[DumpMetadata.EXPORTER] = new_dict[DumpMetadata.EXPORTER]
+            if DumpMetadata.COMPRESSION in new_dict:
+                self._meta_dict[DumpMetadata.COMPRESSION] = new_dict[DumpMetadata.COMPRESSION]
+            if DumpMetadata.ROTATION in new_dict:
+                self._meta_dict[DumpMetadata.ROTATION] = new_dict[DumpMetadata.ROTATION]
+            if DumpMetadata.INDEX in new_dict:
+                self._meta_dict[DumpMetadata.INDEX] = new_dict[DumpMetadata.INDEX]
 
             self.logger.info('Writing a new metadata file.')
-            with open(self.meta_file_path, 'w') as mf:
+            # Write a temp file and rename it, so the old metadata survives a crash
+            tmp_file_path = self.meta_file_path + '.tmp'
+            with open(tmp_file_path, 'w') as mf:
                 json.dump(self._meta_dict, mf, indent=4, sort_keys=False)
+            os.replace(tmp_file_path, self.meta_file_path)
         except OSError as ex:
             raise MetadataError(
                 'Failed to write the metadata file. {}'.format(ex.strerror))
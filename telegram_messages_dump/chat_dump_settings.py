@@ -4,6 +4,9 @@
 
 import argparse
 from telegram_messages_dump.utils import JOIN_CHAT_PREFIX_URL
+from telegram_messages_dump.utils import parse_size
+from telegram_messages_dump.compression import check_compression_method
+from telegram_messages_dump.output_segments import ROTATION_PERIODS
 
 
 class ChatDumpSettings:
@@ -32,6 +35,30 @@ class ChatDumpSettings:
         parser.add_argument('-v', '--verbose', action='store_true')
         parser.add_argument('--addbom', action='store_true')
         parser.add_argument('-q', '--quiet', action='store_true')
+        parser.add_argument('--async', dest='async_mode', action='store_true')
+        parser.add_argument('--stream', action='store_true')
+        parser.add_argument('--fetch-workers', dest='fetch_workers', default=1, type=int)
+        parser.add_argument('--format-workers', dest='format_workers', default=0, type=int)
+        parser.add_argument('--prefetch-senders', dest='prefetch_senders', action='store_true')
+        parser.add_argument('--compress', default='', type=str)
+        parser.add_argument('--checkpoint', action='store_true')
+        parser.add_argument('--follow', action='store_true')
+        parser.add_argument('--rotate-size', dest='rotate_size', default='', type=str)
+        parser.add_argument('--rotate-count', dest='rotate_count', default=0, type=int)
+        parser.add_argument('--rotate-period', dest='rotate_period', default='', type=str)
+        parser.add_argument('--index', action='store_true')
+        parser.add_argument('--memory-budget', dest='memory_budget', default='', type=str)
+        parser.add_argument('--media', default='', type=str)
+        parser.add_argument('--media-workers', dest='media_workers', default=4, type=int)
+        parser.add_argument('--profile', action='store_true')
+        parser.add_argument('--stats-json', dest='stats_json', default='', type=str)
+        parser.add_argument('--prometheus-textfile', dest='prometheus_textfile',
+                            default='', type=str)
+        parser.add_argument('--max-rate', dest='max_rate', default=3.0, type=float)
+        parser.add_argument('--max-backoff', dest='max_backoff', default=300, type=int)
+        parser.add_argument('--manifest', default='', type=str)
+        parser.add_argument('--max-concurrent-chats', dest='max_concurrent_chats',
+                            default=4, type=int)
 
         args = parser.parse_args()
 
@@ -44,6 +71,8 @@ class ChatDumpSettings:
             args.out = args.out.strip()
         if args.phone:
             args.phone = args.phone.strip()
+        if args.manifest:
+            args.manifest = args.manifest.strip()
 
         # Detect Normal/Incremental mode
         self._process_incremental_mode_option(args, parser)
@@ -66,19 +95,92 @@ class ChatDumpSettings:
         if not self.is_incremental_mode and args.limit < 0:
             args.limit = 100
 
+        # Streaming mode writes the resulting file directly in a single pass
+        if args.stream and (args.async_mode or args.manifest):
+            parser.error('--stream can not be combined with --async or --manifest')
+
+        # Validate rate limiter and concurrency settings
+        if args.max_rate <= 0:
+            parser.error('--max-rate must be a positive number.')
+        if args.max_backoff < 0:
+            parser.error('--max-backoff must not be negative.')
+        if args.max_concurrent_chats <= 0:
+            parser.error('--max-concurrent-chats must be a positive number.')
+        if args.fetch_workers <= 0:
+            parser.error('--fetch-workers must be a positive number.')
+        if args.fetch_workers > 1 and not (args.async_mode or args.manifest):
+            parser.error('--fetch-workers requires --async or --manifest')
+        if args.format_workers < 0:
+            parser.error('--format-workers must not be negative.')
+        if args.format_workers > 0 and not (args.async_mode or args.manifest):
+            parser.error('--format-workers requires --async or --manifest')
+
+        # New messages are followed over the connection of a single chat
+        if args.follow and args.manifest:
+            parser.error('--follow can not be combined with --manifest')
+
+        # Media files are downloaded concurrently with fetching messages by the asyncio pipeline
+        args.media = args.media.strip()
+        if args.media_workers <= 0:
+            parser.error('--media-workers must be a positive number.')
+        if args.media and not (args.async_mode or args.manifest):
+            parser.error('--media requires --async or --manifest')
+
+        # Partitioned fetching has no single point in history to resume from
+        if args.checkpoint and args.fetch_workers > 1:
+            parser.error('--checkpoint can not be combined with --fetch-workers')
+
+        # Validate output rotation
+        rotate_size = 0
+        if args.rotate_size:
+            try:
+                rotate_size = parse_size(args.rotate_size)
+            except ValueError:
+                parser.error('--rotate-size must be a size, e.g. 512K, 64M or 1G.')
+            if rotate_size <= 0:
+                parser.error('--rotate-size must be a positive number.')
+        if args.rotate_count < 0:
+            parser.error('--rotate-count must not be negative.')
+        args.rotate_period = args.rotate_period.strip().lower()
+        if args.rotate_period and args.rotate_period not in ROTATION_PERIODS:
+            parser.error('--rotate-period must be one of: {}.'
+                         .format(', '.join(ROTATION_PERIODS)))
+        is_rotated = bool(rotate_size or args.rotate_count or args.rotate_period)
+        # A checkpoint can't roll back segments written after it
+        if is_rotated and args.checkpoint:
+            parser.error('--rotate-size, --rotate-count and --rotate-period '
+                         'can not be combined with --checkpoint')
+        if is_rotated and self.is_incremental_mode and self.last_message_id == -1:
+            parser.error('--rotate-size, --rotate-count and --rotate-period must NOT be '
+                         'specified explicitely when using --continue')
+
+        # An index points into the text as it is on disk
+        if args.index and args.compress:
+            parser.error('--index can not be combined with --compress')
+
+        # Validate memory budget
+        memory_budget = 0
+        if args.memory_budget:
+            try:
+                memory_budget = parse_size(args.memory_budget)
+            except ValueError:
+                parser.error('--memory-budget must be a size, e.g. 512K, 64M or 1G.')
+            if memory_budget <= 0:
+                parser.error('--memory-budget must be a positive number.')
+
+        # Validate compression method
+        if args.compress:
+            error = check_compression_method(args.compress)
+            if error:
+                parser.error(error)
+
         # Validate exporter name / set default
         exp_file = 'text' if not args.exp else args.exp
         if not exp_file:
             parser.error('Exporter name is invalid.')
 
         # Default output file if not specified by user
-        OUTPUT_FILE_TEMPLATE = 'telegram_{}.log'
-        if args.out != '':
-            out_file = args.out
-        elif args.chat.startswith(JOIN_CHAT_PREFIX_URL):
-            out_file = OUTPUT_FILE_TEMPLATE.format(args.chat.rsplit('/', 1)[-1])
-        else:
-            out_file = OUTPUT_FILE_TEMPLATE.format(args.chat)
+        out_file = args.out if args.out != '' else self.default_out_file(args.chat)
 
         self.chat_name = args.chat
         self.phone_num = args.phone
@@ -89,6 +191,36 @@ class ChatDumpSettings:
         self.is_verbose = args.verbose
         self.is_addbom = args.addbom
         self.is_quiet_mode = args.quiet
+        self.is_async_mode = args.async_mode
+        self.is_stream_mode = args.stream
+        self.fetch_workers = args.fetch_workers
+        self.format_workers = args.format_workers
+        self.is_prefetch_senders = args.prefetch_senders
+        self.compress = args.compress
+        self.is_checkpoint = args.checkpoint
+        self.is_follow_mode = args.follow
+        self.rotate_size = rotate_size
+        self.rotate_count = args.rotate_count
+        self.rotate_period = args.rotate_period
+        self.is_indexed = args.index
+        self.memory_budget = memory_budget
+        self.media_dir = args.media
+        self.media_workers = args.media_workers
+        self.is_profile = args.profile
+        self.stats_json_file = args.stats_json.strip()
+        self.prometheus_file = args.prometheus_textfile.strip()
+        self.max_rate = args.max_rate
+        self.max_backoff = args.max_backoff
+        self.manifest_file = args.manifest
+        self.max_concurrent_chats = args.max_concurrent_chats
+
+    @staticmethod
+    def default_out_file(chat_name):
+        """ Default output file name for a chat if not specified by user """
+        OUTPUT_FILE_TEMPLATE = 'telegram_{}.log'
+        if chat_name.startswith(JOIN_CHAT_PREFIX_URL):
+            return OUTPUT_FILE_TEMPLATE.format(chat_name.rsplit('/', 1)[-1])
+        return OUTPUT_FILE_TEMPLATE.format(chat_name)
 
     def _process_incremental_mode_option(self, args, parser):
         """ Arguments parsing related to --continue setting """
@@ -109,7 +241,15 @@ class ChatDumpSettings:
         return
 
     def _check_options_consistency(self, args, parser):
-        if self.is_incremental_mode:
+        if args.manifest:
+            # In case of Multi-chat mode
+            if self.is_incremental_mode:
+                parser.error('--continue is not allowed when using --manifest. '
+                             'Use "continue" setting of a manifest entry instead.')
+            if args.chat != "" or args.out != "":
+                parser.error('chat name and output file must NOT be specified explicitely '
+                             'when using --manifest')
+        elif self.is_incremental_mode:
             if args.out == "":
                 parser.error('To increment an existing dump file. '
                              'You have to specify it using --out or -o setting.')
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains code that compresses the resulting file on the fly """
+
+import os
+import zlib
+import lzma
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from telegram_messages_dump.exporters.sink import sink
+from telegram_messages_dump.utils import COPY_BUFFER_SIZE
+
+# Size of an independently compressed block of the resulting file
+COMPRESSION_BLOCK_SIZE = 1024 * 1024
+
+
+def _gzip_compress(data):
+    # A complete gzip member. Concatenated members make a valid gzip file.
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _xz_compress(data):
+    # A complete xz stream. Concatenated streams make a valid xz file.
+    return lzma.compress(data, format=lzma.FORMAT_XZ)
+
+
+def _zstd_compress(data):
+    # A complete zstd frame. Concatenated frames make a valid zstd file.
+    import zstandard
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+# Compression method name -> (function that compresses a block, file extension)
+COMPRESSION_METHODS = {
+    'gzip': (_gzip_compress, '.gz'),
+    'xz': (_xz_compress, '.xz'),
+    'zstd': (_zstd_compress, '.zst'),
+}
+
+
+def check_compression_method(method):
+    """ Checks if a compression method can be used.
+
+        :return None if it can, or an error message otherwise
+    """
+    if method not in COMPRESSION_METHODS:
+        return 'Unknown compression method "{}". Use one of: {}.'.format(
+            method, ', '.join(sorted(COMPRESSION_METHODS)))
+    if method == 'zstd':
+        try:
+            import zstandard  # pylint: disable=unused-import
+        except ImportError:
+            return 'zstd compression requires zstandard. Run "pip install zstandard".'
+    return None
+
+
+class ParallelCompressor:
+    """ Binary file-like object that compresses data written into it.
+        The data is split into blocks that are compressed independently in a thread pool
+        (zlib, lzma and zstd release GIL), the compressed blocks are written into the
+        underlying file in order. The result is a sequence of gzip members/xz streams/zstd
+        frames, which is a valid file for the standard tools. Same as pigz does.
+    """
+
+    def __init__(self, raw_file, method, workers_count=None):
+        """ constructor
+            :param raw_file:        Binary file object to write compressed data into
+            :param method:          Compression method name (see COMPRESSION_METHODS)
+            :param workers_count:   Number of compressing threads (Default: number of CPUs)
+        """
+        self.raw_file = raw_file
+        self._compress = COMPRESSION_METHODS[method][0]
+        workers_count = workers_count or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=workers_count)
+        # Limits the number of blocks in memory
+        self._max_pending_blocks = workers_count * 2
+        self._pending_blocks = deque()
+        self._block = bytearray()
+
+    def write(self, data):
+        """ Compresses data (bytes) """
+        self._block += data
+        if len(self._block) >= COMPRESSION_BLOCK_SIZE:
+            self._submit_block()
+        return len(data)
+
+    def flush(self):
+        """ Does nothing as a block can't be compressed until it is complete """
+        pass
+
+    def close(self):
+        """ Compresses the data left and writes all the blocks into the underlying file """
+        if self._executor is None:
+            return
+        if self._block:
+            self._submit_block()
+        while self._pending_blocks:
+            self.raw_file.write(self._pending_blocks.popleft().result())
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _submit_block(self):
+        self._pending_blocks.append(self._executor.submit(self._compress, bytes(self._block)))
+        self._block = bytearray()
+        # Write the blocks that are ready in order, wait for the oldest one if too many
+        while self._pending_blocks and (self._pending_blocks[0].done() or
+                                        len(self._pending_blocks) > self._max_pending_blocks):
+            self.raw_file.write(self._pending_blocks.popleft().result())
+
+
+class compressed_file_sink(sink):
+    """ Sink that writes lines into a compressed text file """
+
+    def __init__(self, resulting_file, compressor):
+        """ constructor
+            :param resulting_file:  UTF-8 writer on top of the compressor
+            :param compressor:      ParallelCompressor
+        """
+        self.resulting_file = resulting_file
+        self.compressor = compressor
+
+    def write_lines(self, lines):
+        write = self.compressor.write
+        for line in lines:
+            write((line + '\n').encode('utf-8'))
+
+    def append_temp_file(self, temp_file_path):
+        # Temp files are in UTF-8 already, so they are compressed as is
+        with open(temp_file_path, 'rb') as temp_file:
+            while True:
+                data = temp_file.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                self.compressor.write(data)
@@ -8,3 +8,13 @@ class DumpingError(Exception):
 class MetadataError(Exception):
     """ Metadata processing exception"""
     pass
+
+
+class ManifestError(Exception):
+    """ Manifest processing exception"""
+    pass
+
+
+class ExporterError(Exception):
+    """ Exporter loading exception"""
+    pass
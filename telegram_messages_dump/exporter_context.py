@@ -14,3 +14,7 @@ class ExporterContext:
         self.is_last_record = True
         # Is working in continue/incremental mode
         self.is_continue_mode = False
+        # SenderCache shared by all the messages of a chat (or None)
+        self.sender_cache = None
+        # Directory the media files are downloaded into (see --media), or None
+        self.media_dir = None
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains the registry of exporter plugins """
+
+import re
+import logging
+import importlib
+from telegram_messages_dump.exceptions import ExporterError
+
+
+class ExporterRegistry:
+    """ Finds exporters by name. An exporter is either
+            - a module in ./exporters subfolder with a class of the same name as the module
+              (the built-in ones and the ones dropped in by user), or
+            - a class exposed by another package via an entry point in
+              'telegram_messages_dump.exporters' group, e.g. in its setup.py:
+              entry_points={'telegram_messages_dump.exporters': ['xml = my_pkg.xml:xml']}
+        Only the exporter that is asked for is imported. Installed packages are not scanned
+        for entry points unless the name is not one of the built-in exporters.
+    """
+
+    ENTRY_POINTS_GROUP = 'telegram_messages_dump.exporters'
+
+    BUILTIN_EXPORTERS = ('text', 'jsonl', 'csv', 'parquet', 'sqlite')
+
+    EXPORTERS_PACKAGE = 'telegram_messages_dump.exporters'
+
+    # Exporter names are module names
+    _NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        # Exporter name -> function that loads its class. Found on first need.
+        self._entry_points = None
+        # Exporter name -> class, for the exporters loaded already
+        self._classes = {}
+
+    def get_names(self):
+        """ :return Sorted list of the names of the built-in and installed exporters """
+        return sorted(set(ExporterRegistry.BUILTIN_EXPORTERS) | set(self._get_entry_points()))
+
+    def load(self, name):
+        """ Creates an exporter.
+            :param name: Exporter name. E.g. 'text' or 'jsonl'
+
+            :return Exporter instance
+            :raises ExporterError: if there is no such exporter or it fails to load
+        """
+        exporter_class = self._classes.get(name)
+        if exporter_class is None:
+            exporter_class = self._classes[name] = self._load_class(name)
+        return exporter_class()
+
+    def _load_class(self, name):
+        if not ExporterRegistry._NAME_RE.match(name):
+            raise ExporterError('Exporter name "{}" is invalid. Available exporters: {}.'
+                                .format(name, ', '.join(self.get_names())))
+
+        if name not in ExporterRegistry.BUILTIN_EXPORTERS:
+            load_entry_point = self._get_entry_points().get(name)
+            if load_entry_point is not None:
+                self.logger.debug('Load exporter "%s" from an entry point.', name)
+                try:
+                    return load_entry_point()
+                except Exception as ex:  # pylint: disable=broad-except
+                    raise ExporterError('Failed to load exporter "{}" of an installed package. {}'
+                                        .format(name, ex)) from ex
+
+        # By convention exporters are located in ./exporters subfolder
+        # COMMENT: Don't check file existance. It won't play well with pyinstaller bins
+        module_name = ExporterRegistry.EXPORTERS_PACKAGE + '.' + name
+        try:
+            module = importlib.import_module(module_name)
+        except ModuleNotFoundError as ex:
+            if ex.name != module_name:
+                # The exporter exists, but something it depends on doesn't
+                raise ExporterError('Failed to load exporter "./exporters/{}.py". {}'
+                                    .format(name, ex)) from ex
+            raise ExporterError('Unknown exporter "{}". Available exporters: {}.'
+                                .format(name, ', '.join(self.get_names()))) from ex
+
+        try:
+            return getattr(module, name)
+        except AttributeError as ex:
+            raise ExporterError('Failed to load class "{}" out of "./exporters/{}.py".'
+                                .format(name, name)) from ex
+
+    def _get_entry_points(self):
+        """ :return dict of exporter name -> function that loads its class,
+                    for the exporters of installed packages
+        """
+        if self._entry_points is None:
+            self._entry_points = {}
+            try:
+                entry_points = _iter_entry_points(ExporterRegistry.ENTRY_POINTS_GROUP)
+                for entry_point in entry_points:
+                    self._entry_points.setdefault(entry_point.name, entry_point.load)
+            except Exception as ex:  # pylint: disable=broad-except
+                self.logger.warning('Unable to look for exporters of installed packages. %s', ex)
+        return self._entry_points
+
+
+def _iter_entry_points(group):
+    """ :return Entry points of installed packages in a group """
+    try:
+        # Python 3.8+
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from pkg_resources import iter_entry_points
+        except ImportError:
+            return []
+        return list(iter_entry_points(group))
+
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, 'select'):
+        # Python 3.10+
+        return list(all_entry_points.select(group=group))
+    return list(all_entry_points.get(group, ()))
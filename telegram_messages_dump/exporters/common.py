@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=missing-docstring
 
+from collections import namedtuple
+
 # pylint: disable=too-few-public-methods
 class common(object):
     """ json exporter plugin.
@@ -14,15 +16,82 @@ class common(object):
         pass
 
     @staticmethod
-    def extract_message_data(msg):
+    def extract_message_data(msg, sender_cache=None):
         """ Extracts user name from 'sender', message caption and message content from msg.
-            :param msg: Raw message object.
+            :param msg: MessageRecord or raw message object.
+            :param sender_cache: Optional SenderCache to look the sender up by 'from_id'.
 
             :return
                 (...) tuple of message attributes
         """
+        record = common.to_record(msg, sender_cache)
+
+        re_id_str = ''
+        if record.reply_to_msg_id is not None:
+            re_id_str = str(record.reply_to_msg_id)
+
+        is_contains_media = record.media_type is not None
+        media_content = None
+        if is_contains_media:
+            # The media may or may not have a caption
+            media_content = '<{}> {}'.format(record.media_type, record.media_caption)
+
+        return record.sender_name, record.media_caption, record.content, re_id_str, \
+            record.is_sent_by_bot, is_contains_media, media_content
+
+    @staticmethod
+    def to_record(msg, sender_cache=None):
+        """ :return MessageRecord of a message (the very same object if it is a record already) """
+        if isinstance(msg, MessageRecord):
+            return msg
+        return MessageRecord.from_message(msg, sender_cache)
+
+    @staticmethod
+    def get_message_sender(msg, sender_cache=None):
+        """ Resolves the sender of a message. The sender entity of the message is preferred
+            as it is up to date, the sender cache is only looked up if there is none.
+            :param msg: Raw message object.
+            :param sender_cache: Optional SenderCache to look the sender up by 'from_id'.
+
+            :return
+                (name, is_sent_by_bot) tuple
+        """
         sender = msg.sender
+        from_id = getattr(msg, 'from_id', None)
+        if sender_cache is None or from_id is None:
+            return common.get_sender_data(sender)
+
+        if not sender:
+            cached_sender = sender_cache.get(from_id)
+            if cached_sender is not None:
+                return cached_sender
+            return common.get_sender_data(sender)
 
+        name, is_sent_by_bot = common.get_sender_data(sender)
+        # The cache may hold the name of a previous run (see '.senders' file),
+        # it is refreshed if the sender has been renamed since then
+        if sender_cache.get(from_id) != (name, is_sent_by_bot):
+            sender_cache.put(from_id, name, is_sent_by_bot)
+        return name, is_sent_by_bot
+
+    @staticmethod
+    def get_message_content(msg):
+        """ :return text content of a message """
+        if hasattr(msg, 'message'):
+            return msg.message
+        if hasattr(msg, 'action'):
+            return str(msg.action)
+        # Unknown message, simply print its class name
+        return type(msg).__name__
+
+    @staticmethod
+    def get_sender_data(sender):
+        """ Derives display name of a sender.
+            :param sender: User/Chat/Channel object or None.
+
+            :return
+                (name, is_sent_by_bot) tuple
+        """
         # Get the name of the sender if any
         is_sent_by_bot = None
         if sender:
@@ -37,28 +106,45 @@ class common(object):
             is_sent_by_bot = getattr(sender, 'bot', None)
         else:
             name = '???'
+        return name, is_sent_by_bot
 
-        caption = None
-        if hasattr(msg, 'message'):
-            content = msg.message
-        elif hasattr(msg, 'action'):
-            content = str(msg.action)
-        else:
-            # Unknown message, simply print its class name
-            content = type(msg).__name__
 
-        re_id_str = ''
-        if hasattr(msg, 'reply_to_msg_id') and msg.reply_to_msg_id is not None:
-            re_id_str = str(msg.reply_to_msg_id)
+_MessageRecordBase = namedtuple('_MessageRecordBase', [
+    'id', 'date', 'from_id', 'reply_to_msg_id',
+    'sender_name', 'is_sent_by_bot', 'content', 'media_type', 'media_caption', 'media_path'])
 
-        is_contains_media = False
-        media_content = None
-        # Format the message content
-        if getattr(msg, 'media', None):
-            # The media may or may not have a caption
-            is_contains_media = True
-            caption = getattr(msg.media, 'caption', '')
-            media_content = '<{}> {}'.format(
-                type(msg.media).__name__, caption)
 
-        return name, caption, content, re_id_str, is_sent_by_bot, is_contains_media, media_content
+class MessageRecord(_MessageRecordBase):
+    """ Immutable snapshot of a message with exactly the data exporters use.
+        It holds no references to the client, sender entities or media objects,
+        so it is small to keep in memory and cheap to send to another process.
+        Fields:
+            id, date, from_id, reply_to_msg_id  - same as the message ones
+            sender_name, is_sent_by_bot         - resolved sender
+            content                             - message text (or action/class name)
+            media_type, media_caption           - class name of the media and its caption
+                                                  (None if there is no media)
+            media_path                          - path of the downloaded media file
+                                                  (None unless downloaded, see --media)
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_message(cls, msg, sender_cache=None):
+        """ Extracts a record from a raw message.
+            :param msg: Raw message object :class:`telethon.tl.types.Message` and derivatives.
+            :param sender_cache: Optional SenderCache to look the sender up by 'from_id'.
+        """
+        sender_name, is_sent_by_bot = common.get_message_sender(msg, sender_cache)
+        media = getattr(msg, 'media', None)
+        return cls(msg.id,
+                   msg.date,
+                   getattr(msg, 'from_id', None),
+                   getattr(msg, 'reply_to_msg_id', None),
+                   sender_name,
+                   is_sent_by_bot,
+                   common.get_message_content(msg),
+                   type(media).__name__ if media else None,
+                   getattr(media, 'caption', '') if media else None,
+                   None)
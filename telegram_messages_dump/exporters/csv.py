@@ -3,6 +3,7 @@
 # pylint: disable=missing-docstring
 
 import re
+from calendar import timegm
 from .common import common
 
 class csv(object):
@@ -25,6 +26,11 @@ class csv(object):
         }
         for i in range(0x20):
             self.ESCAPE_DICT.setdefault(chr(i), '\\u{0:04x}'.format(i))
+        # Same escaping as a str.translate() table (for batches)
+        self.ESCAPE_TABLE = {ord(c): r for c, r in self.ESCAPE_DICT.items() if self.ESCAPE.match(c)}
+        # '5000,2020-01-31T18:42:05+00:00,...'
+        self.KEY_RE = re.compile(r'^\ufeff?(\d+),(\d+)-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)'
+                                 r'(?:\.\d+)?(?:([+-])(\d\d):(\d\d))?,')
 
     def format(self, msg, exporter_context):
         """ Formatter method. Takes raw msg and converts it to a *one-line* string.
@@ -33,36 +39,104 @@ class csv(object):
 
             :returns: *one-line* string containing one message data.
         """
-        # pylint: disable=unused-argument
-        name, _, content, re_id, _, _, _ = common.extract_message_data(msg)
+        sender_cache = exporter_context.sender_cache
+        name, _, content, re_id, _, _, _ = common.extract_message_data(msg, sender_cache)
         # Format a message log record
         # msg_dump_str = '[{}-{:02d}-{:02d} {:02d}:{:02d}] ID={} {}{}: {}'.format(
         #     msg.date.year, msg.date.month, msg.date.day,
         #     msg.date.hour, msg.date.minute, msg.id, "RE_ID=%s " % re_id if re_id else "",
         #     name, self._py_encode_basestring(content))
 
-        name, isNameModified = self._py_encode_basestring(name)
-
-        # Check if name contains ',' or there were other special chars.
-        # If it does surround the name with quotes.
-        if name and (name.find(",") != -1 or isNameModified):
-            name = '"' + name + '"'
+        # Escaping of the same sender's name is done once
+        escaped_name = sender_cache.get_exporter_form(msg.from_id, 'csv') \
+            if sender_cache is not None else None
+        if escaped_name is None:
+            escaped_name = self._escape_name(name)
+            if sender_cache is not None:
+                sender_cache.set_exporter_form(msg.from_id, 'csv', escaped_name)
+        name = escaped_name
 
-        msg_dump_str = ",".join([str(msg.id),
-                                 msg.date.isoformat(),
-                                 name,
-                                 str(re_id),
-                                 '"' + str(self._py_encode_basestring(content)[0]) + '"'])
+        columns = [str(msg.id),
+                   msg.date.isoformat(),
+                   name,
+                   str(re_id),
+                   '"' + str(self._py_encode_basestring(content)[0]) + '"']
+        if exporter_context.media_dir is not None:
+            columns.append(self._escape_name(getattr(msg, 'media_path', None) or ''))
+        msg_dump_str = ",".join(columns)
         return msg_dump_str
 
+    def format_batch(self, messages, exporter_context):
+        """ Batch formatter method. Same as 'format' but for a list of messages.
+            :param messages: A list of MessageRecord (or raw message) objects.
+
+            :returns: A list of *one-line* strings in the same order as messages.
+        """
+        sender_cache = exporter_context.sender_cache
+        to_record = common.to_record
+        escape_table = self.ESCAPE_TABLE
+        is_media_mode = exporter_context.media_dir is not None
+
+        result = []
+        append = result.append
+        for msg in messages:
+            msg = to_record(msg, sender_cache)
+            from_id = msg.from_id
+            escaped_name = sender_cache.get_exporter_form(from_id, 'csv') \
+                if sender_cache is not None else None
+            if escaped_name is None:
+                escaped_name = self._escape_name(msg.sender_name)
+                if sender_cache is not None:
+                    sender_cache.set_exporter_form(from_id, 'csv', escaped_name)
+
+            content = msg.content
+            if content:
+                content = content.translate(escape_table)
+            re_id = msg.reply_to_msg_id
+            line = '%d,%s,%s,%s,"%s"' % (
+                msg.id, msg.date.isoformat(), escaped_name,
+                re_id if re_id is not None else '', content)
+            if is_media_mode:
+                line += ',' + self._escape_name(msg.media_path or '')
+            append(line)
+        return result
+
     def begin_final_file(self, resulting_file, exporter_context):
         """ Hook executes at the beginning of writing a resulting file.
             (After BOM is written in case of --addbom)
         """
         if not exporter_context.is_continue_mode:
-            header_str = ",".join(["Message Id", "Time", "Sender Name", "Reply Id", "Message"])
+            columns = ["Message Id", "Time", "Sender Name", "Reply Id", "Message"]
+            if exporter_context.media_dir is not None:
+                columns.append("Media")
+            header_str = ",".join(columns)
             print(header_str, file=resulting_file)
 
+    def parse_message_key(self, line):
+        """ Reads a message back out of a line of a resulting file (see --index).
+
+            :returns: (message id, unix time) or None if the line is not a message (e.g. header).
+        """
+        match = self.KEY_RE.match(line)
+        if match is None:
+            return None
+        msg_id, year, month, day, hour, minute, second, sign, tz_hour, tz_minute = match.groups()
+        unix_time = timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+        if sign:
+            tz_offset = int(tz_hour) * 3600 + int(tz_minute) * 60
+            unix_time -= tz_offset if sign == '+' else -tz_offset
+        return int(msg_id), unix_time
+
+    def _escape_name(self, name):
+        """ Escapes sender's name to fit into a csv column """
+        name, isNameModified = self._py_encode_basestring(name)
+
+        # Check if name contains ',' or there were other special chars.
+        # If it does surround the name with quotes.
+        if name and (name.find(",") != -1 or isNameModified):
+            name = '"' + name + '"'
+        return name
+
     # This code is inspired by Python's json encoder's code
     def _py_encode_basestring(self, s):
         """Return a JSON representation of a Python string"""
@@ -2,9 +2,10 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=missing-docstring
 
-import json
-from datetime import date, datetime
+import re
+from calendar import timegm
 from .common import common
+from .jsonl_serializer import jsonl_serializer, encode_value, encode_date
 
 class jsonl(object):
     """ jsonl exporter plugin.
@@ -18,7 +19,15 @@ class jsonl(object):
 
     def __init__(self):
         """ constructor """
-        pass
+        keys = ['message_id', 'from_id', 'reply_id', 'author', 'sent_by_bot',
+                'date', 'content', 'contains_media', 'media_content']
+        self.serializer = jsonl_serializer(keys)
+        # Messages refer to the downloaded media files (see --media)
+        self.media_serializer = jsonl_serializer(keys + ['media_path'])
+        # 'message_id' goes first and 'date' goes before the values that are free text
+        self.KEY_RE = re.compile(r'^\ufeff?\{"message_id": (\d+), .*?"date": '
+                                 r'"(\d+)-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)'
+                                 r'(?:\.\d+)?(?:([+-])(\d\d):(\d\d))?"')
 
     # pylint: disable=unused-argument
     def format(self, msg, exporter_context):
@@ -28,23 +37,42 @@ class jsonl(object):
 
             :returns: *one-line* string containing one message data.
         """
-        # pylint: disable=line-too-long
-        name, _, content, re_id, is_sent_by_bot, is_contains_media, media_content = common.extract_message_data(msg)
-
-        msgDictionary = {
-            'message_id': msg.id,
-            'from_id': msg.from_id,
-            'reply_id': re_id,
-            'author': name,
-            'sent_by_bot': is_sent_by_bot,
-            'date': msg.date,
-            'content': content,
-            'contains_media': is_contains_media,
-            'media_content': media_content
-        }
-        msg_dump_str = json.dumps(
-            msgDictionary, default=self._json_serial, ensure_ascii=False)
-        return msg_dump_str
+        return self.format_batch([msg], exporter_context)[0]
+
+    def format_batch(self, messages, exporter_context):
+        """ Batch formatter method. Same as 'format' but for a list of messages.
+            :param messages: A list of MessageRecord (or raw message) objects.
+
+            :returns: A list of *one-line* strings in the same order as messages.
+        """
+        sender_cache = exporter_context.sender_cache
+        to_record = common.to_record
+        is_media_mode = exporter_context.media_dir is not None
+        serialize = self.media_serializer.serialize if is_media_mode \
+            else self.serializer.serialize
+
+        result = []
+        append = result.append
+        for msg in messages:
+            msg = to_record(msg, sender_cache)
+            re_id = msg.reply_to_msg_id
+            media_type = msg.media_type
+            values = (
+                encode_value(msg.id),
+                encode_value(msg.from_id),
+                encode_value(str(re_id)) if re_id is not None else '""',
+                encode_value(msg.sender_name),
+                encode_value(msg.is_sent_by_bot),
+                encode_date(msg.date),
+                encode_value(msg.content),
+                'false' if media_type is None else 'true',
+                'null' if media_type is None else
+                encode_value('<{}> {}'.format(media_type, msg.media_caption))
+            )
+            if is_media_mode:
+                values += (encode_value(msg.media_path),)
+            append(serialize(values))
+        return result
 
     def begin_final_file(self, resulting_file, exporter_context):
         """ Hook executes at the beginning of writing a resulting file.
@@ -52,10 +80,17 @@ class jsonl(object):
         """
         pass
 
-    def _json_serial(self, obj):
-        """JSON serializer for objects not serializable by default json code
-           https://stackoverflow.com/questions/11875770/how-to-overcome-datetime-datetime-not-json-serializable
+    def parse_message_key(self, line):
+        """ Reads a message back out of a line of a resulting file (see --index).
+
+            :returns: (message id, unix time) or None if the line is not a message.
         """
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        raise TypeError("Type %s not serializable" % type(obj))
+        match = self.KEY_RE.match(line)
+        if match is None:
+            return None
+        msg_id, year, month, day, hour, minute, second, sign, tz_hour, tz_minute = match.groups()
+        unix_time = timegm((int(year), int(month), int(day), int(hour), int(minute), int(second)))
+        if sign:
+            tz_offset = int(tz_hour) * 3600 + int(tz_minute) * 60
+            unix_time -= tz_offset if sign == '+' else -tz_offset
+        return int(msg_id), unix_time
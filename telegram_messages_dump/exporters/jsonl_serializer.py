@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+import json
+import logging
+from datetime import date, datetime
+from json.encoder import encode_basestring, c_encode_basestring
+
+# Strings the backends are checked against stdlib json with
+_PROBE_STRINGS = [
+    '',
+    'plain text',
+    '"quoted" \\back\\slashed\\ /slashed/',
+    ''.join(chr(i) for i in range(0x80)),
+    '\x7f\x80\x9f\xa0\xad\xff',
+    '\u2028\u2029\ufeff\ufffe\uffff',
+    'Привет, мир! 你好 مرحبا 😀👍🏽',
+    '\ud800 \udfff',
+]
+
+
+def _json_serial(obj):
+    """JSON serializer for objects not serializable by default json code
+       https://stackoverflow.com/questions/11875770 (How to overcome "datetime.datetime
+       not JSON serializable"?)
+    """
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError("Type %s not serializable" % type(obj))
+
+
+_stdlib_encoder = json.JSONEncoder(default=_json_serial, ensure_ascii=False)
+
+
+def _make_stdlib_c_encode_str():
+    if c_encode_basestring is None:
+        raise ImportError('json C accelerator is not available')
+    return c_encode_basestring
+
+
+def _make_orjson_encode_str():
+    import orjson
+    dumps = orjson.dumps
+
+    def encode_str(s):
+        try:
+            return dumps(s).decode('utf-8')
+        except TypeError:
+            # orjson rejects strings that are not valid UTF-8 (e.g. lone surrogates)
+            return encode_basestring(s)
+    return encode_str
+
+
+def _make_ujson_encode_str():
+    import ujson
+    dumps = ujson.dumps
+
+    def encode_str(s):
+        try:
+            return dumps(s, ensure_ascii=False, escape_forward_slashes=False)
+        except (TypeError, ValueError, OverflowError):
+            return encode_basestring(s)
+    return encode_str
+
+
+def _make_stdlib_encode_str():
+    return encode_basestring
+
+
+# Available string encoders in the order of preference.
+# Values are encoded one by one, mostly short strings, so the call overhead matters more than
+# the encoding speed. Thus stdlib's C encoder goes first while orjson and ujson
+# are faster than the pure Python one (e.g. PyPy or no _json module).
+_BACKENDS = [
+    ('json (C)', _make_stdlib_c_encode_str),
+    ('orjson', _make_orjson_encode_str),
+    ('ujson', _make_ujson_encode_str),
+    ('json', _make_stdlib_encode_str),
+]
+
+
+def _select_backend():
+    """ Picks the first installed backend whose output is identical to stdlib json's one.
+        The probe is a cheap guard against a backend that escapes differently at runtime;
+        tests/test_jsonl_serializer.py checks every backend on the edge cases.
+    """
+    logger = logging.getLogger(__name__)
+    for name, make_encode_str in _BACKENDS:
+        try:
+            encode_str = make_encode_str()
+            if all(encode_str(s) == json.dumps(s, ensure_ascii=False) for s in _PROBE_STRINGS):
+                logger.debug('JSON string encoder: %s', name)
+                return name, encode_str
+            logger.debug('JSON string encoder "%s" differs from stdlib json, skipped.', name)
+        except Exception:  # pylint: disable=broad-except
+            pass
+    return 'json', encode_basestring
+
+
+BACKEND_NAME, encode_str = _select_backend()
+
+
+def _encode_none(_):
+    return 'null'
+
+
+def _encode_bool(value):
+    return 'true' if value else 'false'
+
+
+# Encoders of the plain JSON values by exact type
+_VALUE_ENCODERS = {
+    str: encode_str,
+    int: int.__repr__,
+    bool: _encode_bool,
+    type(None): _encode_none,
+}
+
+
+def encode_value(value):
+    """ Encodes a value exactly like json.dumps(value, ensure_ascii=False) does """
+    encode = _VALUE_ENCODERS.get(type(value))
+    if encode is not None:
+        return encode(value)
+    # Anything else (floats, containers, subclasses) goes the usual way
+    return _stdlib_encoder.encode(value)
+
+
+def encode_date(value):
+    """ Encodes a date as an ISO 8601 JSON string """
+    if isinstance(value, (datetime, date)):
+        # isoformat() has nothing to escape
+        return '"' + value.isoformat() + '"'
+    return encode_value(value)
+
+
+class jsonl_serializer(object):
+    """ Serializes records with a fixed set of keys into JSON lines.
+        The line is assembled from a precompiled template and individually encoded values,
+        which is byte-identical to json.dumps(dict(zip(keys, values)), ensure_ascii=False).
+        Strings are encoded with the first backend of '_BACKENDS' that is available and
+        produces exactly the same output as stdlib json does (see BACKEND_NAME): stdlib's
+        C encoder, as it is the fastest one for short strings, then orjson, ujson and
+        the pure Python stdlib encoder. So orjson and ujson are only used where stdlib
+        json has no C encoder (e.g. PyPy).
+    """
+
+    def __init__(self, keys):
+        """ constructor
+            :param keys: Keys of the JSON objects (in order)
+        """
+        self.keys = tuple(keys)
+        self.template = '{' + ', '.join(
+            encode_basestring(key).replace('%', '%%') + ': %s' for key in self.keys) + '}'
+
+    def serialize(self, encoded_values):
+        """ :param encoded_values: A tuple of JSON encoded values, one per key
+
+            :return one-line JSON object
+        """
+        return self.template % encoded_values
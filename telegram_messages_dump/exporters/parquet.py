@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+import os
+import re
+import json
+import calendar
+from .common import common
+from .sink import sink
+from .jsonl_serializer import encode_value
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError as ex:
+    raise ModuleNotFoundError(
+        'parquet exporter requires pyarrow. Run "pip install pyarrow".') from ex
+
+
+class parquet(object):
+    """ parquet exporter plugin.
+        Writes typed columns into Parquet files (requires pyarrow).
+        The output is a directory of part files, one per run, each split into row groups:
+            <out>/part-00000.parquet
+            <out>/part-00001.parquet  <- written by --continue
+        which is read as one dataset, e.g. pandas.read_parquet('<out>').
+
+        By convention it has to be called exactly the same as its file name.
+        (Apart from .py extention)
+    """
+
+    # Max number of rows in a row group
+    ROW_GROUP_SIZE = 100000
+
+    SCHEMA = pa.schema([
+        ('message_id', pa.int64()),
+        ('date', pa.timestamp('s', tz='UTC')),
+        ('from_id', pa.int64()),
+        ('reply_id', pa.int64()),
+        ('author', pa.dictionary(pa.int32(), pa.string())),
+        ('content', pa.string()),
+        ('media_type', pa.dictionary(pa.int32(), pa.string())),
+        ('media_caption', pa.string()),
+        ('media_path', pa.string()),
+    ])
+
+    def __init__(self):
+        """ constructor """
+        pass
+
+    def format(self, msg, exporter_context):
+        """ Formatter method. Takes raw msg and converts it to a *one-line* string.
+            The string is a JSON array of column values that is turned into a row by the sink.
+
+            :returns: *one-line* string containing one message data.
+        """
+        return self.format_batch([msg], exporter_context)[0]
+
+    def format_batch(self, messages, exporter_context):
+        """ Batch formatter method. Same as 'format' but for a list of messages.
+            :param messages: A list of MessageRecord (or raw message) objects.
+
+            :returns: A list of *one-line* strings in the same order as messages.
+        """
+        sender_cache = exporter_context.sender_cache
+        to_record = common.to_record
+        timegm = calendar.timegm
+
+        result = []
+        append = result.append
+        for msg in messages:
+            msg = to_record(msg, sender_cache)
+            date = msg.date
+            append('[' + ', '.join((
+                encode_value(msg.id),
+                encode_value(timegm(date.utctimetuple()) if date else None),
+                encode_value(msg.from_id),
+                encode_value(msg.reply_to_msg_id),
+                encode_value(msg.sender_name),
+                encode_value(msg.content),
+                encode_value(msg.media_type),
+                encode_value(msg.media_caption),
+                encode_value(msg.media_path))) + ']')
+        return result
+
+    def begin_final_file(self, resulting_file, exporter_context):
+        """ Not used as the exporter writes its output on its own (see 'open_sink') """
+        pass
+
+    def open_sink(self, out_file_path, exporter_context):
+        """ Opens the output for writing.
+            :param out_file_path: Path to the output directory
+
+            :return parquet_sink object
+        """
+        return parquet_sink(out_file_path, exporter_context.is_continue_mode,
+                            parquet.SCHEMA, parquet.ROW_GROUP_SIZE)
+
+
+class parquet_sink(sink):
+    """ Collects rows into columns and writes them into a new part file row group by row group """
+
+    PART_FILE_NAME_RE = re.compile(r'^part-(\d+)\.parquet$')
+
+    def __init__(self, dir_path, is_continue_mode, schema, row_group_size):
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self._rows = []
+        self._writer = None
+
+        if not is_continue_mode:
+            self._clear_output(dir_path)
+        os.makedirs(dir_path, exist_ok=True)
+
+        part_indexes = [int(m.group(1)) for m in map(parquet_sink.PART_FILE_NAME_RE.match,
+                                                    os.listdir(dir_path)) if m]
+        self.part_file_path = os.path.join(
+            dir_path, 'part-{:05d}.parquet'.format(max(part_indexes, default=-1) + 1))
+
+    def write_lines(self, lines):
+        loads = json.loads
+        rows = self._rows
+        for line in lines:
+            rows.append(loads(line))
+            if len(rows) >= self.row_group_size:
+                self._write_row_group()
+                rows = self._rows
+
+    def close(self):
+        if self._rows:
+            self._write_row_group()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _write_row_group(self):
+        """ Turns collected rows into columns and writes them as a row group """
+        columns = list(zip(*self._rows))
+        arrays = []
+        for field, values in zip(self.schema, columns):
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=field.type.value_type).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+
+        # The file is created on the first row group, so there are no empty part files
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(
+                self.part_file_path, self.schema,
+                use_dictionary=[f.name for f in self.schema if pa.types.is_dictionary(f.type)])
+        self._writer.write_table(table, row_group_size=len(self._rows))
+        self._rows = []
+
+    @staticmethod
+    def _clear_output(dir_path):
+        """ Removes the output of the previous dumps """
+        if os.path.isfile(dir_path):
+            os.remove(dir_path)
+        elif os.path.isdir(dir_path):
+            for file_name in os.listdir(dir_path):
+                if parquet_sink.PART_FILE_NAME_RE.match(file_name):
+                    os.remove(os.path.join(dir_path, file_name))
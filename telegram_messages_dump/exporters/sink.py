@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+import os
+from telegram_messages_dump.utils import append_file
+
+
+class sink(object):
+    """ Base class of the outputs formatted messages are written into.
+        Lines are written in ascending order (oldest message first).
+
+        An exporter that can't write its output as a text file (e.g. a binary format
+        or a database) implements 'open_sink(out_file_path, exporter_context)'
+        that returns an object derived from this class.
+        Such exporter still formats messages into *one-line* strings, the lines are
+        kept in temp files as usual and passed to its sink in the end.
+    """
+
+    # Max number of lines read from a temp file at once
+    LINES_PER_WRITE = 10000
+
+    def write_lines(self, lines):
+        """ Writes formatted messages.
+            :param lines: An iterable of *one-line* strings (oldest first)
+        """
+        raise NotImplementedError
+
+    def write_keyed_lines(self, lines, keys):
+        """ Writes formatted messages along with their keys. Only outputs that have to know
+            which message a line is of (e.g. a rotated one) make use of the keys.
+            :param lines: An iterable of *one-line* strings (oldest first)
+            :param keys:  An iterable of (message id, unix time) of the lines, or None
+        """
+        self.write_lines(lines)
+
+    def append_temp_file(self, temp_file_path):
+        """ Writes formatted messages from a temp file (one per line, oldest first) """
+        # NOTE: io (unlike codecs readers) doesn't split lines on U+2028 and alike
+        with open(temp_file_path, 'r', encoding='utf-8') as temp_file:
+            lines = []
+            for line in temp_file:
+                lines.append(line[:-1] if line.endswith('\n') else line)
+                if len(lines) >= sink.LINES_PER_WRITE:
+                    self.write_lines(lines)
+                    lines = []
+            if lines:
+                self.write_lines(lines)
+
+    def sync(self):
+        """ Makes the lines written so far durable (see --checkpoint).
+
+            :return size of the output in bytes, or None if the output can't be
+                    truncated back to it to resume an interrupted dump
+        """
+        return None
+
+    def close(self):
+        """ Finalizes the output """
+        pass
+
+
+class text_file_sink(sink):
+    """ Sink that writes lines into a text file (the default one) """
+
+    def __init__(self, resulting_file):
+        """ constructor
+            :param resulting_file: UTF-8 text file opened with codecs.open
+        """
+        self.resulting_file = resulting_file
+
+    def write_lines(self, lines):
+        for line in lines:
+            print(line, file=self.resulting_file)
+
+    def append_temp_file(self, temp_file_path):
+        # Temp files are in UTF-8 already, so they are appended byte by byte
+        # to the binary stream underlying the resulting file
+        self.resulting_file.flush()
+        append_file(temp_file_path, self.resulting_file.stream)
+
+    def sync(self):
+        self.resulting_file.flush()
+        os.fsync(self.resulting_file.stream.fileno())
+        return self.resulting_file.stream.tell()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-docstring
+
+import os
+import json
+import sqlite3
+import calendar
+from .common import common
+from .sink import sink
+from .jsonl_serializer import encode_value
+
+
+class sqlite(object):
+    """ sqlite exporter plugin.
+        Writes messages into an SQLite database with the following tables:
+            messages(message_id, date, from_id, reply_id, content, author)
+            senders(from_id, name, is_bot)
+            media(message_id, type, caption, path)
+            meta(key, value)
+        'date' is a unix timestamp. A dump overwrites the database, while --continue
+        upserts rows by their keys, so it never duplicates messages.
+        'author' is the resolved sender name. Channel posts have no 'from_id',
+        so it is the only place their author is kept in.
+        'path' is the downloaded media file (see --media) or NULL.
+
+        By convention it has to be called exactly the same as its file name.
+        (Apart from .py extention)
+    """
+
+    def __init__(self):
+        """ constructor """
+        pass
+
+    def format(self, msg, exporter_context):
+        """ Formatter method. Takes raw msg and converts it to a *one-line* string.
+            The string is a JSON array of column values that is turned into rows by the sink.
+
+            :returns: *one-line* string containing one message data.
+        """
+        return self.format_batch([msg], exporter_context)[0]
+
+    def format_batch(self, messages, exporter_context):
+        """ Batch formatter method. Same as 'format' but for a list of messages.
+            :param messages: A list of MessageRecord (or raw message) objects.
+
+            :returns: A list of *one-line* strings in the same order as messages.
+        """
+        sender_cache = exporter_context.sender_cache
+        to_record = common.to_record
+        timegm = calendar.timegm
+
+        result = []
+        append = result.append
+        for msg in messages:
+            msg = to_record(msg, sender_cache)
+            date = msg.date
+            append('[' + ', '.join((
+                encode_value(msg.id),
+                encode_value(timegm(date.utctimetuple()) if date else None),
+                encode_value(msg.from_id),
+                encode_value(msg.reply_to_msg_id),
+                encode_value(msg.content),
+                encode_value(msg.sender_name),
+                encode_value(msg.is_sent_by_bot),
+                encode_value(msg.media_type),
+                encode_value(msg.media_caption),
+                encode_value(msg.media_path))) + ']')
+        return result
+
+    def begin_final_file(self, resulting_file, exporter_context):
+        """ Not used as the exporter writes its output on its own (see 'open_sink') """
+        pass
+
+    def open_sink(self, out_file_path, exporter_context):
+        """ Opens the output for writing.
+            :param out_file_path: Path to the database file
+
+            :return sqlite_sink object
+        """
+        return sqlite_sink(out_file_path, exporter_context.is_continue_mode)
+
+
+class sqlite_sink(sink):
+    """ Upserts rows into the database in large transactions.
+        Indexes are created after the rows are loaded.
+    """
+
+    # Max number of messages in one transaction
+    TRANSACTION_SIZE = 100000
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS messages ('
+        ' message_id INTEGER PRIMARY KEY, date INTEGER, from_id INTEGER,'
+        ' reply_id INTEGER, content TEXT, author TEXT)',
+        'CREATE TABLE IF NOT EXISTS senders ('
+        ' from_id INTEGER PRIMARY KEY, name TEXT, is_bot INTEGER)',
+        'CREATE TABLE IF NOT EXISTS media ('
+        ' message_id INTEGER PRIMARY KEY, type TEXT, caption TEXT, path TEXT)',
+        'CREATE TABLE IF NOT EXISTS meta ('
+        ' key TEXT PRIMARY KEY, value)',
+    ]
+
+    INDEXES = [
+        'CREATE INDEX IF NOT EXISTS messages_date ON messages (date)',
+        'CREATE INDEX IF NOT EXISTS messages_from_id ON messages (from_id)',
+        'CREATE INDEX IF NOT EXISTS messages_reply_id ON messages (reply_id)',
+    ]
+
+    # Files SQLite keeps next to the database
+    AUX_FILE_SUFFIXES = ['-wal', '-shm', '-journal']
+
+    def __init__(self, db_file_path, is_continue_mode=True):
+        if not is_continue_mode:
+            sqlite_sink._clear_output(db_file_path)
+        self._conn = sqlite3.connect(db_file_path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in sqlite_sink.SCHEMA:
+            self._conn.execute(statement)
+        # Databases written before media files were downloaded have no 'path' column
+        media_columns = [row[1] for row in self._conn.execute('PRAGMA table_info(media)')]
+        if 'path' not in media_columns:
+            self._conn.execute('ALTER TABLE media ADD COLUMN path TEXT')
+        # Databases written before authors were kept in messages have no 'author' column
+        message_columns = [row[1] for row in self._conn.execute('PRAGMA table_info(messages)')]
+        if 'author' not in message_columns:
+            self._conn.execute('ALTER TABLE messages ADD COLUMN author TEXT')
+        self._conn.commit()
+        self._uncommitted_count = 0
+
+    def write_lines(self, lines):
+        messages = []
+        senders = {}
+        media = []
+        for line in lines:
+            message_id, date, from_id, reply_id, content, \
+                name, is_bot, media_type, media_caption, media_path = json.loads(line)
+            messages.append((message_id, date, from_id, reply_id, content, name))
+            if from_id is not None:
+                senders[from_id] = (from_id, name, is_bot)
+            if media_type is not None:
+                media.append((message_id, media_type, media_caption, media_path))
+
+        conn = self._conn
+        conn.executemany('INSERT OR REPLACE INTO messages'
+                         ' (message_id, date, from_id, reply_id, content, author)'
+                         ' VALUES (?, ?, ?, ?, ?, ?)', messages)
+        conn.executemany('INSERT OR REPLACE INTO senders VALUES (?, ?, ?)', senders.values())
+        # An upserted message may have had its media removed since the previous dump
+        conn.executemany('DELETE FROM media WHERE message_id = ?',
+                         [(message[0],) for message in messages])
+        conn.executemany('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?)', media)
+
+        self._uncommitted_count += len(messages)
+        if self._uncommitted_count >= sqlite_sink.TRANSACTION_SIZE:
+            conn.commit()
+            self._uncommitted_count = 0
+
+    def close(self):
+        conn = self._conn
+        for statement in sqlite_sink.INDEXES:
+            conn.execute(statement)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES"
+                     " ('latest_message_id', (SELECT MAX(message_id) FROM messages))")
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def _clear_output(db_file_path):
+        """ Removes the database of the previous dumps """
+        for file_path in [db_file_path] + [db_file_path + suffix
+                                           for suffix in sqlite_sink.AUX_FILE_SUFFIXES]:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
@@ -3,6 +3,7 @@
 # pylint: disable=missing-docstring
 
 import re
+from calendar import timegm
 from .common import common
 
 class text(object):
@@ -25,6 +26,10 @@ class text(object):
         }
         for i in range(0x20):
             self.ESCAPE_DICT.setdefault(chr(i), '\\u{0:04x}'.format(i))
+        # Same escaping as a str.translate() table (for batches)
+        self.ESCAPE_TABLE = {ord(c): r for c, r in self.ESCAPE_DICT.items() if self.ESCAPE.match(c)}
+        # '[2020-01-31 18:42] ID=5000 ...'
+        self.KEY_RE = re.compile(r'^\ufeff?\[(\d+)-(\d\d)-(\d\d) (\d\d):(\d\d)\] ID=(\d+) ')
 
     def format(self, msg, exporter_context):
         """ Formatter method. Takes raw msg and converts it to a *one-line* string.
@@ -34,21 +39,63 @@ class text(object):
             :returns: *one-line* string containing one message data.
         """
         # pylint: disable=unused-argument
-        name, _, content, re_id, _, _, _ = common.extract_message_data(msg)
+        name, _, content, re_id, _, _, _ = common.extract_message_data(
+            msg, exporter_context.sender_cache)
         # Format a message log record
-        msg_dump_str = '[{}-{:02d}-{:02d} {:02d}:{:02d}] ID={} {}{}: {}'.format(
+        media_path = getattr(msg, 'media_path', None)
+        msg_dump_str = '[{}-{:02d}-{:02d} {:02d}:{:02d}] ID={} {}{}{}: {}'.format(
             msg.date.year, msg.date.month, msg.date.day,
             msg.date.hour, msg.date.minute, msg.id, "RE_ID=%s " % re_id if re_id else "",
+            "MEDIA=%s " % media_path if media_path is not None else "",
             name, self._py_encode_basestring(content))
 
         return msg_dump_str
 
+    def format_batch(self, messages, exporter_context):
+        """ Batch formatter method. Same as 'format' but for a list of messages.
+            :param messages: A list of MessageRecord (or raw message) objects.
+
+            :returns: A list of *one-line* strings in the same order as messages.
+        """
+        sender_cache = exporter_context.sender_cache
+        to_record = common.to_record
+        escape_table = self.ESCAPE_TABLE
+
+        result = []
+        append = result.append
+        for msg in messages:
+            msg = to_record(msg, sender_cache)
+            content = msg.content
+            if content:
+                content = content.translate(escape_table)
+            re_id = msg.reply_to_msg_id
+            media_path = msg.media_path
+            date = msg.date
+            append('[%d-%02d-%02d %02d:%02d] ID=%d %s%s%s: %s' % (
+                date.year, date.month, date.day, date.hour, date.minute, msg.id,
+                "RE_ID=%s " % re_id if re_id is not None else "",
+                "MEDIA=%s " % media_path if media_path is not None else "",
+                msg.sender_name, content))
+        return result
+
     def begin_final_file(self, resulting_file, exporter_context):
         """ Hook executes at the beginning of writing a resulting file.
             (After BOM is written in case of --addbom)
         """
         pass
 
+    def parse_message_key(self, line):
+        """ Reads a message back out of a line of a resulting file (see --index).
+            Dates are kept to the minute.
+
+            :returns: (message id, unix time) or None if the line is not a message.
+        """
+        match = self.KEY_RE.match(line)
+        if match is None:
+            return None
+        year, month, day, hour, minute, msg_id = (int(group) for group in match.groups())
+        return msg_id, timegm((year, month, day, hour, minute, 0))
+
     # This code is inspired by Python's json encoder's code
     def _py_encode_basestring(self, s):
         """Return a JSON representation of a Python string"""
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains code that formats messages with exporters,
+    either inline or in a pool of worker processes.
+"""
+
+import copy
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+def format_messages(exporter, exporter_context, messages, is_last_page):
+    """ Converts messages into strings with format provided by exporter.
+        Uses exporter's 'format_batch' if there is one, or calls 'format' per message otherwise.
+        :param exporter:            Exporter object that converts msg -> string
+        :param exporter_context:    The context that will be passed to the exporter
+        :param messages:            A list of messages (newest first)
+        :param is_last_page:        True if there will be no more messages to format
+
+        :return list of formatted strings (newest first)
+    """
+    format_batch = getattr(exporter, 'format_batch', None)
+    if format_batch is not None:
+        if not messages:
+            return []
+        # The batch holds the very first record of the resulting file as its last message
+        exporter_context.is_first_record = is_last_page
+        result = format_batch(messages, exporter_context)
+        exporter_context.is_last_record = False
+        return result
+
+    result = []
+    for msg in messages:
+        # The oldest message of the very last page goes first in the resulting file
+        exporter_context.is_first_record = \
+            is_last_page and msg is messages[-1]
+
+        result.append(exporter.format(msg, exporter_context))
+
+        exporter_context.is_last_record = False
+    return result
+
+
+class FormattingPool:
+    """ Formats batches of messages in worker processes.
+        Batches are submitted in order and every batch resolves into
+        a list of strings, so the caller can await them in the same order.
+    """
+
+    def __init__(self, workers_count):
+        """ constructor
+            :param workers_count:   Number of worker processes
+        """
+        self._executor = ProcessPoolExecutor(max_workers=workers_count)
+
+    def submit(self, exporter, exporter_context, messages, is_last_page):
+        """ Schedules formatting of a batch of messages (MessageRecord objects).
+            The context is sent along with every batch and is updated
+            in this process as if the batch was formatted inline.
+
+            :return asyncio future resulting in a list of formatted strings (newest first)
+        """
+        worker_context = copy.copy(exporter_context)
+        # Records carry resolved senders, the cache stays in this process
+        worker_context.sender_cache = None
+        future = self._executor.submit(
+            format_messages, exporter, worker_context, messages, is_last_page)
+        if messages:
+            exporter_context.is_first_record = is_last_page
+            exporter_context.is_last_record = False
+        return asyncio.wrap_future(future)
+
+    def close(self):
+        """ Shuts worker processes down """
+        self._executor.shutdown(wait=True)
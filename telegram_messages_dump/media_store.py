@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains the store of downloaded media files (see --media) """
+
+import os
+import re
+import errno
+import codecs
+import json
+import hashlib
+import logging
+import tempfile
+import asyncio
+from telethon import utils
+from telethon.errors import FloodWaitError
+from telegram_messages_dump.utils import format_size
+
+# Extensions that are safe to put into a file name
+_EXTENSION_RE = re.compile(r'^\.[A-Za-z0-9]{1,10}$')
+
+
+def get_media_key(media):
+    """ :return Telegram's id of the file of a media. E.g. 'photo:5224178...'
+                or None if there is no file to download (e.g. geo, contact or web page)
+    """
+    for kind in ('photo', 'document'):
+        media_id = getattr(getattr(media, kind, None), 'id', None)
+        if media_id is not None:
+            return '{}:{}'.format(kind, media_id)
+    return None
+
+
+def get_media_extension(media):
+    """ :return File extension of a media (e.g. '.jpg') or '' if it is unknown """
+    try:
+        extension = utils.get_extension(media)
+    except Exception:  # pylint: disable=broad-except
+        return ''
+    return extension.lower() if _EXTENSION_RE.match(extension or '') else ''
+
+
+class MediaStore:
+    """ Content-addressed store of media files. A file is named after the SHA-256 of
+        its content, so a file posted several times (reposts, forwards, other chats)
+        is stored once:
+            <dir>/ab/ab01...ef.jpg
+        The manifest maps ids of Telegram files onto the stored ones, so a file
+        that is already in the store is not downloaded again by this run or the next ones:
+            <dir>/manifest.json
+            {"version": 1, "media": {"photo:5224...": {"path": "ab/ab01...ef.jpg", "size": 1234}}}
+        Files are downloaded into <dir>/.partial first and moved into place once complete,
+        so an interrupted run never leaves a truncated file in the store.
+    """
+
+    VERSION = 1
+    MEDIA = "media"
+    PATH = "path"
+    SIZE = "size"
+
+    MANIFEST_FILE_NAME = 'manifest.json'
+    PARTIAL_DIR_NAME = '.partial'
+
+    # Number of files added in between saves of the manifest
+    SAVE_INTERVAL = 100
+
+    def __init__(self, store_dir_path):
+        """ constructor
+            :param store_dir_path: Directory of the store as specified by user
+        """
+        self.store_dir_path = store_dir_path
+        self.manifest_file_path = os.path.join(store_dir_path, MediaStore.MANIFEST_FILE_NAME)
+        self.partial_dir_path = os.path.join(store_dir_path, MediaStore.PARTIAL_DIR_NAME)
+        self.logger = logging.getLogger(__name__)
+        # Media key -> manifest entry
+        self._entries = {}
+        self._unsaved_count = 0
+        self._is_open = False
+        # Files moved into the store by this run
+        self.stored_count = 0
+        # Downloaded files whose content was in the store already
+        self.duplicates_count = 0
+
+    def open(self):
+        """ Creates the store and loads its manifest. Does nothing if it is open already.
+            :raises OSError: if the store directory can't be created
+        """
+        if self._is_open:
+            return
+        os.makedirs(self.partial_dir_path, exist_ok=True)
+        # Leftovers of an interrupted run
+        for file_name in os.listdir(self.partial_dir_path):
+            try:
+                os.remove(os.path.join(self.partial_dir_path, file_name))
+            except OSError:
+                pass
+        self._entries = self._load_manifest()
+        self._is_open = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, media_key):
+        """ :return Path of the stored file of a media, or None if it is not in the store """
+        entry = self._entries.get(media_key)
+        return self._get_file_path(entry[MediaStore.PATH]) if entry is not None else None
+
+    def new_partial_file(self):
+        """ :return (path, binary file object) of a new file to download a media into """
+        fd, partial_file_path = tempfile.mkstemp(suffix='.part', dir=self.partial_dir_path)
+        return partial_file_path, os.fdopen(fd, 'wb')
+
+    def add(self, media_key, partial_file_path, digest, extension, size):
+        """ Moves a downloaded file into the store (or deletes it if the same content
+            is stored already) and maps the media onto it.
+            :param media_key:           See 'get_media_key'
+            :param partial_file_path:   The downloaded file (see 'new_partial_file')
+            :param digest:              SHA-256 hex digest of the file content
+            :param extension:           File extension, e.g. '.jpg'
+            :param size:                File size
+
+            :return Path of the stored file
+        """
+        relative_path = '{}/{}{}'.format(digest[:2], digest, extension)
+        file_path = self._get_file_path(relative_path)
+        if os.path.isfile(file_path):
+            os.remove(partial_file_path)
+            self.duplicates_count += 1
+        else:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(partial_file_path, file_path)
+            self.stored_count += 1
+
+        self._entries[media_key] = {MediaStore.PATH: relative_path, MediaStore.SIZE: size}
+        self._unsaved_count += 1
+        if self._unsaved_count >= MediaStore.SAVE_INTERVAL:
+            self.save()
+        return file_path
+
+    def save(self):
+        """ Atomically writes the manifest if there are new entries.
+            A failure is not fatal, the files are found by their content next time.
+        """
+        if not self._unsaved_count:
+            return
+        try:
+            tmp_file_path = self.manifest_file_path + '.tmp'
+            with codecs.open(tmp_file_path, 'w', 'utf-8') as manifest_file:
+                json.dump({"version": MediaStore.VERSION, MediaStore.MEDIA: self._entries},
+                          manifest_file, ensure_ascii=False)
+            os.replace(tmp_file_path, self.manifest_file_path)
+            self._unsaved_count = 0
+        except OSError as ex:
+            self.logger.warning('Failed to write the media manifest "%s". %s',
+                                self.manifest_file_path, ex.strerror)
+
+    def _get_file_path(self, relative_path):
+        return os.path.join(self.store_dir_path, *relative_path.split('/'))
+
+    def _load_manifest(self):
+        """ Loads the manifest, if it exists. Entries of the deleted files are dropped. """
+        try:
+            with codecs.open(self.manifest_file_path, 'r', 'utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+            entries = manifest[MediaStore.MEDIA]
+            if not isinstance(entries, dict):
+                raise ValueError('"{}" is not an object.'.format(MediaStore.MEDIA))
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                self.logger.warning('Unable to open the media manifest "%s". %s',
+                                    self.manifest_file_path, ex.strerror)
+            return {}
+        except (ValueError, KeyError, TypeError) as ex:
+            self.logger.warning('Unable to load the media manifest "%s". %s',
+                                self.manifest_file_path, ex)
+            return {}
+
+        stored_entries = {}
+        for media_key, entry in entries.items():
+            try:
+                if os.path.isfile(self._get_file_path(entry[MediaStore.PATH])):
+                    stored_entries[media_key] = entry
+            except (KeyError, TypeError, AttributeError):
+                pass
+        self.logger.debug('Loaded %s of %s media manifest entries.',
+                          len(stored_entries), len(entries))
+        if len(stored_entries) != len(entries):
+            self._unsaved_count += 1
+        return stored_entries
+
+
+class MediaDownloader:
+    """ Downloads media files of messages into a MediaStore with a pool of asyncio workers,
+        so files are downloaded concurrently with each other and with fetching messages.
+        A file is downloaded once no matter how many messages refer to it.
+        A failed download is logged and the message is dumped without a file.
+    """
+
+    # Max number of attempts to download a file in case of FloodWaitError
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, client, store, workers_count, rate_limiter, metrics):
+        """ constructor
+            :param client:          TelegramClient to download with
+            :param store:           MediaStore to put the files into
+            :param workers_count:   Max number of files downloaded at once
+            :param rate_limiter:    RateLimiter to report FloodWaits to
+            :param metrics:         DumpMetrics
+        """
+        self.client = client
+        self.store = store
+        self.workers_count = workers_count
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.logger = logging.getLogger(__name__)
+        # Media key -> future of the file being downloaded or waiting for a worker
+        self._pending = {}
+        self._queue = None
+        self._workers = []
+
+    def submit(self, media):
+        """ Schedules a download of a media file, unless it is in the store already
+            or is being downloaded for another message. Must be called from the event loop.
+            :param media: Media of a raw message (msg.media)
+
+            :return asyncio future resulting in the path of the stored file, or in None
+                    if there is no file to download or the download failed
+        """
+        media_key = get_media_key(media)
+        if media_key is not None:
+            pending = self._pending.get(media_key)
+            if pending is not None:
+                self.metrics.count("media_deduplicated")
+                return pending
+
+        future = asyncio.get_event_loop().create_future()
+        if media_key is None:
+            future.set_result(None)
+            return future
+        file_path = self.store.get(media_key)
+        if file_path is not None:
+            self.metrics.count("media_deduplicated")
+            future.set_result(file_path)
+            return future
+
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.ensure_future(self._worker())
+                             for _ in range(self.workers_count)]
+        self._pending[media_key] = future
+        self._queue.put_nowait((media_key, media, future))
+        return future
+
+    async def close(self):
+        """ Stops the workers, cancels the downloads left and saves the manifest """
+        for worker in self._workers:
+            worker.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._workers = []
+        self._queue = None
+        self.store.save()
+
+    def summary(self):
+        """ Human readable summary of the downloads """
+        counters = self.metrics.counters
+        return ('Media: {} files downloaded ({}, {:.1f} sec), {} found in the store, '
+                '{} failed. {} files in "{}".'
+                .format(counters["media_downloaded"], format_size(counters["media_bytes"]),
+                        self.metrics.timers["media"], counters["media_deduplicated"],
+                        counters["media_failed"], len(self.store), self.store.store_dir_path))
+
+    async def _worker(self):
+        while True:
+            media_key, media, future = await self._queue.get()
+            try:
+                file_path = await self._download(media_key, media)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            finally:
+                self._pending.pop(media_key, None)
+            if not future.done():
+                future.set_result(file_path)
+
+    async def _download(self, media_key, media):
+        """ Downloads a media file into the store. Makes 5 attempts in case of FloodWaitError.
+
+            :return Path of the stored file or None
+        """
+        for attempt in range(0, MediaDownloader.MAX_ATTEMPTS):
+            partial_file_path = None
+            try:
+                partial_file_path, partial_file = self.store.new_partial_file()
+                with partial_file:
+                    writer = _HashingWriter(partial_file)
+                    with self.metrics.measure("media"):
+                        result = await self.client.download_media(media, file=writer)
+                if result is None:
+                    # Nothing to download, e.g. an empty photo
+                    return None
+                self.metrics.count("media_downloaded")
+                self.metrics.count("media_bytes", writer.size)
+                file_path = self.store.add(media_key, partial_file_path, writer.hexdigest(),
+                                           get_media_extension(media), writer.size)
+                partial_file_path = None
+                self.logger.debug('Media %s is stored as "%s".', media_key, file_path)
+                return file_path
+            except asyncio.CancelledError:
+                raise
+            except FloodWaitError as ex:
+                delay = self.rate_limiter.on_flood_wait(ex.seconds, attempt)
+                self.metrics.count("flood_waits")
+                self.metrics.add_time("flood_wait", delay)
+                self.logger.info('FloodWaitError while downloading media %s. '
+                                 'Sleep for %.0f sec.', media_key, delay)
+                await asyncio.sleep(delay)
+            except Exception as ex:  # pylint: disable=broad-except
+                self.metrics.count("media_failed")
+                self.logger.warning('Failed to download media %s. %s', media_key, ex)
+                return None
+            finally:
+                if partial_file_path is not None:
+                    try:
+                        os.remove(partial_file_path)
+                    except OSError:
+                        pass
+
+        self.metrics.count("media_failed")
+        self.logger.warning('Failed to download media %s after %s attempts.',
+                            media_key, MediaDownloader.MAX_ATTEMPTS)
+        return None
+
+
+class _HashingWriter:
+    """ Binary file wrapper that hashes the content as it is written """
+
+    def __init__(self, file):
+        self._file = file
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def tell(self):
+        return self.size
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains in-memory buffers of formatted messages """
+
+import sys
+import threading
+from collections import deque
+from telegram_messages_dump.utils import format_size
+
+
+class MemoryBudget:
+    """ Decides when buffered messages have to be spilled into a temp file.
+        Without a budget a buffer is spilled once it has 1000 messages.
+        With a budget a buffer is spilled once the messages buffered by all the chats
+        (or ranges of a chat) take that many bytes and the buffer holds at least its share
+        of them (budget / number of non-empty buffers). So short messages make fewer and
+        larger temp files, while long ones don't blow memory up. The largest buffer
+        always holds its share, so one of them is spilled once the budget is exceeded
+        and small buffers aren't spilled just because a large one filled the budget up.
+        NOTE: The budget may be exceeded by a page of messages per buffer,
+              as a buffer is checked after a page is added into it.
+        It is shared by all the buffers and collects their stats.
+    """
+
+    # Max number of messages in a buffer when there is no budget
+    DEFAULT_SPILL_SIZE = 1000
+
+    def __init__(self, budget_bytes=0):
+        """ constructor
+            :param budget_bytes: Max number of bytes of buffered messages, 0 means no budget
+        """
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+
+        # Stats
+        self.buffered_bytes = 0
+        self.peak_buffered_bytes = 0
+        self.active_buffers_count = 0
+        self.segments_count = 0
+
+    def is_exceeded(self, buffer):
+        """ :return True if the buffer has to be spilled """
+        if not self.budget_bytes:
+            return len(buffer) >= MemoryBudget.DEFAULT_SPILL_SIZE
+        if self.buffered_bytes < self.budget_bytes:
+            return False
+        return buffer.size_in_bytes * max(self.active_buffers_count, 1) >= self.budget_bytes
+
+    def add(self, size, is_first=False):
+        """ Accounts for messages added into a buffer
+            :param size:        Number of bytes added
+            :param is_first:    True if the buffer was empty
+        """
+        with self._lock:
+            self.buffered_bytes += size
+            if is_first:
+                self.active_buffers_count += 1
+            if self.buffered_bytes > self.peak_buffered_bytes:
+                self.peak_buffered_bytes = self.buffered_bytes
+
+    def remove(self, size, is_last=False):
+        """ Accounts for messages removed from a buffer
+            :param size:        Number of bytes removed
+            :param is_last:     True if the buffer is empty now
+        """
+        with self._lock:
+            self.buffered_bytes -= size
+            if is_last:
+                self.active_buffers_count -= 1
+
+    def on_spilled(self):
+        """ Accounts for a new temp file """
+        with self._lock:
+            self.segments_count += 1
+
+    def summary(self):
+        """ Human readable summary of buffering """
+        return ('Buffering: peak {} of messages in memory (budget {}), {} temp files.'
+                .format(format_size(self.peak_buffered_bytes),
+                        format_size(self.budget_bytes) if self.budget_bytes
+                        else '{} messages'.format(MemoryBudget.DEFAULT_SPILL_SIZE),
+                        self.segments_count))
+
+
+class MessageBuffer(deque):
+    """ Formatted messages waiting to be written out (newest last).
+        Keeps track of the memory they take (see MemoryBudget).
+        Keys of the messages (see 'output_segments.get_message_keys') are kept
+        along with them if the output needs them.
+    """
+
+    def __init__(self, memory_budget, is_keyed=False):
+        """ constructor
+            :param memory_budget:   MemoryBudget shared by all the buffers
+            :param is_keyed:        True to keep keys of the messages in 'keys'
+        """
+        super().__init__()
+        self.memory_budget = memory_budget
+        self.size_in_bytes = 0
+        self.keys = deque() if is_keyed else None
+
+    def is_full(self):
+        """ :return True if the buffer has to be spilled into a temp file """
+        return self.memory_budget.is_exceeded(self)
+
+    def extend(self, lines, keys=None):
+        if not isinstance(lines, list):
+            lines = list(lines)
+        size = sum(map(sys.getsizeof, lines))
+        super().extend(lines)
+        if self.keys is not None:
+            self.keys.extend(keys)
+        if size:
+            self.memory_budget.add(size, is_first=not self.size_in_bytes)
+            self.size_in_bytes += size
+
+    def pop(self):
+        line = super().pop()
+        if self.keys is not None:
+            self.keys.pop()
+        size = sys.getsizeof(line)
+        self.size_in_bytes -= size
+        self.memory_budget.remove(size, is_last=not self.size_in_bytes)
+        return line
+
+    def take(self):
+        """ Moves the messages out of the buffer.
+
+            :return (deque of lines, deque of their keys or None)
+        """
+        lines = deque(self)
+        keys = deque(self.keys) if self.keys is not None else None
+        self.clear()
+        return lines, keys
+
+    def clear(self):
+        super().clear()
+        if self.keys is not None:
+            self.keys.clear()
+        if self.size_in_bytes:
+            self.memory_budget.remove(self.size_in_bytes, is_last=True)
+        self.size_in_bytes = 0
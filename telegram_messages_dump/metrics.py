@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains runtime metrics of a dump and the reports made of them """
+
+import os
+import json
+import codecs
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from time import monotonic, perf_counter, time
+from telegram_messages_dump.utils import format_size
+
+
+class DumpProgress:
+    """ Progress of one chat being dumped. Estimates the time left. """
+
+    def __init__(self, chat_name, out_file, done_count=0):
+        """ constructor
+            :param chat_name:   Name of the chat as specified by user
+            :param out_file:    Output file of the chat
+            :param done_count:  Number of messages dumped by an interrupted run (if resumed)
+        """
+        self.chat_name = chat_name
+        self.out_file = out_file
+        # Number of messages expected to be dumped (None if unknown)
+        self.expected_count = None
+        self.fetched_count = done_count
+        self.written_count = done_count
+        self._started_count = done_count
+        self._started = monotonic()
+
+    def on_page(self, count, total, count_to_process):
+        """ Accounts for a freshly fetched page of messages.
+            :param count:               Number of messages in the page
+            :param total:               Number of messages in the chat ('total' of the page)
+            :param count_to_process:    Number of messages left to dump (None if unknown)
+        """
+        if self.expected_count is None and total and count_to_process is not None:
+            self.expected_count = self.fetched_count + min(
+                count_to_process, max(total - self.fetched_count, 0))
+        self.fetched_count += count
+
+    def messages_per_sec(self):
+        """ :return Rate at which messages are fetched by this run """
+        elapsed = monotonic() - self._started
+        return (self.fetched_count - self._started_count) / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self):
+        """ :return Estimated number of seconds left, or None if it is unknown """
+        rate = self.messages_per_sec()
+        if self.expected_count is None or rate <= 0:
+            return None
+        return max(self.expected_count - self.fetched_count, 0) / rate
+
+    def summary(self):
+        """ Human readable progress. E.g. '1200/5000 (24%), 35 msg/sec, ETA 0:01:48' """
+        rate = '{:.0f} msg/sec'.format(self.messages_per_sec())
+        if self.expected_count is None:
+            return '{} messages, {}'.format(self.fetched_count, rate)
+        fetched_count = min(self.fetched_count, self.expected_count)
+        eta = self.eta_seconds()
+        return '{}/{} ({:.0f}%), {}, ETA {}'.format(
+            fetched_count, self.expected_count,
+            100.0 * fetched_count / self.expected_count if self.expected_count else 100.0,
+            rate, timedelta(seconds=round(eta)) if eta is not None else '?')
+
+    def to_dict(self):
+        return {
+            "chat_name": self.chat_name,
+            "out_file": self.out_file,
+            "expected": self.expected_count,
+            "fetched": self.fetched_count,
+            "written": self.written_count,
+        }
+
+
+class DumpMetrics:
+    """ Counters and timers of a run. Thread-safe.
+        It is shared by all the chats when dumping several chats at once.
+        NOTE: Chats, fetch workers and pipeline stages run concurrently,
+              so the timers may add up to more than the wall time of the run.
+    """
+
+    # Counter name -> description
+    COUNTERS = {
+        "pages_fetched": "Pages of messages received from Telegram",
+        "messages_fetched": "Messages received from Telegram",
+        "retries": "Requests re-sent after a FloodWait",
+        "flood_waits": "FloodWaits received from Telegram",
+        "spill_bytes": "Bytes written into temp files",
+        "merge_bytes": "Bytes of temp files merged into resulting files",
+        "media_downloaded": "Media files downloaded from Telegram",
+        "media_deduplicated": "Media files that were in the media store already",
+        "media_failed": "Media files that failed to download",
+        "media_bytes": "Bytes of media files downloaded",
+    }
+
+    # Timer name -> description
+    TIMERS = {
+        "network": "Waiting for responses of Telegram",
+        "pacing": "Sleeping to keep the request rate (see --max-rate)",
+        "flood_wait": "Sleeping after FloodWaits",
+        "format": "Formatting messages by the exporter",
+        "spill": "Writing temp files",
+        "merge": "Writing resulting files",
+        "media": "Downloading media files (see --media)",
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time()
+        self._started = monotonic()
+        self.counters = dict.fromkeys(DumpMetrics.COUNTERS, 0)
+        self.timers = dict.fromkeys(DumpMetrics.TIMERS, 0.0)
+        # Progress of every chat
+        self.chats = []
+        # Unix time of the latest page received (stalled dumps don't update it)
+        self.last_progress_time = None
+        self._reported_at = monotonic()
+
+    def add_chat(self, chat_name, out_file, done_count=0):
+        """ Starts tracking the progress of a chat
+
+            :return DumpProgress of the chat
+        """
+        progress = DumpProgress(chat_name, out_file, done_count)
+        with self._lock:
+            self.chats.append(progress)
+        return progress
+
+    def count(self, name, value=1):
+        """ Increments a counter """
+        with self._lock:
+            self.counters[name] += value
+
+    def add_time(self, name, seconds):
+        """ Adds seconds to a timer """
+        with self._lock:
+            self.timers[name] += seconds
+
+    @contextmanager
+    def measure(self, name):
+        """ Adds the time spent in the 'with' block to a timer """
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - started)
+
+    def on_page(self, progress, count, total, count_to_process):
+        """ Accounts for a freshly fetched page of messages of a chat (see DumpProgress.on_page)
+        """
+        with self._lock:
+            self.counters["pages_fetched"] += 1
+            self.counters["messages_fetched"] += count
+            self.last_progress_time = time()
+        progress.on_page(count, total, count_to_process)
+
+    def is_due(self, interval):
+        """ :return True at most once per 'interval' seconds (for periodic reports) """
+        with self._lock:
+            now = monotonic()
+            if now - self._reported_at < interval:
+                return False
+            self._reported_at = now
+            return True
+
+    def elapsed(self):
+        """ :return Number of seconds since the run started """
+        return monotonic() - self._started
+
+    def messages_written(self):
+        return sum(progress.written_count for progress in self.chats)
+
+    def to_dict(self):
+        """ :return dict with a snapshot of the metrics """
+        with self._lock:
+            elapsed = self.elapsed()
+            messages_written = self.messages_written()
+            return {
+                "start_time": self.started,
+                "duration_seconds": elapsed,
+                "last_progress_time": self.last_progress_time,
+                "messages_written": messages_written,
+                "messages_per_sec": messages_written / elapsed if elapsed > 0 else 0.0,
+                "counters": dict(self.counters),
+                "timers_seconds": dict(self.timers),
+                "chats": [progress.to_dict() for progress in self.chats],
+            }
+
+    def summary(self):
+        """ Human readable summary of the metrics """
+        elapsed = self.elapsed()
+        return ('Metrics: {:.1f} sec, {:.1f} msg/sec, {} pages ({} retries). Time spent on '
+                'network {:.1f} sec, pacing {:.1f} sec, FloodWaits {:.1f} sec, formatting '
+                '{:.1f} sec, spilling {:.1f} sec ({}), merging {:.1f} sec ({}).'
+                .format(elapsed, self.messages_written() / elapsed if elapsed > 0 else 0.0,
+                        self.counters["pages_fetched"], self.counters["retries"],
+                        self.timers["network"], self.timers["pacing"],
+                        self.timers["flood_wait"], self.timers["format"],
+                        self.timers["spill"], format_size(self.counters["spill_bytes"]),
+                        self.timers["merge"], format_size(self.counters["merge_bytes"])))
+
+
+def save_stats_json(file_path, stats):
+    """ Atomically writes the stats of a run (see TelegramDumper._get_stats) as JSON """
+    stats = dict(stats)
+    stats["schema"] = "http://telegram-messages-dump/schema/stats/v/1"
+    _save_atomically(file_path, json.dumps(stats, ensure_ascii=False, indent=4))
+
+
+def save_prometheus_textfile(file_path, stats):
+    """ Atomically writes the stats of a run (see TelegramDumper._get_stats)
+        in Prometheus text exposition format, e.g. for node_exporter's textfile collector.
+    """
+    lines = []
+
+    def add(name, metric_type, description, samples):
+        name = 'telegram_dump_' + name
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for labels, value in samples:
+            lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+
+    add('running', 'gauge', '1 while the dump is running, 0 once it is finished.',
+        [({}, 1 if stats["return_code"] is None else 0)])
+    if stats["return_code"] is not None:
+        add('exit_code', 'gauge', 'Exit code of the finished dump.',
+            [({}, stats["return_code"])])
+    add('start_time_seconds', 'gauge', 'Unix time the dump started at.',
+        [({}, stats["start_time"])])
+    if stats["last_progress_time"] is not None:
+        add('last_progress_time_seconds', 'gauge',
+            'Unix time the latest page of messages was received at.',
+            [({}, stats["last_progress_time"])])
+    add('duration_seconds', 'gauge', 'Seconds since the dump started.',
+        [({}, stats["duration_seconds"])])
+    add('messages_per_second', 'gauge', 'Messages written per second.',
+        [({}, stats["messages_per_sec"])])
+    for name, description in DumpMetrics.COUNTERS.items():
+        add(name + '_total', 'counter', description + '.', [({}, stats["counters"][name])])
+    add('phase_seconds_total', 'counter', 'Seconds spent in a phase of the dump.',
+        [({"phase": name}, stats["timers_seconds"][name]) for name in DumpMetrics.TIMERS])
+    add('rate_limit_requests_per_second', 'gauge', 'Current request rate.',
+        [({}, stats["rate_limiter"]["rate"])])
+    add('temp_files_total', 'counter', 'Temp files written.',
+        [({}, stats["memory"]["temp_files"])])
+    add('peak_buffered_bytes', 'gauge', 'Peak size of messages buffered in memory.',
+        [({}, stats["memory"]["peak_buffered_bytes"])])
+
+    chats = stats["chats"]
+    add('chat_messages_fetched_total', 'counter', 'Messages of a chat received from Telegram.',
+        [({"chat": chat["chat_name"]}, chat["fetched"]) for chat in chats])
+    add('chat_messages_written_total', 'counter', 'Messages of a chat written out.',
+        [({"chat": chat["chat_name"]}, chat["written"]) for chat in chats])
+    add('chat_messages_expected', 'gauge', 'Messages of a chat expected to be dumped.',
+        [({"chat": chat["chat_name"]}, chat["expected"])
+         for chat in chats if chat["expected"] is not None])
+
+    _save_atomically(file_path, '\n'.join(lines) + '\n')
+
+
+def _save_atomically(file_path, content):
+    """ Writes a file via a temp one, so readers never see it half-written """
+    tmp_file_path = file_path + '.tmp'
+    with codecs.open(tmp_file_path, 'w', 'utf-8') as tmp_file:
+        tmp_file.write(content)
+    os.replace(tmp_file_path, file_path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
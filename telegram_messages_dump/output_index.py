@@ -0,0 +1,560 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains the sparse index of message ids and dates of the resulting file
+    (see --index) and a command line tool that extracts ranges of messages with it:
+
+    Usage:
+      python -m telegram_messages_dump.output_index extract -o <file> [--ids <A-B>]
+                                                    [--since <date>] [--until <date>]
+      python -m telegram_messages_dump.output_index check -o <file>
+      python -m telegram_messages_dump.output_index build -o <file>
+"""
+
+import os
+import sys
+import mmap
+import time
+import errno
+import struct
+import argparse
+from bisect import bisect_left
+from calendar import timegm
+from telegram_messages_dump.exceptions import MetadataError
+from telegram_messages_dump.exceptions import ExporterError
+from telegram_messages_dump.chat_dump_metadata import DumpMetadata
+from telegram_messages_dump.exporter_registry import ExporterRegistry
+from telegram_messages_dump.exporters.sink import sink
+from telegram_messages_dump.output_segments import SegmentManifest
+from telegram_messages_dump.output_segments import load_line_keys
+from telegram_messages_dump.output_segments import parse_date
+
+# Min number of bytes of messages in between two entries of an index
+INDEX_INTERVAL = 64 * 1024
+
+# Header of an index file: magic, version, interval of the entries
+_HEADER = struct.Struct('<8sqq')
+_MAGIC = b'TMDINDEX'
+_VERSION = 1
+
+# Entry of an index file: message id, unix time, offset of the message line in the file
+_ENTRY = struct.Struct('<qqq')
+
+# Fields of an entry a range of messages can be looked up by
+ID_FIELD = 0
+DATE_FIELD = 1
+_OFFSET_FIELD = 2
+
+# Number of bytes read at once from the end of a file looking for its last line
+_TAIL_CHUNK_SIZE = 64 * 1024
+
+# Formats of the dates accepted by --since and --until (UTC)
+_DATE_ARG_FORMATS = ('%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M',
+                     '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S')
+
+
+def get_index_file_path(file_path):
+    """ :return Path of the index of a resulting file (or of a segment of it) """
+    return file_path + '.idx'
+
+
+class OutputIndex:
+    """ Read-only view of an index file. The file is mapped into memory rather than read,
+        so a lookup touches O(log n) of its pages no matter how large it is.
+        An index file consists of a header and entries sorted by message id
+        (and so by date), all the numbers are 64-bit little-endian integers:
+            header: b'TMDINDEX', version, interval
+            entry:  message id, unix time, byte offset of the message line in the file
+        There is an entry per 'interval' bytes of messages at most, so the index of
+        a 20 GB file with the default interval is ~7 MB.
+    """
+
+    def __init__(self, index_file_path):
+        """ constructor
+            :param index_file_path: Path of the index file (see 'get_index_file_path')
+        """
+        self.index_file_path = index_file_path
+        self.interval = 0
+        self._file = None
+        self._map = None
+        self._count = 0
+
+    def open(self):
+        """ :raises OSError:    if the index can't be read
+            :raises ValueError: if it is not an index file or its version is not supported
+        """
+        self._file = open(self.index_file_path, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError('"{}" is not an index file.'.format(self.index_file_path))
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.interval = _HEADER.unpack_from(self._map)
+            if magic != _MAGIC:
+                raise ValueError('"{}" is not an index file.'.format(self.index_file_path))
+            if version != _VERSION:
+                raise ValueError('Version {} of index file "{}" is not supported.'
+                                 .format(version, self.index_file_path))
+        except Exception:
+            self.close()
+            raise
+        self._count = (size - _HEADER.size) // _ENTRY.size
+        return self
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        """ :return (message id, unix time, offset) of i-th entry """
+        if not 0 <= i < self._count:
+            raise IndexError('index entry out of range')
+        return _ENTRY.unpack_from(self._map, _HEADER.size + i * _ENTRY.size)
+
+    def get_count_below(self, file_size):
+        """ :return Number of the entries that point into a file of the size.
+                    The ones beyond it are left by a run whose output was truncated
+                    and appended to without the index.
+        """
+        return bisect_left(_IndexColumn(self, _OFFSET_FIELD), file_size)
+
+    def find_start(self, field, first, count=None):
+        """ :param field:   ID_FIELD or DATE_FIELD
+            :param first:   Min message id or unix time of a range of messages
+            :param count:   Number of the entries to look through (all of them by default)
+
+            :return Offset in the file to look for the first message of the range from.
+                    Every message before it is out of the range.
+        """
+        start = bisect_left(_IndexColumn(self, field), first,
+                            0, len(self) if count is None else count)
+        return self[start - 1][_OFFSET_FIELD] if start > 0 else 0
+
+
+class _IndexColumn:
+    """ Sequence of one field of the entries of an index (to bisect them) """
+
+    def __init__(self, index, field):
+        self._index = index
+        self._field = field
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i):
+        return self._index[i][self._field]
+
+
+class IndexWriter:
+    """ Appends entries to an index file (see OutputIndex) """
+
+    def __init__(self, index_file_path, interval=INDEX_INTERVAL):
+        """ constructor
+            :param index_file_path: Path of the index file (see 'get_index_file_path')
+            :param interval:        Min number of bytes of messages in between entries
+        """
+        self.index_file_path = index_file_path
+        self.interval = interval
+        self._file = None
+        # Offset the latest entry points to
+        self.last_offset = None
+
+    def create(self):
+        """ Creates an empty index (overwrites the existing one)
+            :raises OSError: if the index can't be written
+        """
+        self._file = open(self.index_file_path, 'wb')
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, self.interval))
+        self.last_offset = None
+        return self
+
+    def open_appended(self, file_size):
+        """ Opens the existing index of a file that is about to be appended to.
+            The entries that point beyond the end of the file are dropped
+            (e.g. the file was truncated back to a checkpoint).
+            :param file_size: The current size of the indexed file
+
+            :return True if the index is opened, False if there is no index
+                    or it is not usable (so it has to be built anew)
+            :raises OSError: if the index can't be written
+        """
+        try:
+            with OutputIndex(self.index_file_path) as index:
+                count = index.get_count_below(file_size)
+                self.interval = index.interval
+                self.last_offset = index[count - 1][_OFFSET_FIELD] if count else None
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+            return False
+        except ValueError:
+            return False
+        self._file = open(self.index_file_path, 'r+b')
+        self._file.truncate(_HEADER.size + count * _ENTRY.size)
+        self._file.seek(0, os.SEEK_END)
+        return True
+
+    def add(self, message_id, date, offset):
+        """ Adds an entry for a message line unless the latest entry is close enough
+            :param message_id:  Message id
+            :param date:        Unix time of the message
+            :param offset:      Offset of the message line in the file
+        """
+        if self.last_offset is None or offset - self.last_offset >= self.interval:
+            self._file.write(_ENTRY.pack(message_id, date, offset))
+            self.last_offset = offset
+
+    def flush(self, is_durable=False):
+        """ :param is_durable: True to make the entries durable (see --checkpoint) """
+        self._file.flush()
+        if is_durable:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class IndexedOutput(sink):
+    """ Sink that indexes the lines written into a text file sink (see OutputIndex).
+        Lines have to be written along with their keys (see 'write_keyed_lines'),
+        temp files along with the keys saved next to them (see 'save_line_keys').
+    """
+
+    def __init__(self, output, writer, offset):
+        """ constructor
+            :param output:  text_file_sink the lines are written into
+            :param writer:  IndexWriter of the file
+            :param offset:  Offset in the file the lines are written from
+        """
+        self.output = output
+        self.writer = writer
+        self.offset = offset
+
+    def write_lines(self, lines):
+        raise NotImplementedError('Lines of an indexed output have to be written with keys.')
+
+    def write_keyed_lines(self, lines, keys):
+        lines = list(lines)
+        add = self.writer.add
+        offset = self.offset
+        for line, (message_id, date) in zip(lines, keys):
+            add(message_id, date, offset)
+            offset += len(line.encode('utf-8')) + 1
+        self.offset = offset
+        self.output.write_lines(lines)
+
+    def append_temp_file(self, temp_file_path):
+        add = self.writer.add
+        offset = self.offset
+        for message_id, date, size in load_line_keys(temp_file_path):
+            add(message_id, date, offset)
+            offset += size
+        self.offset = offset
+        self.output.append_temp_file(temp_file_path)
+
+    def sync(self):
+        output_size = self.output.sync()
+        self.writer.flush(is_durable=True)
+        return output_size
+
+    def close(self):
+        self.output.close()
+        self.writer.flush()
+
+
+def build_index(file_path, parse_message_key, writer):
+    """ Indexes an existing file by reading the messages back out of it.
+        :param file_path:           Path of the file (or of a segment of it)
+        :param parse_message_key:   'parse_message_key' of the exporter of the file
+        :param writer:              IndexWriter to add the entries to
+
+        :return Number of bytes read
+    """
+    offset = 0
+    with open(file_path, 'rb') as indexed_file:
+        for line in indexed_file:
+            if writer.last_offset is None or offset - writer.last_offset >= writer.interval:
+                key = parse_message_key(line.decode('utf-8-sig', errors='replace')) \
+                    if line.endswith(b'\n') else None
+                if key is not None:
+                    writer.add(key[0], key[1], offset)
+            offset += len(line)
+    return offset
+
+
+def iter_range(file_path, parse_message_key, field, first, last):
+    """ Reads the messages of a range out of a file with the help of its index.
+        Messages are expected to be sorted by id and date (as they are dumped).
+        :param file_path:           Path of the file (or of a segment of it)
+        :param parse_message_key:   'parse_message_key' of the exporter of the file
+        :param field:               ID_FIELD or DATE_FIELD
+        :param first:               Min message id or unix time of the range
+        :param last:                Max message id or unix time of the range
+
+        :return generator of the lines of the messages (bytes, with line breaks)
+        :raises OSError:    if the file or its index can't be read
+        :raises ValueError: if the index is malformed
+    """
+    with open(file_path, 'rb') as indexed_file:
+        with OutputIndex(get_index_file_path(file_path)) as index:
+            file_size = os.fstat(indexed_file.fileno()).st_size
+            start = index.find_start(field, first, index.get_count_below(file_size))
+        indexed_file.seek(start)
+        for line in indexed_file:
+            key = parse_message_key(line.decode('utf-8-sig', errors='replace'))
+            if key is None:
+                # Not a message, e.g. a csv header
+                continue
+            if key[field] > last:
+                break
+            if key[field] >= first:
+                yield line
+
+
+def read_last_line(file_path):
+    """ Reads the last line of a file from its end.
+
+        :return The line (bytes, with a line break if there is one) or b'' if the file is empty
+    """
+    with open(file_path, 'rb') as tail_file:
+        end = tail_file.seek(0, os.SEEK_END)
+        tail = b''
+        position = end
+        while position > 0:
+            position = max(position - _TAIL_CHUNK_SIZE, 0)
+            tail_file.seek(position)
+            tail = tail_file.read(_TAIL_CHUNK_SIZE) + tail
+            line_start = tail.rfind(b'\n', 0, len(tail) - 1)
+            if line_start != -1:
+                return tail[line_start + 1:]
+        return tail
+
+
+def check_file(file_path, parse_message_key, latest_message_id):
+    """ Checks that the tail of a file (or of the last segment of it) is complete and
+        matches the metadata, and that its index matches the file. Only the last line
+        and the lines the last entry of the index points to are read.
+        :param file_path:           Path of the file
+        :param parse_message_key:   'parse_message_key' of the exporter of the file
+        :param latest_message_id:   Id of the latest message dumped (according to .meta)
+
+        :return List of the problems found
+    """
+    problems = []
+    file_size = os.path.getsize(file_path)
+    last_line = read_last_line(file_path)
+    last_key = parse_message_key(last_line.decode('utf-8-sig', errors='replace'))
+    last_id = last_key[0] if last_key is not None else -1
+    if last_line and not last_line.endswith(b'\n'):
+        problems.append('"{}" ends with an incomplete line, the run that wrote it '
+                        'was interrupted.'.format(file_path))
+    elif last_id < latest_message_id:
+        problems.append('The latest message of "{}" is {}, but the metadata says {} '
+                        'was dumped. --continue would skip the messages in between.'
+                        .format(file_path, last_id if last_key else 'missing',
+                                latest_message_id))
+    elif last_id > latest_message_id:
+        problems.append('The latest message of "{}" is {}, but the metadata says {}. '
+                        '--continue would dump the messages in between once again.'
+                        .format(file_path, last_id, latest_message_id))
+
+    index_file_path = get_index_file_path(file_path)
+    try:
+        with OutputIndex(index_file_path) as index:
+            count = index.get_count_below(file_size)
+            if count < len(index):
+                problems.append('{} entries of "{}" point beyond the end of the file.'
+                                .format(len(index) - count, index_file_path))
+            if count:
+                message_id, _, offset = index[count - 1]
+                with open(file_path, 'rb') as indexed_file:
+                    indexed_file.seek(offset)
+                    key = parse_message_key(
+                        indexed_file.readline().decode('utf-8-sig', errors='replace'))
+                if key is None or key[0] != message_id:
+                    problems.append('"{}" doesn\'t match the file, build it anew.'
+                                    .format(index_file_path))
+    except OSError as ex:
+        problems.append('Unable to open the index "{}". {}'.format(index_file_path, ex.strerror))
+    except ValueError as ex:
+        problems.append(str(ex))
+    return problems
+
+
+def get_indexed_files(out_file_path):
+    """ :param out_file_path: Path of the resulting file as specified by user
+
+        :return Paths of the files a resulting file consists of, oldest first
+                (the segments of a rotated output or the file itself)
+        :raises OSError:    if the segment manifest can't be read
+        :raises ValueError: if the segment manifest is malformed
+    """
+    segments = SegmentManifest(out_file_path)
+    if not os.path.exists(segments.manifest_file_path):
+        return [out_file_path]
+    segments.load()
+    return [segments.get_file_path(segment) for segment in segments.segments
+            if segment[SegmentManifest.COUNT]]
+
+
+def _get_segment_range(out_file_path, field, first, last):
+    """ :return Paths of the files of a resulting file that may have messages of a range """
+    segments = SegmentManifest(out_file_path)
+    if not os.path.exists(segments.manifest_file_path):
+        return [out_file_path]
+    segments.load()
+    first_key, last_key = (SegmentManifest.FIRST_ID, SegmentManifest.LAST_ID) \
+        if field == ID_FIELD else (SegmentManifest.FIRST_DATE, SegmentManifest.LAST_DATE)
+    file_paths = []
+    for i, segment in enumerate(segments.segments):
+        if not segment[SegmentManifest.COUNT]:
+            continue
+        segment_first = segment[first_key] if field == ID_FIELD \
+            else parse_date(segment[first_key])
+        # The entry of the last segment is updated once in a while as it is appended to
+        is_last = i == len(segments.segments) - 1
+        segment_last = segment[last_key] if field == ID_FIELD or segment[last_key] is None \
+            else parse_date(segment[last_key])
+        if segment_first <= last and (is_last or segment_last is None or segment_last >= first):
+            file_paths.append(segments.get_file_path(segment))
+    return file_paths
+
+
+def _parse_ids_arg(string):
+    """ :return (first, last) message ids of --ids. E.g. '100-200', '100-' or '-200' """
+    first, separator, last = string.partition('-')
+    try:
+        first = int(first) if first.strip() else 0
+        last = int(last) if last.strip() else sys.maxsize if separator else first
+    except ValueError:
+        raise argparse.ArgumentTypeError('must be a range of ids, e.g. 100-200, 100- or -200')
+    return first, last
+
+
+def _parse_date_arg(string):
+    """ :return unix time of --since/--until. E.g. '2020-01-31' or '2020-01-31T18:30' (UTC) """
+    for date_format in _DATE_ARG_FORMATS:
+        try:
+            return timegm(time.strptime(string.strip(), date_format))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError('must be a date, e.g. 2020-01-31 or 2020-01-31T18:30 (UTC)')
+
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(
+        prog='python -m telegram_messages_dump.output_index',
+        description='Extracts ranges of messages out of a resulting file '
+                    'with the help of its index (see --index).')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    extract_parser = commands.add_parser(
+        'extract', help='Print the messages of an id or date range.')
+    extract_parser.add_argument('--ids', type=_parse_ids_arg,
+                                help='Range of message ids, e.g. 100-200, 100- or -200.')
+    extract_parser.add_argument('--since', type=_parse_date_arg,
+                                help='The first date (UTC, inclusive), e.g. 2020-01-31.')
+    extract_parser.add_argument('--until', type=_parse_date_arg,
+                                help='The last date (UTC, exclusive), e.g. 2020-02-01T12:00.')
+    commands.add_parser('check', help='Check that the end of the file is complete, '
+                                      'matches the metadata and the index.')
+    commands.add_parser('build', help='Index a file dumped without --index.')
+    for command_parser in commands.choices.values():
+        command_parser.add_argument('-o', '--out', required=True,
+                                    help='Output file name or full path as it was dumped.')
+        command_parser.add_argument('-e', '--exp', default='',
+                                    help='Exporter name. (Default: the one in the metadata)')
+    args = parser.parse_args()
+
+    if args.command == 'extract':
+        if args.ids is not None and (args.since is not None or args.until is not None):
+            parser.error('--ids can not be combined with --since or --until')
+        if args.ids is None and args.since is None and args.until is None:
+            parser.error('one of --ids, --since or --until is required')
+
+    meta = argparse.Namespace(is_indexed=False)
+    try:
+        DumpMetadata(args.out).merge_into_settings(meta)
+    except MetadataError as ex:
+        if args.command == 'check' or not args.exp:
+            print('ERROR: {}'.format(ex), file=sys.stderr)
+            return 1
+        meta = None
+    if meta is not None and meta.compress:
+        print('ERROR: Compressed output can\'t be indexed.', file=sys.stderr)
+        return 1
+    try:
+        exporter = ExporterRegistry().load(args.exp or meta.exporter)
+    except ExporterError as ex:
+        print('ERROR: {}'.format(ex), file=sys.stderr)
+        return 1
+    parse_message_key = getattr(exporter, 'parse_message_key', None)
+    if parse_message_key is None:
+        print('ERROR: "{}" exporter can\'t read its output back.'
+              .format(args.exp or meta.exporter), file=sys.stderr)
+        return 1
+
+    try:
+        if args.command == 'extract':
+            if args.ids is not None:
+                field, (first, last) = ID_FIELD, args.ids
+            else:
+                field = DATE_FIELD
+                first = args.since if args.since is not None else 0
+                last = args.until - 1 if args.until is not None else sys.maxsize
+            file_paths = _get_segment_range(args.out, field, first, last)
+            for file_path in file_paths:
+                if not os.path.isfile(get_index_file_path(file_path)):
+                    print('ERROR: "{}" is not indexed. Index it with "build" command.'
+                          .format(file_path), file=sys.stderr)
+                    return 1
+            output = sys.stdout.buffer
+            for file_path in file_paths:
+                for line in iter_range(file_path, parse_message_key, field, first, last):
+                    output.write(line)
+            output.flush()
+            return 0
+
+        file_paths = get_indexed_files(args.out)
+        if args.command == 'build':
+            for file_path in file_paths:
+                writer = IndexWriter(get_index_file_path(file_path)).create()
+                try:
+                    build_index(file_path, parse_message_key, writer)
+                finally:
+                    writer.close()
+                print('"{}" is indexed.'.format(file_path), file=sys.stderr)
+            return 0
+
+        problems = check_file(file_paths[-1], parse_message_key, meta.last_message_id) \
+            if file_paths else ['"{}" has no segments.'.format(args.out)]
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        if not problems:
+            print('"{}" is OK.'.format(file_paths[-1]), file=sys.stderr)
+        return 1 if problems else 0
+    except OSError as ex:
+        print('ERROR: {}'.format(ex), file=sys.stderr)
+        return 1
+    except ValueError as ex:
+        print('ERROR: {}'.format(ex), file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains rotation of the resulting file into numbered segments
+    (see --rotate-size, --rotate-count and --rotate-period)
+"""
+
+import os
+import time
+import errno
+import codecs
+import json
+import logging
+from array import array
+from calendar import timegm
+from contextlib import ExitStack
+from telegram_messages_dump.exporters.sink import sink
+
+# Calendar periods a resulting file can be rotated by
+ROTATION_PERIODS = ('day', 'week', 'month', 'year')
+
+# Format of the dates in the segment manifest (always UTC)
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Number of seconds in a day
+_DAY = 86400
+
+
+def get_message_keys(messages):
+    """ :param messages: A list of MessageRecord
+
+        :return list of (message id, unix time) of the messages, in the same order
+    """
+    return [(msg.id, int(msg.date.timestamp())) for msg in messages]
+
+
+def save_line_keys(temp_file_path, line_keys):
+    """ Saves the keys of the lines of a temp file next to it.
+        :param temp_file_path:  Path of the temp file
+        :param line_keys:       list of (message id, unix time, size of the line in bytes)
+                                of the lines of the file, in the same order
+    """
+    keys_array = array('q')
+    for line_key in line_keys:
+        keys_array.extend(line_key)
+    with open(get_line_keys_file_path(temp_file_path), 'wb') as keys_file:
+        keys_array.tofile(keys_file)
+
+
+def load_line_keys(temp_file_path):
+    """ :return list of (message id, unix time, size of the line in bytes)
+                of the lines of a temp file (see 'save_line_keys')
+    """
+    keys_array = array('q')
+    with open(get_line_keys_file_path(temp_file_path), 'rb') as keys_file:
+        keys_array.frombytes(keys_file.read())
+    return list(zip(keys_array[0::3], keys_array[1::3], keys_array[2::3]))
+
+
+def get_line_keys_file_path(temp_file_path):
+    """ :return Path of the file with the keys of the lines of a temp file """
+    return temp_file_path + '.keys'
+
+
+def get_period_bounds(period, unix_time):
+    """ :param period:      One of ROTATION_PERIODS
+        :param unix_time:   A moment in time
+
+        :return (start, end) unix times of the calendar period (UTC) the moment belongs to
+    """
+    day_start = unix_time - unix_time % _DAY
+    if period == 'day':
+        return day_start, day_start + _DAY
+    if period == 'week':
+        # 1970-01-01 was a Thursday, weeks start on Monday (as ISO weeks do)
+        week_start = day_start - (unix_time // _DAY + 3) % 7 * _DAY
+        return week_start, week_start + 7 * _DAY
+    year, month = time.gmtime(unix_time)[:2]
+    if period == 'month':
+        return (timegm((year, month, 1, 0, 0, 0)),
+                timegm((year + month // 12, month % 12 + 1, 1, 0, 0, 0)))
+    return timegm((year, 1, 1, 0, 0, 0)), timegm((year + 1, 1, 1, 0, 0, 0))
+
+
+def format_date(unix_time):
+    """ :return Date as it is kept in the segment manifest. E.g. '2020-01-31T23:59:59Z' """
+    return time.strftime(DATE_FORMAT, time.gmtime(unix_time))
+
+
+def parse_date(string):
+    """ :return unix time of a date formatted with 'format_date' """
+    return timegm(time.strptime(string, DATE_FORMAT))
+
+
+class SegmentManifest:
+    """ Segments a rotated resulting file consists of. The segments are kept next to
+        the resulting file and are numbered after it, e.g. 'chat.log' is rotated into
+        'chat.00001.log', 'chat.00002.log' and so on. The manifest is kept in
+        '<out>.segments.json':
+            {"version": 1, "segments": [
+                {"file": "chat.00001.log", "first_id": 1, "last_id": 5000,
+                 "first_date": "2020-01-01T10:00:00Z", "last_date": "2020-01-31T18:42:00Z",
+                 "count": 5000, "size": 812345, "text_size": 812345}, ...]}
+        'size' is the size of the file on disk and 'text_size' is the size of the messages
+        in it before compression (a header, e.g. of csv, is not included).
+        Every segment but the last one is complete, the last one is appended to
+        by --continue until it is rotated. Jobs processing the segments may skip the ones
+        whose 'last_id' and 'size' haven't changed since they saw them.
+    """
+
+    VERSION = 1
+    SEGMENTS = "segments"
+
+    FILE = "file"
+    FIRST_ID = "first_id"
+    LAST_ID = "last_id"
+    FIRST_DATE = "first_date"
+    LAST_DATE = "last_date"
+    COUNT = "count"
+    SIZE = "size"
+    TEXT_SIZE = "text_size"
+
+    def __init__(self, out_file_path):
+        """ constructor
+            :param out_file_path: Path of the resulting file as specified by user
+        """
+        self.out_file_path = out_file_path
+        self.manifest_file_path = out_file_path + '.segments.json'
+        self.logger = logging.getLogger(__name__)
+        self.segments = []
+
+    def load(self):
+        """ Loads the manifest of an existing dump.
+            :raises OSError:    if the manifest can't be read
+            :raises ValueError: if the manifest is malformed
+        """
+        self.logger.debug('Load segment manifest %s.', self.manifest_file_path)
+        with codecs.open(self.manifest_file_path, 'r', 'utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+        segments = manifest.get(SegmentManifest.SEGMENTS) \
+            if isinstance(manifest, dict) else None
+        if not isinstance(segments, list) \
+                or not all(isinstance(segment, dict) and SegmentManifest.FILE in segment
+                           for segment in segments):
+            raise ValueError('"{}" is not a list of segments.'.format(SegmentManifest.SEGMENTS))
+        self.segments = segments
+
+    def reset(self):
+        """ Deletes the segments of a previous dump, if any, and saves an empty manifest.
+            :raises OSError: if the manifest can't be written
+        """
+        try:
+            self.load()
+        except (OSError, ValueError):
+            self.segments = []
+        for segment in self.segments:
+            try:
+                self.logger.debug('Delete old segment %s.', segment[SegmentManifest.FILE])
+                os.remove(self.get_file_path(segment))
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+        self.segments = []
+        self.save()
+
+    def save(self):
+        """ Atomically replaces the manifest file.
+            :raises OSError: if the manifest can't be written
+        """
+        self.logger.debug('Save segment manifest %s.', self.manifest_file_path)
+        tmp_file_path = self.manifest_file_path + '.tmp'
+        with codecs.open(tmp_file_path, 'w', 'utf-8') as manifest_file:
+            json.dump({"version": SegmentManifest.VERSION,
+                       SegmentManifest.SEGMENTS: self.segments},
+                      manifest_file, ensure_ascii=False, indent=1)
+        os.replace(tmp_file_path, self.manifest_file_path)
+
+    def add_segment(self):
+        """ :return manifest entry of a new empty segment """
+        out_file_name = os.path.basename(self.out_file_path)
+        number = len(self.segments) + 1
+        # The number goes before the extensions, e.g. 'chat.00001.jsonl.gz'
+        ext_index = out_file_name.find('.', 1)
+        if ext_index == -1:
+            file_name = '{}.{:05d}'.format(out_file_name, number)
+        else:
+            file_name = '{}.{:05d}{}'.format(
+                out_file_name[:ext_index], number, out_file_name[ext_index:])
+        segment = {SegmentManifest.FILE: file_name,
+                   SegmentManifest.FIRST_ID: None, SegmentManifest.LAST_ID: None,
+                   SegmentManifest.FIRST_DATE: None, SegmentManifest.LAST_DATE: None,
+                   SegmentManifest.COUNT: 0, SegmentManifest.SIZE: 0,
+                   SegmentManifest.TEXT_SIZE: 0}
+        self.segments.append(segment)
+        return segment
+
+    def get_file_path(self, segment):
+        """ :return Path of the file of a segment """
+        return os.path.join(os.path.dirname(self.out_file_path), segment[SegmentManifest.FILE])
+
+
+class SegmentedOutput(sink):
+    """ Sink that rotates the resulting file into numbered segments (see SegmentManifest).
+        A new segment is started once the current one has 'max_size' bytes of text
+        or 'max_count' messages, or once a message of the next calendar 'period' comes.
+        A message is never split across segments. The first write continues the last
+        segment of the previous runs unless it is due to be rotated.
+        Lines have to be written along with their keys (see 'write_keyed_lines'),
+        temp files along with the keys saved next to them (see 'save_line_keys').
+    """
+
+    def __init__(self, manifest, open_segment, max_size=0, max_count=0, period=''):
+        """ constructor
+            :param manifest:        SegmentManifest
+            :param open_segment:    function(file_path, is_new) that returns a context manager
+                                    of the sink of a segment file. 'is_new' is False when
+                                    the segment is appended to.
+            :param max_size:        Max number of bytes of text in a segment, 0 means no limit
+            :param max_count:       Max number of messages in a segment, 0 means no limit
+            :param period:          One of ROTATION_PERIODS or '' not to rotate by date
+        """
+        self.manifest = manifest
+        self.max_size = max_size
+        self.max_count = max_count
+        self.period = period
+        self._open_segment_sink = open_segment
+        self.logger = logging.getLogger(__name__)
+        # Manifest entry of the segment being written and its sink
+        self._segment = None
+        self._segment_sink = None
+        self._exit_stack = None
+        # Key of the latest message written into the segment
+        self._last_key = None
+        # Unix time the period of the segment ends at (see 'period')
+        self._period_end = None
+
+    def write_lines(self, lines):
+        raise NotImplementedError('Lines of a segmented output have to be written with keys.')
+
+    def write_keyed_lines(self, lines, keys):
+        lines = list(lines)
+        self._write(lines, keys, [len(line.encode('utf-8')) + 1 for line in lines])
+
+    def append_temp_file(self, temp_file_path):
+        line_keys = load_line_keys(temp_file_path)
+        if not line_keys:
+            return
+        _, first_date, first_size = line_keys[0]
+        if self._segment is None or self._is_full(first_date, first_size):
+            self._next_segment(first_date, first_size)
+
+        segment = self._segment
+        period_end = self._period_end if segment[SegmentManifest.COUNT] \
+            else get_period_bounds(self.period, first_date)[1] if self.period else None
+        if (not self.max_count
+                or segment[SegmentManifest.COUNT] + len(line_keys) <= self.max_count) \
+                and (not self.max_size or segment[SegmentManifest.TEXT_SIZE]
+                     + sum(size for _, _, size in line_keys) <= self.max_size) \
+                and (period_end is None or max(date for _, date, _ in line_keys) < period_end):
+            # The whole file goes into the current segment, so it is copied as is
+            for message_id, date, size in line_keys:
+                self._account(message_id, date, size)
+            self._segment_sink.append_temp_file(temp_file_path)
+            return
+
+        # NOTE: io (unlike codecs readers) doesn't split lines on U+2028 and alike
+        with open(temp_file_path, 'r', encoding='utf-8') as temp_file:
+            for start in range(0, len(line_keys), sink.LINES_PER_WRITE):
+                chunk = line_keys[start:start + sink.LINES_PER_WRITE]
+                lines = [temp_file.readline()[:-1] for _ in chunk]
+                self._write(lines, [(message_id, date) for message_id, date, _ in chunk],
+                            [size for _, _, size in chunk])
+
+    def sync(self):
+        if self._segment_sink is not None:
+            self._segment_sink.sync()
+            self._update_segment()
+            self.manifest.save()
+        return None
+
+    def close(self):
+        """ Closes the segment being written and saves the manifest """
+        if self._segment is not None:
+            self._close_segment()
+            self.manifest.save()
+
+    def _write(self, lines, keys, sizes):
+        """ Writes lines into the segments they belong to
+            :param lines:   list of *one-line* strings (oldest first)
+            :param keys:    (message id, unix time) of the lines
+            :param sizes:   Sizes of the lines in bytes (including line breaks)
+        """
+        pending_lines = []
+        pending_keys = []
+        for line, key, size in zip(lines, keys, sizes):
+            message_id, date = key
+            if self._segment is None or self._is_full(date, size):
+                if pending_lines:
+                    self._segment_sink.write_keyed_lines(pending_lines, pending_keys)
+                    pending_lines = []
+                    pending_keys = []
+                self._next_segment(date, size)
+            self._account(message_id, date, size)
+            pending_lines.append(line)
+            pending_keys.append(key)
+        if pending_lines:
+            self._segment_sink.write_keyed_lines(pending_lines, pending_keys)
+
+    def _is_full(self, date, size, segment=None, period_end=None):
+        """ :return True if a message doesn't fit into the current segment
+                    (or into 'segment' whose period ends at 'period_end')
+        """
+        if segment is None:
+            segment, period_end = self._segment, self._period_end
+        count = segment[SegmentManifest.COUNT]
+        if not count:
+            return False
+        return bool((self.max_count and count >= self.max_count)
+                    or (self.max_size
+                        and segment[SegmentManifest.TEXT_SIZE] + size > self.max_size)
+                    or (period_end is not None and date >= period_end))
+
+    def _next_segment(self, date, size):
+        """ Closes the current segment and opens the one a message goes into """
+        is_first = self._segment is None
+        if not is_first:
+            self._close_segment()
+            self.manifest.save()
+
+        segments = self.manifest.segments
+        if is_first and segments and segments[-1][SegmentManifest.COUNT]:
+            last_segment = segments[-1]
+            period_end = get_period_bounds(
+                self.period, parse_date(last_segment[SegmentManifest.FIRST_DATE]))[1] \
+                if self.period else None
+            if not self._is_full(date, size, segment=last_segment, period_end=period_end):
+                self._open(last_segment, False)
+                self._period_end = period_end
+                return
+        if is_first and segments and not segments[-1][SegmentManifest.COUNT]:
+            # An empty segment left by a failed run
+            self._open(segments[-1], True)
+            return
+        self._open(self.manifest.add_segment(), True)
+
+    def _open(self, segment, is_new):
+        file_path = self.manifest.get_file_path(segment)
+        self.logger.debug('%s segment %s.', 'Start' if is_new else 'Continue', file_path)
+        self._exit_stack = ExitStack()
+        self._segment_sink = self._exit_stack.enter_context(
+            self._open_segment_sink(file_path, is_new))
+        self._segment = segment
+        self._last_key = None
+        self._period_end = None
+
+    def _account(self, message_id, date, size):
+        """ Accounts for a message written into the current segment """
+        segment = self._segment
+        if not segment[SegmentManifest.COUNT]:
+            segment[SegmentManifest.FIRST_ID] = message_id
+            segment[SegmentManifest.FIRST_DATE] = format_date(date)
+            if self.period:
+                self._period_end = get_period_bounds(self.period, date)[1]
+        segment[SegmentManifest.COUNT] += 1
+        segment[SegmentManifest.TEXT_SIZE] += size
+        self._last_key = (message_id, date)
+
+    def _update_segment(self):
+        """ Puts the latest message and the file size of the current segment into its entry """
+        segment = self._segment
+        if self._last_key is not None:
+            segment[SegmentManifest.LAST_ID] = self._last_key[0]
+            segment[SegmentManifest.LAST_DATE] = format_date(self._last_key[1])
+        segment[SegmentManifest.SIZE] = os.path.getsize(self.manifest.get_file_path(segment))
+
+    def _close_segment(self):
+        exit_stack, self._exit_stack = self._exit_stack, None
+        self._segment_sink = None
+        exit_stack.close()
+        self._update_segment()
+        self._segment = None
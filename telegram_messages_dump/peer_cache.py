@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains an on-disk cache of resolved chats """
+
+import os
+import errno
+import codecs
+import json
+import logging
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+
+
+class PeerCache:
+    """ Maps chat names (as specified by user) to peer ids and access hashes.
+        The cache is kept in a JSON file next to the session file, so the chat
+        is resolved without scanning all the user's dialogs on subsequent runs.
+        E.g.:
+        {
+            "Some group title": {"type": "channel", "id": 1234567, "access_hash": -1234567},
+            "@python": {"type": "channel", "id": 7654321, "access_hash": 1234567}
+        }
+    """
+
+    PEER_TYPE = "type"
+    PEER_ID = "id"
+    ACCESS_HASH = "access_hash"
+
+    def __init__(self, cache_file_path):
+        """ constructor
+            :param cache_file_path: Path to the cache file or None to keep it in memory only
+        """
+        self.cache_file_path = cache_file_path
+        self.logger = logging.getLogger(__name__)
+        self._entries = self._loadFromFile()
+
+    def get(self, chat_name):
+        """ :return InputPeer object for a chat name or None if it is not cached """
+        entry = self._entries.get(chat_name)
+        if entry is None:
+            return None
+        try:
+            peer_type = entry[PeerCache.PEER_TYPE]
+            if peer_type == 'channel':
+                return InputPeerChannel(int(entry[PeerCache.PEER_ID]),
+                                        int(entry[PeerCache.ACCESS_HASH]))
+            if peer_type == 'chat':
+                return InputPeerChat(int(entry[PeerCache.PEER_ID]))
+            if peer_type == 'user':
+                return InputPeerUser(int(entry[PeerCache.PEER_ID]),
+                                     int(entry[PeerCache.ACCESS_HASH]))
+        except (KeyError, TypeError, ValueError):
+            pass
+        self.logger.debug('Malformed peer cache entry for "%s".', chat_name)
+        self.invalidate(chat_name)
+        return None
+
+    def put(self, chat_name, entity):
+        """ Caches id and access hash of a resolved chat """
+        try:
+            input_peer = utils.get_input_peer(entity, allow_self=False)
+        except TypeError:
+            self.logger.debug('Chat "%s" can\'t be cached.', chat_name)
+            return
+
+        if isinstance(input_peer, InputPeerChannel):
+            entry = {PeerCache.PEER_TYPE: 'channel', PeerCache.PEER_ID: input_peer.channel_id,
+                     PeerCache.ACCESS_HASH: input_peer.access_hash}
+        elif isinstance(input_peer, InputPeerChat):
+            entry = {PeerCache.PEER_TYPE: 'chat', PeerCache.PEER_ID: input_peer.chat_id}
+        elif isinstance(input_peer, InputPeerUser):
+            entry = {PeerCache.PEER_TYPE: 'user', PeerCache.PEER_ID: input_peer.user_id,
+                     PeerCache.ACCESS_HASH: input_peer.access_hash}
+        else:
+            return
+
+        if self._entries.get(chat_name) != entry:
+            self._entries[chat_name] = entry
+            self._saveToFile()
+
+    def invalidate(self, chat_name):
+        """ Removes a chat name from the cache (e.g. after it failed to resolve) """
+        if self._entries.pop(chat_name, None) is not None:
+            self._saveToFile()
+
+    def _loadFromFile(self):
+        """ Loads cache entries from file, if it exists """
+        if not self.cache_file_path:
+            return {}
+        try:
+            self.logger.debug('Load peer cache %s.', self.cache_file_path)
+            with codecs.open(self.cache_file_path, 'r', 'utf-8') as cache_file:
+                entries = json.load(cache_file)
+            if isinstance(entries, dict):
+                return entries
+            self.logger.warning('Peer cache "%s" is malformed.', self.cache_file_path)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                self.logger.warning('Unable to open the peer cache "%s". %s',
+                                    self.cache_file_path, ex.strerror)
+        except ValueError as ex:
+            self.logger.warning('Unable to load the peer cache "%s". %s',
+                                self.cache_file_path, ex)
+        return {}
+
+    def _saveToFile(self):
+        """ Saves cache entries into a file """
+        if not self.cache_file_path:
+            return
+        try:
+            self.logger.debug('Save peer cache %s.', self.cache_file_path)
+            tmp_file_path = self.cache_file_path + '.tmp'
+            with codecs.open(tmp_file_path, 'w', 'utf-8') as cache_file:
+                json.dump(self._entries, cache_file, ensure_ascii=False)
+            os.replace(tmp_file_path, self.cache_file_path)
+        except OSError as ex:
+            self.logger.warning('Failed to write the peer cache "%s". %s',
+                                self.cache_file_path, ex.strerror)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains the profiler of dumping phases (see --profile) """
+
+import os
+import codecs
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from time import monotonic
+from telegram_messages_dump.utils import format_size
+
+# Number of allocation sites listed per memory snapshot
+TOP_ALLOCATIONS_COUNT = 25
+
+# Allocations of the profiler itself are not of interest
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+class DumpProfiler:
+    """ Profiles phases of a dump with cProfile and traces memory allocations
+        with tracemalloc. Everything is saved into '<out>.profile' directory:
+            <phase>.pstats  - cProfile stats of a phase (see 'python -m pstats')
+            memory.txt      - top allocations grown in between memory snapshots.
+                              Snapshots are taken every time messages are spilled
+                              into a temp file and once the dump is finished.
+        NOTE: cProfile only sees the thread that runs a phase. Work done in thread pools
+              (e.g. temp files written in --async mode) and in --format-workers processes
+              is not included.
+    """
+
+    def __init__(self, profile_dir_path, top_count=TOP_ALLOCATIONS_COUNT):
+        """ constructor
+            :param profile_dir_path:    Directory to save the profiles into
+            :param top_count:           Number of allocation sites listed per snapshot
+        """
+        self.profile_dir_path = profile_dir_path
+        self.memory_report_path = os.path.join(profile_dir_path, 'memory.txt')
+        self.top_count = top_count
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # Phase name -> cProfile.Profile (a phase may be entered several times)
+        self._profiles = {}
+        # Phases entered and not exited yet, the innermost one is being profiled
+        self._active_phases = []
+        self._snapshot = None
+        self._snapshots_count = 0
+        self._started = monotonic()
+
+    def start(self):
+        """ Starts tracing memory allocations and takes the first snapshot """
+        os.makedirs(self.profile_dir_path, exist_ok=True)
+        # Profiles left by a previous run may have phases this run doesn't have
+        for file_name in os.listdir(self.profile_dir_path):
+            if file_name.endswith('.pstats'):
+                os.remove(os.path.join(self.profile_dir_path, file_name))
+        with codecs.open(self.memory_report_path, 'w', 'utf-8'):
+            pass
+        self._started = monotonic()
+        tracemalloc.start()
+        self._snapshot = self._take_snapshot()
+
+    @contextmanager
+    def phase(self, name):
+        """ Profiles the 'with' block as a phase of the dump.
+            Phases may be nested, the time of the inner phase is excluded from the outer one.
+        """
+        profile = self._profiles.get(name)
+        if profile is None:
+            profile = self._profiles[name] = cProfile.Profile()
+        outer = self._active_phases[-1] if self._active_phases else None
+        if outer is not None:
+            outer.disable()
+        self._active_phases.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._active_phases.pop()
+            if outer is not None:
+                outer.enable()
+
+    def on_spill(self):
+        """ Takes a memory snapshot when messages are spilled into a temp file """
+        with self._lock:
+            self._snapshots_count += 1
+            self._save_memory_diff('Spill #{}'.format(self._snapshots_count))
+
+    def stop(self):
+        """ Takes the last memory snapshot and saves the profiles of all the phases """
+        with self._lock:
+            if self._snapshot is not None:
+                self._save_memory_diff('Finished')
+                self._snapshot = None
+                tracemalloc.stop()
+
+        for name, profile in self._profiles.items():
+            profile.dump_stats(os.path.join(self.profile_dir_path, name + '.pstats'))
+
+    def _take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def _save_memory_diff(self, title):
+        """ Appends the allocation sites that grew the most since the previous snapshot
+            to the memory report
+        """
+        snapshot = self._take_snapshot()
+        stats = snapshot.compare_to(self._snapshot, 'lineno')
+        self._snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+
+        lines = ['=== {} at {:.1f} sec: {} traced, peak {} ==='.format(
+            title, monotonic() - self._started, format_size(current), format_size(peak))]
+        lines.extend(str(stat) for stat in stats[:self.top_count])
+        lines.append('')
+        try:
+            with codecs.open(self.memory_report_path, 'a', 'utf-8') as report_file:
+                report_file.write('\n'.join(lines) + '\n')
+        except OSError as ex:
+            self.logger.warning('Failed to write the memory report "%s". %s',
+                                self.memory_report_path, ex.strerror)
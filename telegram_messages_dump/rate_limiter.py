@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains an adaptive rate limiter for Telegram API requests """
+
+import random
+import logging
+from time import monotonic
+
+
+class RateLimiter:
+    """ Token bucket that paces requests to Telegram servers.
+        It speeds up while requests succeed and slows down once the server
+        responds with FloodWaitError. The rate at which the flood happened is remembered
+        and used as a soft ceiling afterwards.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    # Rate multiplier applied after every successful request
+    SPEEDUP_FACTOR = 1.1
+    # Rate multiplier applied after FloodWaitError
+    SLOWDOWN_FACTOR = 0.5
+    # Keep this far below the rate that caused the last FloodWaitError
+    FLOOD_RATE_MARGIN = 0.9
+    # The learned flood rate slowly relaxes after every successful request
+    FLOOD_RATE_RELAXATION = 1.01
+    # The first retry delay (seconds) of the exponential backoff
+    BACKOFF_BASE = 1.0
+
+    def __init__(self, rate=0.5, max_rate=3.0, min_rate=0.05, backoff_ceiling=300):
+        """ constructor
+            :param rate:            Initial rate (requests per second)
+            :param max_rate:        Rate never goes above this value
+            :param min_rate:        Rate never goes below this value
+            :param backoff_ceiling: Max number of seconds of a backoff delay
+        """
+        self.logger = logging.getLogger(__name__)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        # The default initial rate may be above the max one the user asked for
+        self.rate = self._clamp(rate)
+        self.backoff_ceiling = backoff_ceiling
+
+        # The bucket holds one token at most, so there are no bursts
+        self._tokens = 1.0
+        self._last_refill = monotonic()
+        # No requests are allowed until this moment (after FloodWaitError)
+        self._blocked_until = 0.0
+        # The rate at which the server throttled us the last time
+        self._flood_rate = None
+
+        # Stats of the decisions made
+        self.requests_count = 0
+        self.total_delay = 0.0
+        self.flood_waits_count = 0
+        self.flood_wait_seconds = 0
+        self.backoff_delay_seconds = 0.0
+        self.peak_rate = self.rate
+        self.lowest_rate = self.rate
+
+    def reserve(self):
+        """ Takes a token out of the bucket for the next request.
+
+            :return Number of seconds the caller has to sleep before sending the request
+        """
+        now = monotonic()
+        self._tokens = min(1.0, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+        # The bucket is allowed to go into debt which is paid off by the caller's sleep
+        self._tokens -= 1.0
+        delay = max(0.0, -self._tokens / self.rate, self._blocked_until - now)
+
+        self.requests_count += 1
+        self.total_delay += delay
+        return delay
+
+    def on_success(self):
+        """ Speeds up after a request was handled without FloodWaitError """
+        ceiling = self.max_rate
+        if self._flood_rate is not None:
+            self._flood_rate = min(self.max_rate,
+                                   self._flood_rate * RateLimiter.FLOOD_RATE_RELAXATION)
+            ceiling = min(ceiling, self._flood_rate * RateLimiter.FLOOD_RATE_MARGIN)
+        if self.rate < ceiling:
+            self._set_rate(min(ceiling, self.rate * RateLimiter.SPEEDUP_FACTOR))
+
+    def on_flood_wait(self, seconds, attempt):
+        """ Slows down after FloodWaitError and computes the delay before a retry.
+            :param seconds: Number of seconds the server asked to wait
+            :param attempt: Zero-based number of the retry
+
+            :return Number of seconds the caller has to sleep before retrying
+        """
+        self.flood_waits_count += 1
+        self.flood_wait_seconds += seconds
+        self._flood_rate = self.rate
+        self._set_rate(max(self.min_rate, self.rate * RateLimiter.SLOWDOWN_FACTOR))
+
+        delay = seconds + self.backoff(attempt)
+        self._blocked_until = monotonic() + delay
+        self._tokens = 0.0
+        self.logger.debug('FloodWait of %s sec. Rate is lowered to %.3f req/sec.',
+                          seconds, self.rate)
+        return delay
+
+    def backoff(self, attempt):
+        """ Exponential backoff with jitter.
+            :param attempt: Zero-based number of the retry
+
+            :return Number of seconds to sleep before retrying (capped by 'backoff_ceiling')
+        """
+        delay = min(self.backoff_ceiling, RateLimiter.BACKOFF_BASE * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        self.backoff_delay_seconds += delay
+        return delay
+
+    def summary(self):
+        """ Human readable summary of the decisions made """
+        return ('Rate limiter: {} requests, {:.1f} sec of pacing, {} FloodWaits ({} sec), '
+                '{:.1f} sec of backoff, rate {:.2f} req/sec (min {:.2f}, peak {:.2f}).'
+                .format(self.requests_count, self.total_delay, self.flood_waits_count,
+                        self.flood_wait_seconds, self.backoff_delay_seconds,
+                        self.rate, self.lowest_rate, self.peak_rate))
+
+    def _clamp(self, rate):
+        return max(self.min_rate, min(rate, self.max_rate))
+
+    def _set_rate(self, rate):
+        rate = self._clamp(rate)
+        self.rate = rate
+        self.peak_rate = max(self.peak_rate, rate)
+        self.lowest_rate = min(self.lowest_rate, rate)
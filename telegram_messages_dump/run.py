@@ -12,29 +12,72 @@ Continuous mode:
   telegram-messages-dump --continue -p <phone_num> -o <file> [-cl] [...]
   telegram-messages-dump --continue=<MSG_ID> -p <phone_num> -o <file> -e <exporter> -c <chat_name>
 
+Multi-chat mode:
+  telegram-messages-dump --manifest=<file> -p <phone_num> [-l <count>] [-e <exporter>] [...]
+
 Where:
     -c,  --chat      Unique name of a channel/chat. E.g. @python.
     -p,  --phone     Phone number. E.g. +380503211234.
     -o,  --out       Output file name or full path. (Default: telegram_<chatName>.log)
-    -e,  --exp       Exporter name. text | jsonl | csv (Default: 'text')
+    -e,  --exp       Exporter name. text | jsonl | csv | parquet | sqlite (Default: 'text')
       ,  --continue  Continue previous dump. Supports optional integer param <message_id>.
     -l,  --limit     Number of the latest messages to dump, 0 means no limit. (Default: 100)
     -cl, --clean     Clean session sensitive data (e.g. auth token) on exit. (Default: False)
     -v,  --verbose   Verbose mode. (Default: False)
       ,  --addbom    Add BOM to the beginning of the output file. (Default: False)
+      ,  --async     Fetch, format and write messages concurrently using asyncio. (Default: False)
+      ,  --stream    Fetch messages oldest first and write them without temp files.
+                     (Default: False)
+      ,  --max-rate  Max number of requests per second. Adapts to FloodWaits. (Default: 3)
+      ,  --max-backoff Max seconds of a backoff delay on top of a FloodWait. (Default: 300)
+      ,  --manifest  JSON file with a list of chats to dump concurrently over one session.
+      ,  --max-concurrent-chats  Max number of chats dumped at once in multi-chat mode.
+                                 (Default: 4)
+      ,  --fetch-workers  Number of ID ranges of a chat history fetched in parallel (with --async).
+                          (Default: 1)
+      ,  --format-workers Number of processes formatting messages (with --async). 0 means inline.
+                          (Default: 0)
+      ,  --prefetch-senders Fetch chat members in bulk before dumping to resolve senders faster.
+      ,  --compress  Compress the output file. gzip | xz | zstd
+      ,  --checkpoint Save progress periodically and resume an interrupted dump on restart.
+      ,  --follow    Keep running after the dump and append new messages of the chat
+                     as they arrive.
+      ,  --rotate-size Start a new numbered segment of the output once it reaches the size. E.g. 1G
+      ,  --rotate-count Start a new numbered segment of the output once it has that many messages.
+      ,  --rotate-period Start a new numbered segment of the output every UTC
+                         day | week | month | year.
+      ,  --index     Write an index of message ids and dates into <out>.idx to extract ranges of
+                     the output fast.
+      ,  --memory-budget Max size of messages kept in memory before they are spilled to disk.
+                         E.g. 64M (Default: 1000 messages)
+      ,  --media Download media files into a directory that stores every file once. Requires
+                 --async or --manifest.
+      ,  --media-workers Max number of media files downloaded at once. (Default: 4)
+      ,  --profile Save cProfile stats of the dumping phases and memory allocation reports into
+                   <out>.profile directory.
+      ,  --stats-json Write a JSON report with metrics of the run into a file.
+      ,  --prometheus-textfile Keep metrics of the run in a file in Prometheus text format
+                               (for node_exporter).
     -h,  --help      Show this help message and exit.
 """
 
 import os
 import sys
-import importlib
 import logging
-from telegram_messages_dump.telegram_dumper import TelegramDumper
 from telegram_messages_dump.chat_dump_settings import ChatDumpSettings
 from telegram_messages_dump.chat_dump_metadata import DumpMetadata
 from telegram_messages_dump.chat_dump_metadata import MetadataError
+from telegram_messages_dump.chat_dump_manifest import DumpManifest
+from telegram_messages_dump.exceptions import ManifestError
+from telegram_messages_dump.exceptions import ExporterError
+from telegram_messages_dump.exporter_registry import ExporterRegistry
 from telegram_messages_dump.utils import sprint
 
+# NOTE: telegram_dumper (and Telethon along with it) takes a while to import, so it is only
+#       imported once the settings are checked and a connection is about to be made.
+
+_exporter_registry = ExporterRegistry()
+
 def main():
     """ Entry point. """
     settings = ChatDumpSettings(__doc__)
@@ -46,6 +89,10 @@ def main():
     else:
         logging.basicConfig(format=default_format, level=logging.INFO)
 
+    # when user specified --manifest
+    if settings.manifest_file:
+        sys.exit(_run_many(settings))
+
     metadata = DumpMetadata(settings.out_file)
 
     # when user specified --continue
@@ -58,32 +105,36 @@ def main():
 
     exporter = _load_exporter(settings.exporter)
 
+    from telegram_messages_dump.telegram_dumper import TelegramDumper
     sys.exit(TelegramDumper(os.path.basename(__file__), settings, metadata, exporter).run())
 
+def _run_many(settings):
+    """ Dumps all the chats listed in a manifest file over one session. """
+    chat_jobs = []
+    try:
+        for chat_settings in DumpManifest(settings.manifest_file).load_chat_settings(settings):
+            metadata = DumpMetadata(chat_settings.out_file)
+            if chat_settings.is_incremental_mode:
+                metadata.merge_into_settings(chat_settings)
+            chat_jobs.append((chat_settings, metadata, _load_exporter(chat_settings.exporter)))
+    except (ManifestError, MetadataError) as ex:
+        sprint("ERROR: %s" % ex)
+        return 1
+
+    from telegram_messages_dump.telegram_dumper import TelegramDumper
+    return TelegramDumper(os.path.basename(__file__), settings, None, None).run_many(chat_jobs)
+
 def _load_exporter(exporter_name):
-    """ Loads exporter from file <exporter_name>.py in ./exporters subfolder.
+    """ Loads exporter by its name (see ExporterRegistry).
         :param exporter_name:      name of exporter. E.g. 'text' or 'json'
 
         :return: Exporter instance
     """
-    # By convention exporters are located in .\exporters subfolder
-    # COMMENT: Don't check file existance. It won't play well with pyinstaller bins
-    exporter_file_name = exporter_name + ".py"
-    exporter_rel_name = "telegram_messages_dump.exporters." + exporter_name
-    # Load exporter from file
-    sprint("Try to load exporter '%s'...  " % (exporter_file_name), end='')
-    try:
-        exporter_module = importlib.import_module(exporter_rel_name)
-        sprint("OK!")
-    except ModuleNotFoundError:
-        sprint("\nERROR: Failed to load exporter './exporters/%s'." % exporter_file_name)
-        exit(1)
-
+    sprint("Try to load exporter '%s'...  " % (exporter_name), end='')
     try:
-        exporterClass = getattr(exporter_module, exporter_name)
-    except AttributeError:
-        sprint("ERROR: Failed to load class '%s' out of './exporters/%s'." \
-               % (exporter_name, exporter_file_name))
+        exporter = _exporter_registry.load(exporter_name)
+    except ExporterError as ex:
+        sprint("\nERROR: %s" % ex)
         exit(1)
-
-    return exporterClass()
+    sprint("OK!")
+    return exporter
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" This Module contains a cache of message senders """
+
+import os
+import errno
+import codecs
+import json
+import logging
+from collections import OrderedDict
+
+
+class SenderCache:
+    """ LRU cache of senders' data keyed by 'from_id'.
+        Holds a resolved display name, a bot flag and
+        exporter specific (e.g. escaped) forms of the name.
+        Names and bot flags can be persisted in a '.senders' file next to the output file.
+    """
+
+    # Entry fields
+    NAME = 0
+    IS_BOT = 1
+    EXPORTER_FORMS = 2
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.logger = logging.getLogger(__name__)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, from_id):
+        """ :return (name, is_bot) tuple or None if there is no such sender in cache """
+        entry = self._get_entry(from_id)
+        return None if entry is None \
+            else (entry[SenderCache.NAME], entry[SenderCache.IS_BOT])
+
+    def put(self, from_id, name, is_bot):
+        """ Adds or updates a sender """
+        self._entries[from_id] = [name, is_bot, {}]
+        self._entries.move_to_end(from_id)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_exporter_form(self, from_id, exporter_name):
+        """ :return exporter specific form of the sender's name or None if it is not cached """
+        entry = self._get_entry(from_id)
+        return None if entry is None else entry[SenderCache.EXPORTER_FORMS].get(exporter_name)
+
+    def set_exporter_form(self, from_id, exporter_name, value):
+        """ Caches exporter specific form of the sender's name.
+            Does nothing if there is no such sender in cache.
+        """
+        entry = self._entries.get(from_id)
+        if entry is not None:
+            entry[SenderCache.EXPORTER_FORMS][exporter_name] = value
+
+    def load(self, file_path):
+        """ Loads senders from a file, if it exists """
+        try:
+            self.logger.debug('Load senders file %s.', file_path)
+            with codecs.open(file_path, 'r', 'utf-8') as senders_file:
+                for from_id, (name, is_bot) in json.load(senders_file).items():
+                    self.put(int(from_id), name, is_bot)
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                self.logger.warning('Unable to open the senders file "%s". %s',
+                                    file_path, ex.strerror)
+        except (ValueError, TypeError, AttributeError) as ex:
+            self.logger.warning('Unable to load the senders file "%s". %s', file_path, ex)
+
+    def save(self, file_path):
+        """ Saves senders' names and bot flags into a file """
+        try:
+            self.logger.debug('Save senders file %s.', file_path)
+            tmp_file_path = file_path + '.tmp'
+            with codecs.open(tmp_file_path, 'w', 'utf-8') as senders_file:
+                json.dump({str(from_id): entry[:SenderCache.EXPORTER_FORMS]
+                           for from_id, entry in self._entries.items()},
+                          senders_file, ensure_ascii=False)
+            os.replace(tmp_file_path, file_path)
+        except OSError as ex:
+            self.logger.warning('Failed to write the senders file "%s". %s',
+                                file_path, ex.strerror)
+
+    def _get_entry(self, from_id):
+        entry = self._entries.get(from_id)
+        if entry is not None:
+            self._entries.move_to_end(from_id)
+        return entry
@@ -7,23 +7,84 @@
 import os
 import os.path
 import sys
+import copy
+import signal
 import codecs
 import tempfile
 import logging
+import asyncio
 from collections import deque
+from contextlib import contextmanager
 from getpass import getpass
-from time import sleep
+from time import sleep, perf_counter, monotonic
 from telethon import TelegramClient, sync # pylint: disable=unused-import
+from telethon import utils
+from telethon import events
+from telethon.helpers import TotalList
 from telethon.errors import (FloodWaitError,
+                             RPCError,
                              SessionPasswordNeededError,
                              UsernameNotOccupiedError,
                              UsernameInvalidError)
 from telethon.tl.functions.contacts import ResolveUsernameRequest
+from telethon.tl.types import InputPeerChannel
 from telegram_messages_dump.utils import sprint
 from telegram_messages_dump.utils import JOIN_CHAT_PREFIX_URL
 from telegram_messages_dump.exceptions import DumpingError
 from telegram_messages_dump.exceptions import MetadataError
 from telegram_messages_dump.exporter_context import ExporterContext
+from telegram_messages_dump.chat_dump_checkpoint import DumpCheckpoint
+from telegram_messages_dump.rate_limiter import RateLimiter
+from telegram_messages_dump.formatting_pool import FormattingPool
+from telegram_messages_dump.message_buffer import MemoryBudget
+from telegram_messages_dump.message_buffer import MessageBuffer
+from telegram_messages_dump.metrics import DumpMetrics
+from telegram_messages_dump.metrics import save_stats_json
+from telegram_messages_dump.metrics import save_prometheus_textfile
+from telegram_messages_dump.profiler import DumpProfiler
+from telegram_messages_dump.media_store import MediaStore
+from telegram_messages_dump.media_store import MediaDownloader
+from telegram_messages_dump.output_segments import SegmentManifest
+from telegram_messages_dump.output_segments import SegmentedOutput
+from telegram_messages_dump.output_segments import get_message_keys
+from telegram_messages_dump.output_segments import get_line_keys_file_path
+from telegram_messages_dump.output_segments import save_line_keys
+from telegram_messages_dump.output_index import IndexWriter
+from telegram_messages_dump.output_index import IndexedOutput
+from telegram_messages_dump.output_index import build_index
+from telegram_messages_dump.output_index import get_index_file_path
+from telegram_messages_dump.formatting_pool import format_messages
+from telegram_messages_dump.sender_cache import SenderCache
+from telegram_messages_dump.peer_cache import PeerCache
+from telegram_messages_dump.exporters.common import common
+from telegram_messages_dump.exporters.common import MessageRecord
+from telegram_messages_dump.exporters.sink import text_file_sink
+from telegram_messages_dump.compression import ParallelCompressor
+from telegram_messages_dump.compression import compressed_file_sink
+
+# Max number of pages waiting in between stages of the asyncio pipeline
+PIPELINE_QUEUE_SIZE = 10
+
+# Min number of messages per worker when fetching history in parallel
+PARTITION_MIN_SIZE = 1000
+
+# Min number of messages written in between checkpoints in stream mode
+STREAM_CHECKPOINT_SIZE = 1000
+
+# Min number of seconds in between updates of the Prometheus textfile during a dump
+STATS_UPDATE_INTERVAL = 10
+
+# Number of seconds new messages are collected for before they are written at once (--follow)
+FOLLOW_COMMIT_DELAY = 1
+
+# Number of seconds in between checks of the connection while following a chat
+FOLLOW_TICK_INTERVAL = 5
+
+# Min number of seconds in between saves of the latest message id while following a chat
+FOLLOW_CHECKPOINT_INTERVAL = 10
+
+# Number of seconds after which chat history is polled for messages whose updates were lost
+FOLLOW_POLL_INTERVAL = 300
 
 
 class TelegramDumper(TelegramClient):
@@ -39,6 +100,42 @@ class TelegramDumper(TelegramClient):
                          timeout=40, #seconds
                          proxy=None)
 
+        self._init_chat_state(settings, metadata, exporter)
+
+        # Chats resolved by the previous runs. It is kept next to the session file.
+        session_file = getattr(self.session, 'filename', None)
+        self.peer_cache = PeerCache(
+            os.path.splitext(session_file)[0] + '.peers.json' if session_file else None)
+
+        # Paces requests to avoid flood ban.
+        # NOTE: it is shared by all the chats when dumping several chats at once
+        self.rate_limiter = RateLimiter(max_rate=self.settings.max_rate,
+                                        backoff_ceiling=self.settings.max_backoff)
+
+        # Decides when buffered messages are spilled into temp files (shared as well)
+        self.memory_budget = MemoryBudget(self.settings.memory_budget)
+
+        # Counters and timers of the run (shared as well)
+        self.metrics = DumpMetrics()
+
+        # Profiler of the dumping phases (if user asked to, shared as well)
+        self.profiler = DumpProfiler(
+            (self.settings.manifest_file or self.settings.out_file) + '.profile') \
+            if self.settings.is_profile else None
+
+        # Downloads media files (if user asked to, shared as well,
+        # so a file posted in several chats is downloaded once)
+        self.media_downloader = MediaDownloader(
+            self, MediaStore(self.settings.media_dir), self.settings.media_workers,
+            self.rate_limiter, self.metrics) if self.settings.media_dir else None
+
+        # Worker processes that format messages (shared by all the chats as well)
+        self.formatting_pool = FormattingPool(self.settings.format_workers) \
+            if self.settings.format_workers > 0 else None
+
+    def _init_chat_state(self, settings, metadata, exporter):
+        """ Initializes everything related to the chat being dumped """
+
         # Settings as specified by user or defaults or from metadata
         self.settings = settings
 
@@ -52,6 +149,11 @@ class TelegramDumper(TelegramClient):
         self.exporter_context = ExporterContext()
         self.exporter_context.is_continue_mode = self.settings.is_incremental_mode
 
+        # Names of the chat members that were already resolved
+        self.sender_cache = SenderCache()
+        self.exporter_context.sender_cache = self.sender_cache
+        self.exporter_context.media_dir = self.settings.media_dir or None
+
         # How many massages user wants to be dumped
         # explicit --limit, or default of 100 or unlimited (int.Max)
         self.msg_count_to_process = 0
@@ -62,20 +164,50 @@ class TelegramDumper(TelegramClient):
         # A list of paths to the temp files
         self.temp_files_list = deque()
 
+        # Progress of the dump that is saved periodically (if user asked to)
+        self.checkpoint = DumpCheckpoint(self.settings.out_file) \
+            if self.settings.is_checkpoint else None
+
+        # Progress of an interrupted run this one resumes from (or None)
+        self.resume_state = None
+
+        # Numbered segments the resulting file is rotated into (if user asked to)
+        self.segments = SegmentManifest(self.settings.out_file) \
+            if self.settings.rotate_size or self.settings.rotate_count \
+            or self.settings.rotate_period else None
+
+        # True if keys of the messages (see 'get_message_keys') have to be passed
+        # along with the formatted messages all the way to the resulting file
+        self.is_keyed_output = self.segments is not None or self.settings.is_indexed
+
+        # Size of the resulting file before this run started writing into it
+        self.output_size = 0
+
         # Actual lattets message id that was prossessed since the dumper started running
         self.cur_latest_message_id = self.settings.last_message_id
 
         # The number of messages written into a resulting file de-facto
         self.output_total_count = 0
 
+        # Progress of the chat (see DumpMetrics), it is tracked once the dump is prepared
+        self.progress = None
+
+        # Set when new messages arrive while following the chat (see --follow)
+        self._follow_wakeup = None
+        # True if chat history has to be polled for the messages whose updates were lost
+        self._is_catch_up_needed = False
+
     def run(self):
         """ Dumps all desired chat messages into a file """
 
         ret_code = 0
+        self._start_profiling()
         try:
-            self._init_connect()
+            with self._profile('connect'):
+                self._init_connect()
             try:
-                chatObj = self._getChannel()
+                with self._profile('get_channel'):
+                    chatObj = self._getChannel()
             except ValueError as ex:
                 ret_code = 1
                 self.logger.error('%s', ex,
@@ -83,6 +215,8 @@ class TelegramDumper(TelegramClient):
                 return
             # Fetch history in chunks and save it into a resulting file
             self._do_dump(chatObj)
+            if self.settings.is_follow_mode:
+                self._follow_chat(chatObj)
         except (DumpingError, MetadataError) as ex:
             self.logger.error('%s', ex, exc_info=self.logger.level > logging.INFO)
             ret_code = 1
@@ -94,14 +228,182 @@ class TelegramDumper(TelegramClient):
                               exc_info=self.logger.level > logging.INFO)
             ret_code = 1
         finally:
-            self.logger.debug('Make sure there are no temp files left undeleted.')
-            # Clear temp files if any
-            while self.temp_files_list:
+            self._delete_temp_files()
+            self._close_formatting_pool()
+            self._close_media_downloader()
+            self._update_written_count()
+            self._stop_profiling()
+
+        self._clean_session()
+
+        sprint('{} messages were successfully written in the resulting file. Done!'
+               .format(self.output_total_count))
+        sprint(self.rate_limiter.summary())
+        sprint(self.memory_budget.summary())
+        if self.media_downloader:
+            sprint(self.media_downloader.summary())
+        sprint(self.metrics.summary())
+        self._save_stats(ret_code)
+        return ret_code
+
+    def run_many(self, chat_jobs):
+        """ Dumps several chats concurrently over one connection.
+            All the chats share one rate limiter, so the global request budget is the same
+            as for a single chat. Each chat has at most one request waiting for its turn
+            and the turns are granted in FIFO order, which keeps chats equally served.
+            :param chat_jobs:   list of (settings, metadata, exporter) tuples, one per chat
+
+            :return 0 if all the chats were dumped successfully, 1 otherwise
+        """
+        ret_code = 0
+        chat_dumpers = []
+        self._start_profiling()
+        try:
+            with self._profile('connect'):
+                self._init_connect()
+
+            # Resolve chats and check output files one by one
+            # as it may require user's interaction
+            prepared_dumps = []
+            for settings, metadata, exporter in chat_jobs:
+                chat_dumper = self._fork(settings, metadata, exporter)
+                chat_dumpers.append(chat_dumper)
                 try:
-                    os.remove(self.temp_files_list.pop().name)
-                except Exception:  # pylint: disable=broad-except
-                    pass
+                    with self._profile('get_channel'):
+                        chatObj = chat_dumper._getChannel()
+                    buffer, temp_files_list_meta = chat_dumper._prepare_dump()
+                    chat_dumper._prefetch_senders(chatObj)
+                except (ValueError, DumpingError, MetadataError) as ex:
+                    ret_code = 1
+                    self.logger.error('Chat "%s": %s', settings.chat_name, ex,
+                                      exc_info=self.logger.level > logging.INFO)
+                    continue
+                prepared_dumps.append((chat_dumper, chatObj, buffer, temp_files_list_meta))
+
+            # Fetch histories of all the chats concurrently
+            # (chats are merged in a thread pool, so the profile of this phase
+            # doesn't include merging)
+            semaphore = asyncio.Semaphore(self.settings.max_concurrent_chats)
+            with self._profile('fetch'):
+                results = self.loop.run_until_complete(asyncio.gather(
+                    *[chat_dumper._dump_chat_async(
+                        chatObj, buffer, temp_files_list_meta, semaphore)
+                      for chat_dumper, chatObj, buffer, temp_files_list_meta
+                      in prepared_dumps]))
+            if not all(results):
+                ret_code = 1
+        except KeyboardInterrupt:
+            sprint("Received a user's request to interrupt, stopping…")
+            ret_code = 1
+        except Exception as ex:  # pylint: disable=broad-except
+            self.logger.error('Uncaught exception occured. %s', ex,
+                              exc_info=self.logger.level > logging.INFO)
+            ret_code = 1
+        finally:
+            for chat_dumper in chat_dumpers:
+                chat_dumper._delete_temp_files()
+                chat_dumper._update_written_count()
+            self._close_formatting_pool()
+            self._close_media_downloader()
+            self._stop_profiling()
+
+        self._clean_session()
+
+        sprint('{} messages were successfully written in {} resulting files. Done!'
+               .format(sum(d.output_total_count for d in chat_dumpers), len(chat_dumpers)))
+        sprint(self.rate_limiter.summary())
+        sprint(self.memory_budget.summary())
+        if self.media_downloader:
+            sprint(self.media_downloader.summary())
+        sprint(self.metrics.summary())
+        self._save_stats(ret_code)
+        return ret_code
+
+    def _fork(self, settings, metadata, exporter):
+        """ Creates a dumper for another chat. It is a shallow copy of this one,
+            so it shares the connection and the rate limiter, but has its own chat state.
+        """
+        chat_dumper = copy.copy(self)
+        chat_dumper._init_chat_state(settings, metadata, exporter)
+        return chat_dumper
+
+    async def _dump_chat_async(self, peer, buffer, temp_files_list_meta, semaphore):
+        """ Dumps one chat as a part of a multi-chat run.
+
+            :return True on success, False otherwise
+        """
+        async with semaphore:
+            try:
+                await self._dump_pipeline(peer, buffer, temp_files_list_meta)
+                # Merging may take a while, don't block other chats
+                await self.loop.run_in_executor(
+                    None, self._finish_dump, buffer, temp_files_list_meta)
+            except Exception as ex:  # pylint: disable=broad-except
+                self.logger.error('Chat "%s": %s', self.settings.chat_name, ex,
+                                  exc_info=self.logger.level > logging.INFO)
+                return False
+        sprint('{} messages of "{}" were successfully written into "{}".'
+               .format(self.output_total_count, self.settings.chat_name,
+                       self.settings.out_file))
+        return True
+
+    def _delete_temp_files(self):
+        """ Make sure there are no temp files left undeleted """
+        if self.checkpoint is not None:
+            # They are segment files of the checkpoint, the next run resumes from them
+            self.temp_files_list.clear()
+            return
+        self.logger.debug('Make sure there are no temp files left undeleted.')
+        # Clear temp files if any
+        while self.temp_files_list:
+            try:
+                self._remove_temp_file(self.temp_files_list.pop())
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+    def _close_formatting_pool(self):
+        """ Stop formatting worker processes if any """
+        if self.formatting_pool:
+            self.formatting_pool.close()
+            self.formatting_pool = None
+
+    def _close_media_downloader(self):
+        """ Stops media downloads left (if any) and saves the media manifest """
+        if self.media_downloader:
+            self.loop.run_until_complete(self.media_downloader.close())
+
+    def _start_profiling(self):
+        """ Starts tracing memory allocations (if user asked to) """
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.start()
+        except OSError as ex:
+            self.logger.warning('Unable to start profiling. %s', ex)
+            self.profiler = None
+
+    def _stop_profiling(self):
+        """ Saves the profiles (if user asked to) """
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.stop()
+            sprint('Profiles are saved into "{}" directory.'
+                   .format(self.profiler.profile_dir_path))
+        except OSError as ex:
+            self.logger.warning('Failed to save the profiles. %s', ex)
+
+    @contextmanager
+    def _profile(self, phase):
+        """ Profiles the 'with' block as a phase of the dump (if user asked to) """
+        if self.profiler is None:
+            yield
+            return
+        with self.profiler.phase(phase):
+            yield
 
+    def _clean_session(self):
+        """ Clean session sensitive data if user asked to """
         if self.settings.is_clean:
             try:
                 # TODO
@@ -110,10 +412,6 @@ class TelegramDumper(TelegramClient):
             except Exception:  # pylint: disable=broad-except
                 sprint('Failed to logout and clean session data.')
 
-        sprint('{} messages were successfully written in the resulting file. Done!'
-               .format(self.output_total_count))
-        return ret_code
-
     def _init_connect(self):
         """ Connect to the Telegram server and Authenticate. """
         sprint('Connecting to Telegram servers...')
@@ -137,10 +435,56 @@ class TelegramDumper(TelegramClient):
 
     def _getChannel(self):
         """ Returns telethon.tl.types.Channel object resolved from chat_name
-            at Telegram server
+            at Telegram server or from the peer cache
         """
         name = self.settings.chat_name
 
+        peer = self._get_cached_channel(name)
+        if peer:
+            return peer
+
+        peer = self._resolve_channel(name)
+        self.peer_cache.put(name, peer)
+        return peer
+
+    def _get_cached_channel(self, name):
+        """ Resolves chat_name with the peer cache.
+            The cached peer is checked with a single request. It is removed from the cache
+            if it is no longer accessible or its title/username doesn't match anymore.
+
+            :return Chat/Channel/User object or None if there is no valid cache entry
+        """
+        input_peer = self.peer_cache.get(name)
+        if input_peer is None:
+            return None
+        try:
+            peer = self.get_entity(input_peer)
+        except (ValueError, RPCError) as ex:
+            self.logger.debug('Cached peer of "%s" failed to resolve. %s', name, ex)
+            peer = None
+
+        if peer is None or not self._is_name_of(name, peer):
+            self.logger.debug('Cached peer of "%s" is invalidated.', name)
+            self.peer_cache.invalidate(name)
+            return None
+
+        sprint('Chat name "{}" resolved from cache into channel id={}'.format(name, peer.id))
+        return peer
+
+    @staticmethod
+    def _is_name_of(name, peer):
+        """ Checks if chat_name still refers to a peer """
+        # Invitation links can't be checked without joining
+        if name.startswith(JOIN_CHAT_PREFIX_URL):
+            return True
+        username = getattr(peer, 'username', None)
+        if name.startswith('@'):
+            return username == name[1:]
+        return utils.get_display_name(peer) == name or username == name
+
+    def _resolve_channel(self, name):
+        """ Resolves chat_name at Telegram server """
+
         # For private channуls try to resolve channel peer object from its invitation link
         # Note: it will only work if the login user has already joined the private channel.
         # Otherwise, get_entity will throw ValueError
@@ -178,13 +522,11 @@ class TelegramDumper(TelegramClient):
                                   exc_info=self.logger.level > logging.INFO)
 
         # Search in dialogs first, this way we will find private groups and
-        # channels.
+        # channels. Dialogs are fetched page by page until the first match.
         self.logger.debug('Fetch loggedin user`s dialogs')
-        dialogs_count = self.get_dialogs(0).total
-        self.logger.info('%s user`s dialogs found', dialogs_count)
-        dialogs = self.get_dialogs(limit=None)
-        self.logger.debug('%s dialogs fetched.', len(dialogs))
-        for dialog in dialogs:
+        dialogs_count = 0
+        for dialog in self.iter_dialogs():
+            dialogs_count += 1
             if dialog.name == name:
                 sprint('Dialog title "{}" resolved into channel id={}'.format(
                     name, dialog.entity.id))
@@ -197,7 +539,7 @@ class TelegramDumper(TelegramClient):
                 sprint('Dialog username "{}" resolved into channel id={}'.format(
                     name, dialog.entity.id))
                 return dialog.entity
-        self.logger.debug('Specified chat name was not found among dialogs.')
+        self.logger.debug('Specified chat name was not found among %s dialogs.', dialogs_count)
 
         raise ValueError('Failed to resolve dialogue/chat name "{}".'.format(name))
 
@@ -209,57 +551,415 @@ class TelegramDumper(TelegramClient):
             :return The latest/biggest Message ID that successfully went into buffer,
                     or -1 if there are no more messages.
         """
+        # First retrieve the messages and some information
+        messages = self._get_messages(peer, limit=100, offset_id=self.id_offset)
+
+        latest_message_id = self._get_latest_message_id(messages)
+        selected = self._select_new_messages(messages)
+        buffer.extend(self._format_messages(
+            selected, self.msg_count_to_process == 0), self._get_message_keys(selected))
+
+        return latest_message_id
+
+    def _get_messages(self, peer, **kwargs):
+        """ Retrieves a page of messages. Makes 5 attempts in case of FloodWaitError.
+            :param peer:        Chat/Channel object
+            :param kwargs:      Arguments of TelegramClient.get_messages
+
+            :return A page of messages as a list of MessageRecord (with 'total' attribute)
+        """
         messages = []
 
-        # First retrieve the messages and some information
         # make 5 attempts
-        for _ in range(0, 5):
+        for attempt in range(0, 5):
+            if attempt > 0:
+                self.metrics.count("retries")
+            # wait for a few seconds to avoid flood ban
+            delay = self.rate_limiter.reserve()
+            self.metrics.add_time("pacing", delay)
+            sleep(delay)
             try:
                 # NOTE: Telethon will make 5 attempts to reconnect
                 # before failing
-                messages = self.get_messages(
-                    peer, limit=100, offset_id=self.id_offset)
+                with self.metrics.measure("network"):
+                    messages = self.get_messages(peer, **kwargs)
 
                 if messages.total > 0 and messages:
-                    sprint('Processing messages with ids {}-{} ...'
-                           .format(messages[0].id, messages[-1].id))
+                    self._on_page_fetched(messages)
             except FloodWaitError as ex:
-                sprint('FloodWaitError detected. Sleep for {} sec before reconnecting! \n'
-                       .format(ex.seconds))
-                sleep(ex.seconds)
+                delay = self.rate_limiter.on_flood_wait(ex.seconds, attempt)
+                self.metrics.count("flood_waits")
+                self.metrics.add_time("flood_wait", delay)
+                sprint('FloodWaitError detected. Sleep for {:.0f} sec before reconnecting! \n'
+                       .format(delay))
+                sleep(delay)
                 self._init_connect()
                 continue
+            self.rate_limiter.on_success()
             break
+        return self._to_records(messages)
+
+    def _on_page_fetched(self, messages):
+        """ Updates the metrics and reports the progress after a page of messages is received.
+            :param messages:    A page of messages (with 'total' attribute)
+        """
+        self.metrics.on_page(self.progress, len(messages), messages.total,
+                             None if self.settings.is_incremental_mode
+                             else self.msg_count_to_process)
+        self._update_written_count()
+        sprint('Processing messages with ids {}-{} ... {}'
+               .format(messages[0].id, messages[-1].id, self.progress.summary()))
+
+        if self.settings.prometheus_file and self.metrics.is_due(STATS_UPDATE_INTERVAL):
+            self._save_stats()
+
+    def _update_written_count(self):
+        """ Reports the number of messages written so far to the metrics """
+        if self.progress is not None:
+            self.progress.written_count = self.output_total_count
+
+    def _get_stats(self, ret_code=None):
+        """ :param ret_code:    Exit code of the run, or None if it is still running
+
+            :return dict with the stats of the run (see --stats-json)
+        """
+        stats = self.metrics.to_dict()
+        stats["return_code"] = ret_code
+        stats["rate_limiter"] = {
+            "requests": self.rate_limiter.requests_count,
+            "pacing_seconds": self.rate_limiter.total_delay,
+            "flood_waits": self.rate_limiter.flood_waits_count,
+            "flood_wait_seconds": self.rate_limiter.flood_wait_seconds,
+            "backoff_seconds": self.rate_limiter.backoff_delay_seconds,
+            "rate": self.rate_limiter.rate,
+        }
+        stats["memory"] = {
+            "budget_bytes": self.memory_budget.budget_bytes,
+            "peak_buffered_bytes": self.memory_budget.peak_buffered_bytes,
+            "temp_files": self.memory_budget.segments_count,
+        }
+        return stats
+
+    def _save_stats(self, ret_code=None):
+        """ Writes the stats of the run into --stats-json and --prometheus-textfile files
+            (if user asked to). A failure is not fatal as the dump itself is not affected.
+            :param ret_code:    Exit code of the run, or None if it is still running
+        """
+        stats = self._get_stats(ret_code)
+        for file_path, save in ((self.settings.stats_json_file, save_stats_json),
+                                (self.settings.prometheus_file, save_prometheus_textfile)):
+            # The report is written once the run is finished
+            if not file_path or (save is save_stats_json and ret_code is None):
+                continue
+            try:
+                save(file_path, stats)
+            except OSError as ex:
+                self.logger.warning('Failed to write stats into "%s". %s', file_path, ex)
 
-        latest_message_id = -1 \
+    def _get_latest_message_id(self, messages):
+        """ :return The latest/biggest Message ID of a freshly fetched page,
+                    or -1 if there are no new messages in it.
+        """
+        return -1 \
             if not messages or self.settings.last_message_id >= messages[0].id \
             else messages[0].id
 
-        # Iterate over all (in reverse order so the latest appear
-        # the last in the console) and print them with format provided by exporter.
-        for msg in messages:
-            self.exporter_context.is_first_record = \
-                self.msg_count_to_process == 1
+    def _select_new_messages(self, messages):
+        """ Picks the messages that have to be dumped out of a freshly fetched page
+            according to --limit and --continue settings. Advances 'id_offset'.
+            :param messages:    A page of messages (newest first)
 
+            :return list of messages to be dumped (newest first)
+        """
+        selected = []
+        for msg in messages:
             if self.settings.last_message_id >= msg.id:
                 self.msg_count_to_process = 0
                 break
 
-            msg_dump_str = self.exporter.format(msg, self.exporter_context)
-
-            buffer.append(msg_dump_str)
+            selected.append(msg)
 
             self.msg_count_to_process -= 1
             self.id_offset = msg.id
-            self.exporter_context.is_last_record = False
             if self.msg_count_to_process == 0:
                 break
+        return selected
 
-        return latest_message_id
+    def _get_message_keys(self, messages):
+        """ :return Keys of messages if the output needs them (see 'is_keyed_output'),
+                    None otherwise
+        """
+        return get_message_keys(messages) if self.is_keyed_output else None
+
+    def _format_messages(self, messages, is_last_page):
+        """ Converts messages into strings with format provided by exporter.
+            :param messages:        A list of messages (newest first)
+            :param is_last_page:    True if there will be no more messages to format
+
+            :return list of formatted strings (newest first)
+        """
+        with self.metrics.measure("format"):
+            return format_messages(
+                self.exporter, self.exporter_context, messages, is_last_page)
+
+    def _format_messages_async(self, messages, is_last_page):
+        """ Same as '_format_messages' but runs in the formatting pool if there is one.
+
+            :return awaitable resulting in a list of formatted strings (newest first)
+        """
+        if self.formatting_pool:
+            # Time a batch spends in the pool, including waiting for a free worker
+            submitted = perf_counter()
+            future = self.formatting_pool.submit(
+                self.exporter, self.exporter_context, messages, is_last_page)
+            future.add_done_callback(
+                lambda _: self.metrics.add_time("format", perf_counter() - submitted))
+            return future
+        future = self.loop.create_future()
+        future.set_result(self._format_messages(messages, is_last_page))
+        return future
+
+    async def _dump_pipeline(self, peer, buffer, temp_files_list_meta):
+        """ Asyncio flavour of the fetch loop in '_do_dump'.
+            Fetching, formatting and writing are run as separate tasks connected
+            with bounded queues. So the next page is being requested while the previous
+            one is being formatted and flushed.
+
+            :param peer:                 Chat/Channel object
+            :param buffer:               buffer where to place formatted messages
+            :param temp_files_list_meta: a list of meta info about batches
+        """
+        if self.settings.fetch_workers > 1 and self.msg_count_to_process == sys.maxsize:
+            await self._dump_partitioned(peer, temp_files_list_meta)
+            return
+
+        pages = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        formatted_pages = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        tasks = [
+            asyncio.ensure_future(self._fetch_stage(peer, pages)),
+            asyncio.ensure_future(self._format_stage(pages, formatted_pages)),
+            asyncio.ensure_future(
+                self._write_stage(formatted_pages, buffer, temp_files_list_meta))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _dump_partitioned(self, peer, temp_files_list_meta):
+        """ Splits the message ID space of the chat into ranges and fetches them
+            concurrently. Every range is fetched newest first by its own worker
+            and spilled into its own temp files.
+            The ranges don't overlap, so concatenating their temp files in ascending order
+            of the ranges gives the same result as merging them by message ID would.
+
+            :param peer:                 Chat/Channel object
+            :param temp_files_list_meta: a list of meta info about batches
+        """
+        head = await self._get_messages_async(peer, limit=1)
+        min_id = max(self.settings.last_message_id, 0)
+        if not head or head[0].id <= min_id:
+            return
+        max_id = head[0].id
+
+        # Don't split small histories into too many tiny ranges
+        workers_count = max(1, min(self.settings.fetch_workers,
+                                   head.total // PARTITION_MIN_SIZE))
+        step = -(-(max_id - min_id) // workers_count)
+        ranges = [(low, min(low + step, max_id))
+                  for low in range(min_id, max_id, step)]
+        self.logger.debug('Fetching message ids %s-%s in %s ranges.',
+                          min_id + 1, max_id, len(ranges))
+
+        ranges_temp_files = await asyncio.gather(
+            *[self._fetch_range(peer, low, high) for low, high in ranges])
+
+        # Temp files are merged from the right end, i.e. starting from the oldest range
+        self.temp_files_list.clear()
+        for range_temp_files in ranges_temp_files[::-1]:
+            for tf_name, batch_latest_message_id in range_temp_files:
+                self.temp_files_list.append(tf_name)
+                temp_files_list_meta.append(batch_latest_message_id)
+
+        if self.cur_latest_message_id < max_id:
+            self.cur_latest_message_id = max_id
+
+    async def _fetch_range(self, peer, min_id, max_id):
+        """ Retrieves messages with IDs in (min_id, max_id] range newest first,
+            formats them and spills them into temp files.
+
+            :return list of (temp file path, the latest message ID in it) tuples, newest first
+        """
+        range_temp_files = []
+        buffer = MessageBuffer(self.memory_budget, self.is_keyed_output)
+        batch_latest_message_id = -1
+        offset_id = max_id + 1
+        try:
+            while True:
+                messages = await self._get_messages_async(
+                    peer, limit=100, offset_id=offset_id, min_id=min_id)
+                if not messages:
+                    break
+                if not buffer:
+                    batch_latest_message_id = messages[0].id
+                downloads = self._download_media(messages, messages)
+                records = await self._attach_media(messages, downloads)
+                buffer.extend(await self._format_messages_async(records, False),
+                              self._get_message_keys(records))
+                offset_id = messages[-1].id
+
+                if buffer.is_full():
+                    range_temp_files.append(
+                        (await self._flush_buffer_in_temp_file_async(buffer),
+                         batch_latest_message_id))
+        except RuntimeError as ex:
+            sprint('Fetching messages from server failed. ' + str(ex))
+            sprint('Warn: The resulting file will contain partial/incomplete data.')
+
+        if buffer:
+            range_temp_files.append(
+                (await self._flush_buffer_in_temp_file_async(buffer), batch_latest_message_id))
+        return range_temp_files
+
+    async def _fetch_stage(self, peer, pages):
+        """ Pipeline stage. Retrieves pages of messages and puts them in 'pages' queue.
+            Puts None when done.
+        """
+        try:
+            while self.msg_count_to_process > 0:
+                messages = await self._get_messages_async(
+                    peer, limit=100, offset_id=self.id_offset)
+                latest_message_id_fetched = self._get_latest_message_id(messages)
+                selected = self._select_new_messages(messages)
+                # Media files are downloaded while the next pages are being fetched
+                downloads = self._download_media(messages, selected)
+                # This stage runs ahead of the others, so the progress is passed along
+                await pages.put((selected, downloads, latest_message_id_fetched,
+                                 self.msg_count_to_process == 0, self._get_fetch_progress()))
+
+                # break if the very beginning of channel history is reached
+                if latest_message_id_fetched == -1 or self.id_offset <= 1:
+                    break
+        except RuntimeError as ex:
+            sprint('Fetching messages from server failed. ' + str(ex))
+            sprint('Warn: The resulting file will contain partial/incomplete data.')
+        await pages.put(None)
+
+    async def _get_messages_async(self, peer, **kwargs):
+        """ Asyncio flavour of '_get_messages'.
+            Retrieves a page of messages. Makes 5 attempts in case of FloodWaitError.
+            :param peer:        Chat/Channel object
+            :param kwargs:      Arguments of TelegramClient.get_messages
+
+            :return A page of messages as a list of MessageRecord (with 'total' attribute)
+        """
+        messages = []
+        for attempt in range(0, 5):
+            if attempt > 0:
+                self.metrics.count("retries")
+            # wait for a few seconds to avoid flood ban
+            delay = self.rate_limiter.reserve()
+            self.metrics.add_time("pacing", delay)
+            await asyncio.sleep(delay)
+            try:
+                with self.metrics.measure("network"):
+                    messages = await self.get_messages(peer, **kwargs)
+
+                if messages.total > 0 and messages:
+                    self._on_page_fetched(messages)
+            except FloodWaitError as ex:
+                delay = self.rate_limiter.on_flood_wait(ex.seconds, attempt)
+                self.metrics.count("flood_waits")
+                self.metrics.add_time("flood_wait", delay)
+                sprint('FloodWaitError detected. Sleep for {:.0f} sec before reconnecting! \n'
+                       .format(delay))
+                await asyncio.sleep(delay)
+                await self.connect()
+                continue
+            self.rate_limiter.on_success()
+            break
+        return self._to_records(messages)
+
+    def _to_records(self, messages):
+        """ Extracts the data exporters need out of raw messages,
+            so the rest of the dumping process doesn't hold Telethon objects.
+        """
+        sender_cache = self.sender_cache
+        records = TotalList(MessageRecord.from_message(msg, sender_cache) for msg in messages)
+        records.total = getattr(messages, 'total', len(records))
+        if self.media_downloader:
+            # Kept until the media of the messages to dump is scheduled for download
+            records.media = {msg.id: msg.media for msg in messages
+                             if getattr(msg, 'media', None) is not None}
+        return records
+
+    def _download_media(self, messages, selected):
+        """ Schedules downloads of the media files of messages (if user asked to).
+            :param messages:    A freshly fetched page (see '_get_messages_async')
+            :param selected:    Messages of the page to be dumped
+
+            :return dict of message ID -> future resulting in the path of the stored file
+        """
+        media = getattr(messages, 'media', None)
+        if not media or not selected:
+            return {}
+        return {msg.id: self.media_downloader.submit(media[msg.id])
+                for msg in selected if msg.id in media}
+
+    async def _attach_media(self, messages, downloads):
+        """ Waits for the media files of messages to be downloaded
+            and refers to them in the records.
+            :param messages:    A list of MessageRecord
+            :param downloads:   See '_download_media'
+
+            :return list of MessageRecord
+        """
+        if not downloads:
+            return messages
+        file_paths = dict(zip(downloads, await asyncio.gather(*downloads.values())))
+        return [msg._replace(media_path=file_paths[msg.id]) if file_paths.get(msg.id) else msg
+                for msg in messages]
+
+    async def _format_stage(self, pages, formatted_pages):
+        """ Pipeline stage. Formats pages of messages from 'pages' queue
+            and puts the results in 'formatted_pages' queue. Puts None when done.
+            The results are futures, so several pages may be formatted at once
+            when there is a formatting pool.
+        """
+        while True:
+            page = await pages.get()
+            if page is None:
+                break
+            selected, downloads, latest_message_id_fetched, is_last_page, progress = page
+            selected = await self._attach_media(selected, downloads)
+            await formatted_pages.put(
+                (self._format_messages_async(selected, is_last_page),
+                 self._get_message_keys(selected), latest_message_id_fetched, progress))
+        await formatted_pages.put(None)
+
+    async def _write_stage(self, formatted_pages, buffer, temp_files_list_meta):
+        """ Pipeline stage. Moves formatted messages into 'buffer'
+            and flushes it into temp files in a background thread.
+        """
+        while True:
+            page = await formatted_pages.get()
+            if page is None:
+                break
+            lines, keys, latest_message_id_fetched, progress = page
+            buffer.extend(await lines, keys)
+
+            if self.cur_latest_message_id < latest_message_id_fetched:
+                self.cur_latest_message_id = latest_message_id_fetched
+            if buffer.is_full():
+                await self._flush_buffer_in_temp_file_async(buffer)
+                temp_files_list_meta.append(latest_message_id_fetched)
+                self._save_checkpoint(temp_files_list_meta, **progress)
 
     def _do_dump(self, peer):
         """ Retrieves messages in small chunks (Default: 100) and saves them in in-memory 'buffer'.
-            When buffer reaches '1000' messages they are saved into intermediate temp file.
+            When buffer reaches '1000' messages (or --memory-budget bytes) they are saved into
+            intermediate temp file.
             In the end messages from all the temp files are being moved into resulting file in
             ascending order along with the remaining ones in 'buffer'.
             After all, temp files are deleted.
@@ -268,36 +968,420 @@ class TelegramDumper(TelegramClient):
 
              :return  Number of files that were saved into resulting file
         """
+        buffer, temp_files_list_meta = self._prepare_dump()
+        self._prefetch_senders(peer)
+
+        if self.settings.is_stream_mode:
+            # Messages are written into the resulting file as they are fetched
+            with self._profile('fetch'):
+                self._stream_dump(peer)
+            self._save_metadata()
+            return
+
+        # process messages until either all message count requested by user are retrieved
+        # or offset_id reaches msg_id=1 - the head of a channel message history
+        with self._profile('fetch'):
+            if self.settings.is_async_mode:
+                self.loop.run_until_complete(
+                    self._dump_pipeline(peer, buffer, temp_files_list_meta))
+            else:
+                self._fetch_loop(peer, buffer, temp_files_list_meta)
+
+        with self._profile('merge'):
+            self._finish_dump(buffer, temp_files_list_meta)
+
+    def _prepare_dump(self):
+        """ Checks preconditions and sets up the state for fetching.
+
+            :return (buffer, temp_files_list_meta) tuple
+        """
         self.msg_count_to_process = self.settings.limit \
             if self.settings.limit != -1\
             and not self.settings.limit == 0\
             and not self.settings.is_incremental_mode\
             else sys.maxsize
 
+        if self.checkpoint is not None:
+            self.resume_state = self.checkpoint.load(self.settings)
+
         self._check_preconditions()
 
+        if self.media_downloader:
+            try:
+                self.media_downloader.store.open()
+            except OSError as ex:
+                raise DumpingError('Unable to open the media directory "{}". {}'
+                                   .format(self.settings.media_dir, ex.strerror)) from ex
+
         # Current buffer of messages, that will be batched into a temp file
         # or otherwise written directly into the resulting file if there are too few of them
-        # to form a batch of size 1000.
-        buffer = deque()
+        # to form a batch (of size 1000 or --memory-budget bytes).
+        buffer = MessageBuffer(self.memory_budget, self.is_keyed_output)
 
         # Delete old metafile in Continue mode
         if not self.settings.is_incremental_mode:
             self.metadata.delete_meta_file()
+        else:
+            # Senders that were resolved by the previous runs
+            self.sender_cache.load(self._get_senders_file_path())
 
         temp_files_list_meta = deque()  # a list of meta info about batches
 
-        # process messages until either all message count requested by user are retrieved
-        # or offset_id reaches msg_id=1 - the head of a channel message history
+        if self.checkpoint is not None:
+            self._init_checkpoint(temp_files_list_meta)
+
+        self.progress = self.metrics.add_chat(
+            self.settings.chat_name, self.settings.out_file, self.output_total_count)
+
+        return buffer, temp_files_list_meta
+
+    def _init_checkpoint(self, temp_files_list_meta):
+        """ Restores the progress of an interrupted run from its checkpoint if there is one.
+            Otherwise starts a new checkpoint.
+        """
+        has_text_output = not hasattr(self.exporter, 'open_sink') \
+            and os.path.isfile(self.settings.out_file)
+        state = self.resume_state
+        if state is None:
+            self.checkpoint.discard()
+            self.checkpoint.prepare_segments_dir(None)
+            if self.settings.is_incremental_mode and has_text_output:
+                self.output_size = os.path.getsize(self.settings.out_file)
+            # So the resulting file is truncated back if the run dies while writing it
+            # (stream mode saves the first checkpoint once the preamble is written)
+            if not self.settings.is_stream_mode:
+                self._save_checkpoint(temp_files_list_meta, **self._get_fetch_progress())
+            return
+
+        sprint('Resuming the interrupted dump from "{}" ...'
+               .format(self.checkpoint.checkpoint_file_path))
+        self.checkpoint.prepare_segments_dir(state)
+        self.msg_count_to_process = state["msg_count_to_process"]
+        self.id_offset = state.get("id_offset", 0)
+        self.cur_latest_message_id = state["cur_latest_message_id"]
+        self.output_total_count = state["output_total_count"]
+        self.output_size = state["output_size"]
+        for tf_name, batch_latest_message_id in state[DumpCheckpoint.SEGMENTS]:
+            self.temp_files_list.append(tf_name)
+            temp_files_list_meta.append(batch_latest_message_id)
+
+        # Drop whatever the interrupted run managed to write after the checkpoint
+        if has_text_output:
+            with open(self.settings.out_file, 'r+b') as resulting_file:
+                resulting_file.truncate(self.output_size)
+
+    def _get_fetch_progress(self):
+        """ :return the position of the fetch loop in chat history (see '_save_checkpoint') """
+        return {"id_offset": self.id_offset,
+                "msg_count_to_process": self.msg_count_to_process}
+
+    def _save_checkpoint(self, temp_files_list_meta=(), **progress):
+        """ Saves the progress of the dump (if user asked to).
+            Must be called when every fetched message is either in a temp file or
+            in the resulting file, i.e. not in the buffer.
+            :param temp_files_list_meta:    a list of meta info about batches
+            :param progress:                position in chat history to resume fetching from
+        """
+        if self.checkpoint is None:
+            return
+        state = {
+            "cur_latest_message_id": self.cur_latest_message_id,
+            "output_total_count": self.output_total_count,
+            "output_size": self.output_size,
+            DumpCheckpoint.SEGMENTS: list(zip(self.temp_files_list, temp_files_list_meta))
+        }
+        state.update(progress)
+        self.checkpoint.save(self.settings, state)
+
+    def _finish_dump(self, buffer, temp_files_list_meta):
+        """ Writes the resulting file and the metadata file """
+        # Write all chunks into resulting file
+        sprint('Merging results into an output file.')
         try:
-            while self.msg_count_to_process > 0:
-                # slip for a few seconds to avoid flood ban
-                sleep(2)
+            self._write_final_file(buffer, temp_files_list_meta)
+        except OSError as ex:
+            raise DumpingError("Dumping to a final file failed.") from ex
+
+        self._save_metadata()
+
+    def _save_metadata(self):
+        """ Writes the metadata file """
+        # Metadata that will be written into a metafile
+        meta_dict = {
+            "latest_message_id": self.cur_latest_message_id,
+            "exporter_name": self.settings.exporter,
+            "chat_name": self.settings.chat_name,
+            "compression": self.settings.compress
+        }
+        if self.segments is not None:
+            meta_dict["rotation"] = {"size": self.settings.rotate_size,
+                                     "count": self.settings.rotate_count,
+                                     "period": self.settings.rotate_period}
+        if self.settings.is_indexed:
+            meta_dict["index"] = True
+        self.metadata.save_meta_file(meta_dict)
+        self.sender_cache.save(self._get_senders_file_path())
+
+        # The dump is complete, so there is nothing to resume
+        if self.checkpoint is not None:
+            self.checkpoint.discard()
+
+    def _get_senders_file_path(self):
+        """ :return path of the file that keeps the sender cache between runs """
+        return self.settings.out_file + '.senders'
+
+    def _prefetch_senders(self, peer):
+        """ Warms the sender cache up with the chat members (if user asked to).
+            Members are fetched in bulk, which is cheaper than resolving senders one by one.
+            Failures are not fatal as the senders are resolved from messages anyway.
+             :param peer: Chat/Channel object that contains the message history of interest
+        """
+        if not self.settings.is_prefetch_senders:
+            return
+        sprint('Prefetching chat members…')
+        try:
+            for user in self.iter_participants(peer, aggressive=True):
+                name, is_bot = common.get_sender_data(user)
+                self.sender_cache.put(user.id, name, is_bot)
+        except Exception as ex:  # pylint: disable=broad-except
+            self.logger.warning('Unable to prefetch chat members. %s', ex)
+        self.logger.info('%d senders are cached.', len(self.sender_cache))
+
+    def _stream_dump(self, peer):
+        """ Walks chat history from the oldest to the newest message and writes every
+            formatted message straight into the resulting file, so no temp files are needed.
+             :param peer: Chat/Channel object that contains the message history of interest
+        """
+        is_resumed = self.resume_state is not None
+        if is_resumed:
+            min_id = self.resume_state["min_id"]
+        else:
+            # The ID of the newest message that is NOT to be dumped
+            min_id = max(self.settings.last_message_id, 0)
+            if self.msg_count_to_process != sys.maxsize:
+                # Find the oldest one among the latest 'limit' messages
+                oldest = self._get_messages(
+                    peer, limit=1, add_offset=self.msg_count_to_process - 1)
+                if oldest:
+                    min_id = oldest[0].id - 1
+
+        try:
+            with self._open_final_file(is_resumed) as resulting_file:
+                is_first_page = not is_resumed
+                count_since_checkpoint = 0 if is_resumed else STREAM_CHECKPOINT_SIZE
+                while self.msg_count_to_process > 0:
+                    if self.checkpoint is not None \
+                            and count_since_checkpoint >= STREAM_CHECKPOINT_SIZE:
+                        self.output_size = resulting_file.sync()
+                        self._save_checkpoint(
+                            min_id=min_id, msg_count_to_process=self.msg_count_to_process)
+                        count_since_checkpoint = 0
+
+                    # Messages go in ascending order
+                    messages = self._get_messages(
+                        peer, limit=100, min_id=min_id, reverse=True)
+                    if not messages:
+                        break
+
+                    page = messages[:self.msg_count_to_process]
+                    # Exporters take messages newest first
+                    lines = self._format_messages(page[::-1], is_first_page)
+                    lines.reverse()
+                    with self.metrics.measure("merge"):
+                        resulting_file.write_keyed_lines(lines, self._get_message_keys(page))
+                    is_first_page = False
+                    self.output_total_count += len(page)
+                    self.cur_latest_message_id = page[-1].id
+                    self.msg_count_to_process -= len(page)
+                    min_id = messages[-1].id
+                    count_since_checkpoint += len(page)
+        except OSError as ex:
+            raise DumpingError("Dumping to a final file failed.") from ex
+        except RuntimeError as ex:
+            sprint('Fetching messages from server failed. ' + str(ex))
+            sprint('Warn: The resulting file will contain partial/incomplete data.')
+
+    def _follow_chat(self, peer):
+        """ Keeps the connection open and appends new messages of the chat to the resulting
+            file as they arrive, until user interrupts it (Ctrl+C or SIGTERM).
+             :param peer: Chat/Channel object that contains the message history of interest
+        """
+        sprint('Following new messages of the chat. Press Ctrl+C to stop.')
+        # From now on every write appends to the resulting file
+        self.settings.last_message_id = self.cur_latest_message_id
+        self.exporter_context.is_continue_mode = True
+
+        task = self.loop.create_task(self._follow(peer))
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            # Windows
+            pass
+        try:
+            self.loop.run_until_complete(task)
+        except KeyboardInterrupt:
+            task.cancel()
+            try:
+                self.loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+        except asyncio.CancelledError:
+            pass
+        finally:
+            try:
+                self.loop.remove_signal_handler(signal.SIGTERM)
+            except (NotImplementedError, RuntimeError):
+                pass
+        sprint('Stopped following the chat.')
+
+    async def _follow(self, peer):
+        """ Subscribes to new messages of the chat and writes them in batches
+            (one write and fsync per batch). Chat history is polled for the messages
+            posted while the connection was down, whose updates never arrive.
+        """
+        # Message ID -> new message received as an update, not written yet
+        new_messages = {}
+        wakeup = asyncio.Event()
+
+        async def on_new_message(event):
+            from_id = getattr(event.message, 'from_id', None)
+            if from_id is not None and self.sender_cache.get(from_id) is None:
+                try:
+                    await event.get_sender()
+                except Exception as ex:  # pylint: disable=broad-except
+                    self.logger.debug('Unable to get the sender of message %s. %s',
+                                      event.message.id, ex)
+            new_messages[event.message.id] = event.message
+            wakeup.set()
+
+        event_filter = events.NewMessage(chats=peer)
+        self.add_event_handler(on_new_message, event_filter)
+        self._follow_wakeup = wakeup
+        # IDs of channel messages go one by one, so a gap means an update was lost
+        try:
+            is_channel = isinstance(utils.get_input_peer(peer), InputPeerChannel)
+        except TypeError:
+            is_channel = False
+        # Messages posted since the dump fetched the history are caught up first
+        caught_up_at = None
+        saved_latest_message_id, saved_at = self.cur_latest_message_id, monotonic()
+        try:
+            while True:
+                if not self.is_connected():
+                    sprint('Connection to Telegram servers is lost, reconnecting…')
+                    try:
+                        await self.connect()
+                    except (OSError, ConnectionError) as ex:
+                        self.logger.warning('Failed to reconnect. %s', ex)
+                        await asyncio.sleep(FOLLOW_TICK_INTERVAL)
+                        continue
+                    self._is_catch_up_needed = True
+                if is_channel and new_messages \
+                        and min(new_messages) > self.cur_latest_message_id + 1:
+                    self._is_catch_up_needed = True
 
+                if self._is_catch_up_needed or caught_up_at is None \
+                        or monotonic() - caught_up_at >= FOLLOW_POLL_INTERVAL:
+                    self._is_catch_up_needed = False
+                    await self._catch_up(peer)
+                    caught_up_at = monotonic()
+
+                await self._append_updates(new_messages)
+
+                if self.cur_latest_message_id != saved_latest_message_id \
+                        and monotonic() - saved_at >= FOLLOW_CHECKPOINT_INTERVAL:
+                    self._save_metadata()
+                    saved_latest_message_id, saved_at = self.cur_latest_message_id, monotonic()
+                if self.settings.prometheus_file and self.metrics.is_due(STATS_UPDATE_INTERVAL):
+                    self._save_stats()
+
+                try:
+                    await asyncio.wait_for(wakeup.wait(), FOLLOW_TICK_INTERVAL)
+                    # Group commit: let a burst of messages gather into one write
+                    await asyncio.sleep(FOLLOW_COMMIT_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+                wakeup.clear()
+        finally:
+            self.remove_event_handler(on_new_message, event_filter)
+            self._follow_wakeup = None
+            await self._append_updates(new_messages)
+            if self.cur_latest_message_id != saved_latest_message_id:
+                self._save_metadata()
+
+    async def _handle_auto_reconnect(self):
+        """ Telethon's hook called once the connection is restored.
+            Updates sent while it was down are lost, so history has to be caught up with.
+        """
+        await super()._handle_auto_reconnect()
+        if self._follow_wakeup is not None:
+            self._is_catch_up_needed = True
+            self._follow_wakeup.set()
+
+    async def _catch_up(self, peer):
+        """ Fetches the messages newer than the latest one written and appends them """
+        try:
+            while True:
+                messages = await self._get_messages_async(
+                    peer, limit=100, min_id=max(self.cur_latest_message_id, 0), reverse=True)
+                if not messages:
+                    break
+                await self._append_new_messages(messages)
+                if len(messages) < 100:
+                    break
+        except (RuntimeError, RPCError, OSError, ConnectionError) as ex:
+            # Caught up with on the next attempt
+            self.logger.warning('Failed to catch up with chat history. %s', ex)
+            self._is_catch_up_needed = True
+
+    async def _append_updates(self, new_messages):
+        """ Appends the new messages received as updates, unless they are written already
+            (e.g. by catching up with history).
+            :param new_messages: dict of message ID -> raw message, it is cleared
+        """
+        messages = [new_messages[msg_id] for msg_id in sorted(new_messages)
+                    if msg_id > self.cur_latest_message_id]
+        new_messages.clear()
+        if messages:
+            self.metrics.count("messages_fetched", len(messages))
+            await self._append_new_messages(self._to_records(messages))
+
+    async def _append_new_messages(self, messages):
+        """ Formats new messages and appends them to the resulting file at once.
+            :param messages: A list of MessageRecord (oldest first)
+        """
+        if not messages:
+            return
+        messages = await self._attach_media(
+            messages, self._download_media(messages, messages))
+        # Exporters take messages newest first
+        lines = self._format_messages(messages[::-1], False)
+        lines.reverse()
+        try:
+            with self.metrics.measure("merge"), \
+                    self._open_final_file(is_resumed=True) as resulting_file:
+                resulting_file.write_keyed_lines(lines, self._get_message_keys(messages))
+                resulting_file.sync()
+        except OSError as ex:
+            raise DumpingError("Appending to the final file failed.") from ex
+
+        self.output_total_count += len(messages)
+        self.cur_latest_message_id = messages[-1].id
+        self._update_written_count()
+        sprint('{} new messages with ids {}-{} were written.'
+               .format(len(messages), messages[0].id, messages[-1].id))
+
+    def _fetch_loop(self, peer, buffer, temp_files_list_meta):
+        """ Retrieves messages page by page until either all message count requested
+            by user are retrieved or offset_id reaches msg_id=1 - the head of a channel
+            message history.
+        """
+        try:
+            while self.msg_count_to_process > 0:
                 latest_message_id_fetched = self._fetch_messages_from_server(
                     peer, buffer)
 
-                # This is for the case when buffer with fewer than 1000 records
+                # This is for the case when buffer with fewer than a batch of records
                 # Relies on the fact that `_fetch_messages_from_server` returns messages
                 # in reverse order
                 if self.cur_latest_message_id < latest_message_id_fetched:
@@ -305,9 +1389,10 @@ class TelegramDumper(TelegramClient):
                 # when buffer is full, flush it into a temp file
                 # Assume that once a message got into temp file it will be counted as successful
                 # 'output_total_count'. This has to be improved.
-                if len(buffer) >= 1000:
+                if buffer.is_full():
                     self._flush_buffer_in_temp_file(buffer)
                     temp_files_list_meta.append(latest_message_id_fetched)
+                    self._save_checkpoint(temp_files_list_meta, **self._get_fetch_progress())
 
                 # break if the very beginning of channel history is reached
                 if latest_message_id_fetched == -1 or self.id_offset <= 1:
@@ -316,27 +1401,46 @@ class TelegramDumper(TelegramClient):
             sprint('Fetching messages from server failed. ' + str(ex))
             sprint('Warn: The resulting file will contain partial/incomplete data.')
 
-        # Write all chunks into resulting file
-        sprint('Merging results into an output file.')
-        try:
-            self._write_final_file(buffer, temp_files_list_meta)
-        except OSError as ex:
-            raise DumpingError("Dumping to a final file failed.") from ex
-
-        # Metadata that will be written into a metafile
-        meta_dict = {
-            "latest_message_id": self.cur_latest_message_id,
-            "exporter_name": self.settings.exporter,
-            "chat_name": self.settings.chat_name
-        }
-        self.metadata.save_meta_file(meta_dict)
-
     def _flush_buffer_in_temp_file(self, buffer):
         """ Flush buffer into a new temp file """
-        with tempfile \
-                .NamedTemporaryFile(mode='w+', encoding='utf-8', delete=False) as tf:
-            self.output_total_count += self._flush_buffer_into_filestream(buffer, tf)
-            self.temp_files_list.append(tf)
+        self.output_total_count += len(buffer)
+        self.memory_budget.on_spilled()
+        if self.profiler is not None:
+            self.profiler.on_spill()
+        if buffer.keys is not None:
+            return self._write_temp_file(*buffer.take())
+        return self._write_temp_file(buffer)
+
+    async def _flush_buffer_in_temp_file_async(self, buffer):
+        """ Flush buffer into a new temp file in a background thread """
+        batch, keys = buffer.take()
+        self.output_total_count += len(batch)
+        self.memory_budget.on_spilled()
+        if self.profiler is not None:
+            self.profiler.on_spill()
+        return await self.loop.run_in_executor(None, self._write_temp_file, batch, keys)
+
+    def _write_temp_file(self, buffer, keys=None):
+        """ Moves buffer content into a new temp file.
+            Keys of the messages (if any) are saved next to it (see 'save_line_keys').
+            Thread-safe as long as buffer is not shared.
+
+            :return temp file path
+        """
+        # Checkpointed temp files are kept next to the resulting file to survive a crash
+        temp_dir = self.checkpoint.segments_dir_path if self.checkpoint is not None else None
+        with self.metrics.measure("spill"), tempfile.NamedTemporaryFile(
+                mode='w+', encoding='utf-8', delete=False, dir=temp_dir) as tf:
+            if keys is None:
+                self._flush_buffer_into_filestream(buffer, tf)
+            else:
+                save_line_keys(tf.name, self._flush_keyed_buffer_into_filestream(buffer, keys, tf))
+            tf.flush()
+            if self.checkpoint is not None:
+                os.fsync(tf.fileno())
+            self.metrics.count("spill_bytes", os.fstat(tf.fileno()).st_size)
+            self.temp_files_list.append(tf.name)
+        return tf.name
 
     def _flush_buffer_into_filestream(self, buffer, file_stream):
         """ Flush buffer into a file stream """
@@ -347,18 +1451,169 @@ class TelegramDumper(TelegramClient):
             print(cur_message, file=file_stream)
         return count
 
-    def _write_final_file(self, buffer, temp_files_list_meta):
-        result_file_mode = 'a' if self.settings.last_message_id > -1 else 'w'
-        with codecs.open(self.settings.out_file, result_file_mode, 'utf-8') as resulting_file:
-            if self.settings.is_addbom:
-                resulting_file.write(codecs.BOM_UTF8.decode())
+    def _flush_keyed_buffer_into_filestream(self, buffer, keys, file_stream):
+        """ Same as '_flush_buffer_into_filestream', but for a buffer with keys of messages
 
-            self.exporter.begin_final_file(
-                resulting_file, self.exporter_context)
+            :return list of (message id, unix time, size of the line in bytes)
+                    of the lines written
+        """
+        line_keys = []
+        while buffer:
+            cur_message = buffer.pop()
+            message_id, date = keys.pop()
+            print(cur_message, file=file_stream)
+            line_keys.append((message_id, date, len(cur_message.encode('utf-8')) + 1))
+        return line_keys
+
+    def _remove_temp_file(self, tf_name):
+        """ Deletes a temp file along with the keys of its messages (if any) """
+        os.remove(tf_name)
+        if self.is_keyed_output:
+            try:
+                os.remove(get_line_keys_file_path(tf_name))
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _open_final_file(self, is_resumed=False):
+        """ Opens the resulting file and writes its preamble.
+            Exporters with their own output (see exporters/sink.py) open it themselves.
+            A rotated output (see output_segments.py) opens its segment files one by one.
+            :param is_resumed:  True if the file already has the messages
+                                of an interrupted run, so they are appended to
+
+            :return sink to write formatted messages into (oldest first)
+        """
+        open_sink = getattr(self.exporter, 'open_sink', None)
+        if open_sink is not None:
+            exporter_sink = open_sink(self.settings.out_file, self.exporter_context)
+            try:
+                yield exporter_sink
+            finally:
+                exporter_sink.close()
+            return
+
+        if self.segments is not None:
+            # The last segment is appended to, the new ones get their own preamble
+            output = SegmentedOutput(
+                self.segments,
+                lambda file_path, is_new: self._open_text_file(
+                    file_path, not is_new, is_resumed and not is_new),
+                self.settings.rotate_size, self.settings.rotate_count,
+                self.settings.rotate_period)
+            try:
+                yield output
+            finally:
+                output.close()
+            return
+
+        is_appended = is_resumed or self.settings.last_message_id > -1
+        with self._open_text_file(self.settings.out_file, is_appended, is_resumed) \
+                as resulting_file:
+            yield resulting_file
 
+    @contextmanager
+    def _open_text_file(self, file_path, is_appended, is_resumed=False):
+        """ Opens a text (or compressed, see --compress) file for the resulting messages
+            and writes its preamble.
+            :param file_path:   Path of the resulting file (or of a segment of it)
+            :param is_appended: True to append to the file rather than overwrite it
+            :param is_resumed:  True if the file already has the messages
+                                of an interrupted run, so they are appended to
+
+            :return sink to write formatted messages into (oldest first)
+        """
+        exporter_context = self.exporter_context
+        if not is_appended and exporter_context.is_continue_mode:
+            # A new segment of a rotated file starts with its own header
+            exporter_context = copy.copy(exporter_context)
+            exporter_context.is_continue_mode = False
+
+        if self.settings.compress:
+            with self._open_compressed_final_file(
+                    file_path, is_appended, exporter_context, is_resumed) as resulting_file:
+                yield resulting_file
+            return
+
+        index_writer = self._open_index(file_path, is_appended)
+        try:
+            result_file_mode = 'a' if is_appended else 'w'
+            with codecs.open(file_path, result_file_mode, 'utf-8') as resulting_file:
+                if not is_resumed:
+                    if self.settings.is_addbom:
+                        resulting_file.write(codecs.BOM_UTF8.decode())
+
+                    self.exporter.begin_final_file(
+                        resulting_file, exporter_context)
+
+                if index_writer is None:
+                    yield text_file_sink(resulting_file)
+                else:
+                    yield IndexedOutput(text_file_sink(resulting_file), index_writer,
+                                        resulting_file.stream.tell())
+        finally:
+            if index_writer is not None:
+                index_writer.close()
+
+    def _open_index(self, file_path, is_appended):
+        """ Opens the index of a text file for the resulting messages (see --index).
+            The index of a file that is appended to is built first if the file has none
+            (e.g. it was dumped without --index). The index of a file that is overwritten
+            without --index is deleted, so it doesn't outlive the file.
+            :param file_path:   Path of the resulting file (or of a segment of it)
+            :param is_appended: True if the file is appended to rather than overwritten
+
+            :return IndexWriter or None if the file is not indexed
+        """
+        index_file_path = get_index_file_path(file_path)
+        if not self.settings.is_indexed:
+            if not is_appended:
+                try:
+                    os.remove(index_file_path)
+                except FileNotFoundError:
+                    pass
+            return None
+
+        index_writer = IndexWriter(index_file_path)
+        if not is_appended or not os.path.isfile(file_path):
+            return index_writer.create()
+        if index_writer.open_appended(os.path.getsize(file_path)):
+            return index_writer
+        sprint('Indexing "{}" ...'.format(file_path))
+        index_writer.create()
+        try:
+            build_index(file_path, self.exporter.parse_message_key, index_writer)
+        except Exception:
+            index_writer.close()
+            raise
+        return index_writer
+
+    @contextmanager
+    def _open_compressed_final_file(self, file_path, is_appended, exporter_context,
+                                    is_resumed=False):
+        """ Same as '_open_text_file' but compresses the resulting file.
+            In continue mode new data is appended as a new gzip member/xz stream/zstd frame.
+        """
+        result_file_mode = 'ab' if is_appended else 'wb'
+        with open(file_path, result_file_mode) as raw_file, \
+                ParallelCompressor(raw_file, self.settings.compress) as compressor:
+            resulting_file = codecs.getwriter('utf-8')(compressor)
+            if not is_resumed:
+                if self.settings.is_addbom:
+                    resulting_file.write(codecs.BOM_UTF8.decode())
+
+                self.exporter.begin_final_file(
+                    resulting_file, exporter_context)
+
+            yield compressed_file_sink(resulting_file, compressor)
+
+    def _write_final_file(self, buffer, temp_files_list_meta):
+        with self.metrics.measure("merge"), self._open_final_file() as resulting_file:
             # flush what's left in the mem buffer into resulting file
-            self.output_total_count += self._flush_buffer_into_filestream(
-                buffer, resulting_file)
+            self.output_total_count += len(buffer)
+            resulting_file.write_keyed_lines(
+                reversed(buffer), reversed(buffer.keys) if buffer.keys is not None else None)
+            buffer.clear()
 
             self._merge_temp_files_into_final(
                 resulting_file, temp_files_list_meta)
@@ -366,14 +1621,14 @@ class TelegramDumper(TelegramClient):
     def _merge_temp_files_into_final(self, resulting_file, temp_files_list_meta):
         """ merge all temp files into final one and delete them """
         while self.temp_files_list:
-            tf = self.temp_files_list.pop()
-            with codecs.open(tf.name, 'r', 'utf-8') as ctf:
-                for line in ctf.readlines():
-                    print(line, file=resulting_file, end='')
+            tf_name = self.temp_files_list.pop()
+            self.metrics.count("merge_bytes", os.path.getsize(tf_name))
+            resulting_file.append_temp_file(tf_name)
             # delete temp file
-            self.logger.debug("Delete temp file %s", tf.name)
-            tf.close()
-            os.remove(tf.name)
+            # (segment files of a checkpoint are needed until the resulting file is complete)
+            if self.checkpoint is None:
+                self.logger.debug("Delete temp file %s", tf_name)
+                self._remove_temp_file(tf_name)
             # update the latest_message_id metadata
             batch_latest_message_id = temp_files_list_meta.pop()
             if batch_latest_message_id > self.cur_latest_message_id:
@@ -382,32 +1637,77 @@ class TelegramDumper(TelegramClient):
     def _check_preconditions(self):
         """ Check preconditions before processing data """
         out_file_path = self.settings.out_file
+        if self.settings.compress and hasattr(self.exporter, 'open_sink'):
+            raise DumpingError('Error: "{}" exporter can\'t be used with --compress.'
+                               .format(self.settings.exporter))
+        if self.segments is not None and hasattr(self.exporter, 'open_sink'):
+            raise DumpingError('Error: "{}" exporter can\'t be used with --rotate-size, '
+                               '--rotate-count or --rotate-period.'
+                               .format(self.settings.exporter))
+        if self.settings.is_indexed and (hasattr(self.exporter, 'open_sink')
+                                         or not hasattr(self.exporter, 'parse_message_key')):
+            raise DumpingError('Error: "{}" exporter can\'t be used with --index.'
+                               .format(self.settings.exporter))
+        if self.settings.is_indexed and self.settings.compress:
+            raise DumpingError('Error: --index requires an uncompressed output.')
+        if self.checkpoint is not None and self.settings.is_stream_mode \
+                and (self.settings.compress or hasattr(self.exporter, 'open_sink')):
+            raise DumpingError('Error: --checkpoint in --stream mode requires '
+                               'an uncompressed text output.')
         if self.settings.is_incremental_mode:
             # In incrimental mode
             sprint('Switching to incremental mode.')
             self.logger.debug('Checking if output file exists.')
-            if not os.path.exists(out_file_path):
+            if self.segments is not None:
+                # The output is rotated, so it is the manifest of its segments that exists
+                self._load_segments()
+            elif not os.path.exists(out_file_path):
                 raise DumpingError(
                     'Error: Output file does not exist. Path="' + out_file_path + '"')
             sprint('Dumping messages newer than {} using "{}" dumper.'
                    .format(self.settings.last_message_id, self.settings.exporter))
+        elif self.resume_state is not None:
+            # The output file belongs to the interrupted run
+            sprint('Dumping {} messages into "{}" file ...'
+                   .format('all' if self.msg_count_to_process == sys.maxsize
+                           else self.msg_count_to_process, out_file_path))
         else:
             # In NONE-incrimental mode
-            if os.path.exists(out_file_path):
+            if os.path.exists(out_file_path if self.segments is None
+                              else self.segments.manifest_file_path):
                 sprint('Warning: The output file already exists.')
                 if not self._is_user_confirmed('Are you sure you want to overwrite it? [y/n]'):
                     raise DumpingError("Terminating on user's request...")
             # Check if output file can be created/overwritten
-            try:
-                with open(out_file_path, mode='w+'):
-                    pass
-            except OSError as ex:
-                raise DumpingError('Output file path "{}" is invalid. {}'.format(
-                    out_file_path, ex.strerror))
+            # (exporters with their own output do it on their own)
+            if self.segments is not None:
+                try:
+                    self.segments.reset()
+                except OSError as ex:
+                    raise DumpingError('Output file path "{}" is invalid. {}'.format(
+                        out_file_path, ex.strerror))
+            elif not hasattr(self.exporter, 'open_sink'):
+                try:
+                    with open(out_file_path, mode='w+'):
+                        pass
+                except OSError as ex:
+                    raise DumpingError('Output file path "{}" is invalid. {}'.format(
+                        out_file_path, ex.strerror))
             sprint('Dumping {} messages into "{}" file ...'
                    .format('all' if self.msg_count_to_process == sys.maxsize
                            else self.msg_count_to_process, out_file_path))
 
+    def _load_segments(self):
+        """ Loads the manifest of the segments of a rotated output in --continue mode """
+        try:
+            self.segments.load()
+        except OSError as ex:
+            raise DumpingError('Error: Unable to open the segment manifest "{}". {}'
+                               .format(self.segments.manifest_file_path, ex.strerror)) from ex
+        except ValueError as ex:
+            raise DumpingError('Error: Unable to load the segment manifest "{}". {}'
+                               .format(self.segments.manifest_file_path, ex)) from ex
+
     def _is_user_confirmed(self, msg):
         """ Get confirmation from user """
         if self.settings.is_quiet_mode:
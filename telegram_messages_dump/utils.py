@@ -2,6 +2,14 @@
 # -*- coding: utf-8 -*-
 """ Various utility functions/classes """
 
+import os
+import re
+import shutil
+
+# Buffer size for copying files in user space when in-kernel copying is not available
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
 def sprint(string, *args, **kwargs):
     """Safe Print (handle UnicodeEncodeErrors on some terminals)"""
     try:
@@ -12,4 +20,88 @@ def sprint(string, *args, **kwargs):
         print(string, *args, **kwargs)
 
 
+def append_file(src_path, dst_file):
+    """ Appends the content of a file to a binary file object as is.
+        Uses in-kernel copying (copy_file_range/sendfile) where it is available
+        and falls back to copying with a large buffer otherwise.
+        Memory usage doesn't depend on the file size.
+        :param src_path:    Path of the file to be appended
+        :param dst_file:    Binary file object opened for writing at its end
+
+        :return Number of bytes copied
+    """
+    dst_file.flush()
+    with open(src_path, 'rb') as src_file:
+        size = os.fstat(src_file.fileno()).st_size
+        copied = 0
+        try:
+            dst_fd = dst_file.fileno()
+        except (AttributeError, OSError, ValueError):
+            dst_fd = None
+
+        if dst_fd is not None:
+            for kernel_copy in _KERNEL_COPY_FUNCS:
+                try:
+                    while copied < size:
+                        sent = kernel_copy(src_file.fileno(), dst_fd, copied, size - copied)
+                        if sent == 0:
+                            break
+                        copied += sent
+                except OSError:
+                    # Not supported for this pair of files (e.g. O_APPEND, cross-fs),
+                    # try the next way starting from the same offset
+                    continue
+                break
+            # Buffered file object has to learn its new position
+            dst_file.seek(0, os.SEEK_END)
+
+        if copied < size:
+            src_file.seek(copied)
+            shutil.copyfileobj(src_file, dst_file, COPY_BUFFER_SIZE)
+            copied = size
+    return copied
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+_KERNEL_COPY_FUNCS = [func for func, name in ((_copy_file_range, 'copy_file_range'),
+                                              (_sendfile, 'sendfile'))
+                      if hasattr(os, name)]
+
+
+_SIZE_UNITS = ['B', 'KiB', 'MiB', 'GiB', 'TiB']
+
+_SIZE_RE = re.compile(r'^(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?$')
+
+
+def parse_size(string):
+    """ Parses a size in bytes with an optional suffix. E.g. '65536', '512K', '64M', '1G'
+
+        :return Number of bytes
+        :raises ValueError: if the string is not a size
+    """
+    match = _SIZE_RE.match(string.strip().upper())
+    if not match:
+        raise ValueError('Invalid size "{}"'.format(string))
+    number, suffix = match.groups()
+    return int(float(number) * 1024 ** ('KMGT'.index(suffix) + 1 if suffix else 0))
+
+
+def format_size(size):
+    """ :return Human readable size. E.g. '64.0 MiB' """
+    for unit in _SIZE_UNITS[:-1]:
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    else:
+        unit = _SIZE_UNITS[-1]
+    return '{:.1f} {}'.format(size, unit) if unit != 'B' else '{} B'.format(size)
+
+
 JOIN_CHAT_PREFIX_URL = 'https://t.me/joinchat/'
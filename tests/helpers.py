@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Helpers of the tests that dump a synthetic chat with a fake Telegram client """
+
+import os
+import sys
+from unittest import mock
+from contextlib import redirect_stdout
+from benchmarks.synthetic import FakeTelegramDumper
+from telegram_messages_dump import run
+from telegram_messages_dump.chat_dump_settings import ChatDumpSettings
+from telegram_messages_dump.chat_dump_metadata import DumpMetadata
+from telegram_messages_dump.exporter_registry import ExporterRegistry
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXPORTERS = ('text', 'csv', 'jsonl')
+
+
+def get_settings(out_file, exporter_name, *dumper_args):
+    """ :return ChatDumpSettings of a dump of the whole synthetic chat into a file """
+    argv = ['telegram-messages-dump', '-p', '1', '-c', 'synthetic', '-q', '-l', '0',
+            '-o', out_file, '-e', exporter_name, '--max-rate', '1000000'] + list(dumper_args)
+    with mock.patch.object(sys, 'argv', argv):
+        return ChatDumpSettings(run.__doc__)
+
+
+def dump(out_file, exporter_name, history, *dumper_args, dumper_class=FakeTelegramDumper):
+    """ Dumps a synthetic history into a file in this process.
+        :param out_file:        Path of the resulting file
+        :param exporter_name:   E.g. 'text'
+        :param history:         SyntheticHistory
+        :param dumper_args:     Extra telegram-messages-dump options, e.g. '--async'
+        :param dumper_class:    FakeTelegramDumper or a class derived from it
+
+        :return (return code, dumper)
+    """
+    settings = get_settings(out_file, exporter_name, *dumper_args)
+    exporter = ExporterRegistry().load(settings.exporter)
+    dumper = dumper_class(settings, DumpMetadata(settings.out_file), exporter, history)
+    # The progress and the summaries of the runs are of no interest
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        return dumper.run(), dumper
+
+
+def read_file(file_path):
+    with open(file_path, 'rb') as file:
+        return file.read()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" End-to-end tests of the asyncio pipeline (--async) against the sequential fetch loop """
+
+import os
+import shutil
+import tempfile
+import unittest
+from benchmarks.synthetic import FakeTelegramDumper
+from benchmarks.synthetic import SyntheticHistory
+from tests.helpers import EXPORTERS
+from tests.helpers import dump
+from tests.helpers import read_file
+
+# Enough messages for several temp files (1000 messages per file by default)
+HISTORY_SIZE = 3500
+
+# Options of the asyncio pipeline runs -> name of the case
+ASYNC_CASES = {
+    'async': ['--async'],
+    'fetch-workers': ['--async', '--fetch-workers', '3'],
+    'format-workers': ['--async', '--format-workers', '2'],
+    'fetch-and-format-workers': ['--async', '--fetch-workers', '3', '--format-workers', '2'],
+    'memory-budget': ['--async', '--memory-budget', '64K'],
+}
+
+
+class _PipelineDumper(FakeTelegramDumper):
+    """ Fake dumper that counts the runs of the asyncio pipeline """
+
+    async def _dump_pipeline(self, *args, **kwargs):
+        self.pipeline_runs = getattr(self, 'pipeline_runs', 0) + 1
+        await super()._dump_pipeline(*args, **kwargs)
+
+
+class AsyncPipelineTest(unittest.TestCase):
+    """ The asyncio pipeline has to write exactly the same file as the sequential loop does """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.history = SyntheticHistory(HISTORY_SIZE, seed=1)
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='tmd-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_output_is_identical_to_sequential_loop(self):
+        for exporter in EXPORTERS:
+            expected_file = os.path.join(self.work_dir, 'sequential.' + exporter)
+            ret_code, _ = dump(expected_file, exporter, self.history)
+            self.assertEqual(ret_code, 0)
+            expected = read_file(expected_file)
+            self.assertEqual(expected.count(b'\n'),
+                             HISTORY_SIZE + (1 if exporter == 'csv' else 0))
+
+            for case, dumper_args in ASYNC_CASES.items():
+                with self.subTest(exporter=exporter, case=case):
+                    out_file = os.path.join(self.work_dir, '{}.{}'.format(case, exporter))
+                    ret_code, dumper = dump(out_file, exporter, self.history, *dumper_args,
+                                            dumper_class=_PipelineDumper)
+                    self.assertEqual(ret_code, 0)
+                    self.assertEqual(getattr(dumper, 'pipeline_runs', 0), 1)
+                    self.assertEqual(dumper.output_total_count, HISTORY_SIZE)
+                    self.assertTrue(read_file(out_file) == expected,
+                                    'Output differs from the sequential one.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Kill-and-resume tests of --checkpoint. A dump is killed with os._exit (no cleanup
+    at all, as with SIGKILL or a power loss) in the middle of fetching or merging,
+    and is resumed by the next run.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from benchmarks.synthetic import FakeTelegramDumper
+from benchmarks.synthetic import SyntheticHistory
+from tests.helpers import EXPORTERS
+from tests.helpers import REPO_DIR
+from tests.helpers import dump
+from tests.helpers import read_file
+
+# 5 temp files with the default memory budget
+HISTORY_SIZE = 5000
+
+HISTORY_SEED = 2
+
+# Exit code of a killed child
+KILLED = 9
+
+# Mode -> dumper options
+MODES = {
+    'sync': [],
+    'async': ['--async'],
+    'stream': ['--stream'],
+}
+
+# Where the first run is killed. Requests fetch 100 messages each.
+KILL_POINTS = {
+    'before-first-temp-file': {'kill_at_request': 3},
+    'mid-fetch': {'kill_at_request': 25},
+    'mid-merge': {'kill_at_merge': 2},
+}
+
+
+class _KilledDumper(FakeTelegramDumper):
+    """ Fake dumper that dies at a given request or temp file being merged """
+
+    kill_at_request = 0
+    kill_at_merge = 0
+
+    async def _get_messages_coro(self, peer, **kwargs):
+        if self._requests_count + 1 == self.kill_at_request:
+            os._exit(KILLED)
+        return await super()._get_messages_coro(peer, **kwargs)
+
+    def _merge_temp_files_into_final(self, resulting_file, temp_files_list_meta):
+        if self.kill_at_merge:
+            resulting_file = _KillingSink(resulting_file, self.kill_at_merge)
+        super()._merge_temp_files_into_final(resulting_file, temp_files_list_meta)
+
+
+class _KillingSink:
+    """ Proxy of a sink that dies once the given temp file is appended and flushed to disk """
+
+    def __init__(self, sink, kill_at):
+        self._sink = sink
+        self._kill_at = kill_at
+        self._count = 0
+
+    def append_temp_file(self, temp_file_path):
+        self._sink.append_temp_file(temp_file_path)
+        self._count += 1
+        if self._count == self._kill_at:
+            self._sink.sync()
+            os._exit(KILLED)
+
+
+def _run_child(case):
+    """ Runs a dump in this process (the child one) and exits with its return code """
+    history = SyntheticHistory(HISTORY_SIZE, seed=HISTORY_SEED)
+    _KilledDumper.kill_at_request = case.get('kill_at_request', 0)
+    _KilledDumper.kill_at_merge = case.get('kill_at_merge', 0)
+    ret_code, _ = dump(case['out_file'], case['exporter'], history, *case['dumper_args'],
+                       dumper_class=_KilledDumper)
+    sys.exit(ret_code)
+
+
+class CheckpointTest(unittest.TestCase):
+    """ A dump resumed from its checkpoint has to be identical to an uninterrupted one """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.work_dir = tempfile.mkdtemp(prefix='tmd-test-')
+        cls.expected = {}
+        history = SyntheticHistory(HISTORY_SIZE, seed=HISTORY_SEED)
+        for exporter in EXPORTERS:
+            expected_file = os.path.join(cls.work_dir, 'expected.' + exporter)
+            ret_code, _ = dump(expected_file, exporter, history)
+            assert ret_code == 0
+            cls.expected[exporter] = read_file(expected_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir, ignore_errors=True)
+
+    def test_resume_after_kill(self):
+        for mode, mode_args in MODES.items():
+            for kill_point, kill_args in KILL_POINTS.items():
+                if mode == 'stream' and 'kill_at_merge' in kill_args:
+                    # Nothing is merged in stream mode
+                    continue
+                for exporter in EXPORTERS:
+                    with self.subTest(mode=mode, kill_point=kill_point, exporter=exporter):
+                        self._check_resume(exporter, mode_args + ['--checkpoint'], kill_args)
+
+    def _check_resume(self, exporter, dumper_args, kill_args):
+        out_file = os.path.join(self.work_dir, 'out.' + exporter)
+        for file_path in (out_file, out_file + '.meta', out_file + '.senders'):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        case = {'out_file': out_file, 'exporter': exporter, 'dumper_args': dumper_args}
+
+        killed_case = dict(case, **kill_args)
+        self.assertEqual(self._spawn(killed_case), KILLED)
+        self.assertTrue(os.path.exists(out_file + '.checkpoint'))
+
+        self.assertEqual(self._spawn(case), 0)
+        self.assertTrue(read_file(out_file) == self.expected[exporter],
+                        'Resumed output differs from the uninterrupted one.')
+        self.assertFalse(os.path.exists(out_file + '.checkpoint'))
+        self.assertFalse(os.path.exists(out_file + '.segments'))
+
+    @staticmethod
+    def _spawn(case):
+        """ Runs a dump in a child process, so it can be killed for real
+
+            :return Exit code of the child
+        """
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+        return subprocess.run(
+            [sys.executable, '-m', 'tests.test_checkpoint', '--child', json.dumps(case)],
+            cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, check=False).returncode
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == '--child':
+        _run_child(json.loads(sys.argv[2]))
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of jsonl output being byte-identical to json.dumps(..., ensure_ascii=False)
+    with every string encoder backend that is installed
+"""
+
+import json
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+from telegram_messages_dump.exporters import jsonl_serializer
+from telegram_messages_dump.exporters.jsonl import jsonl
+from telegram_messages_dump.exporters.common import MessageRecord
+from telegram_messages_dump.exporter_context import ExporterContext
+
+# Strings that are escaped differently by JSON encoders, if at all
+EDGE_STRINGS = [
+    '',
+    'plain text',
+    'quotes " \' and back\\slashes \\" \\\\',
+    'forward /slashes/ </script>',
+    ''.join(chr(i) for i in range(0x20)),
+    '\x7f\x80\x9f\xa0\xad\xff',
+    'line\u2028and\u2029paragraph separators',
+    '\ufeff\ufffe\uffff',
+    'non-BMP \U0001f600\U0001f44d\U0001f3fd \U0001d11e \U0010ffff',
+    'Привет, мир! 你好 مرحبا',
+    'lone surrogates \ud800 \udfff \udbff\udbff',
+    '%s %d %% {} {0}',
+]
+
+_KEYS = ['message_id', 'from_id', 'reply_id', 'author', 'sent_by_bot',
+         'date', 'content', 'contains_media', 'media_content']
+
+
+def _get_backends():
+    """ :return list of (name, encode_str) of the installed backends """
+    backends = []
+    for name, make_encode_str in jsonl_serializer._BACKENDS:  # pylint: disable=protected-access
+        try:
+            backends.append((name, make_encode_str()))
+        except ImportError:
+            pass
+    return backends
+
+
+def _make_record(msg_id, string):
+    return MessageRecord(msg_id, datetime(2020, 1, 31, 18, 42, 5, tzinfo=timezone.utc),
+                         msg_id % 7 or None, msg_id - 1 if msg_id % 3 == 0 else None,
+                         string, msg_id % 2 == 0, string,
+                         'MessageMediaPhoto' if msg_id % 4 == 0 else None,
+                         string if msg_id % 4 == 0 else None, None)
+
+
+def _expected_line(record):
+    return json.dumps(dict(zip(_KEYS, [
+        record.id,
+        record.from_id,
+        str(record.reply_to_msg_id) if record.reply_to_msg_id is not None else '',
+        record.sender_name,
+        record.is_sent_by_bot,
+        record.date.isoformat(),
+        record.content,
+        record.media_type is not None,
+        '<{}> {}'.format(record.media_type, record.media_caption)
+        if record.media_type is not None else None,
+    ])), ensure_ascii=False)
+
+
+class JsonlSerializerTest(unittest.TestCase):
+
+    def test_backends_encode_strings_like_stdlib(self):
+        for name, encode_str in _get_backends():
+            for string in EDGE_STRINGS:
+                with self.subTest(backend=name, string=string):
+                    self.assertEqual(encode_str(string), json.dumps(string, ensure_ascii=False))
+
+    def test_format_batch_is_identical_to_json_dumps(self):
+        records = [_make_record(msg_id, string)
+                   for msg_id, string in enumerate(EDGE_STRINGS * 4, 1)]
+        expected = [_expected_line(record) for record in records]
+        exporter = jsonl()
+        value_encoders = jsonl_serializer._VALUE_ENCODERS  # pylint: disable=protected-access
+        for name, encode_str in _get_backends():
+            with self.subTest(backend=name), \
+                    mock.patch.dict(value_encoders, {str: encode_str}):
+                self.assertEqual(exporter.format_batch(records, ExporterContext()), expected)
+                self.assertEqual([exporter.format(record, ExporterContext())
+                                  for record in records], expected)
+
+    def test_selected_backend_is_installed(self):
+        self.assertIn(jsonl_serializer.BACKEND_NAME, [name for name, _ in _get_backends()])
+
+
+if __name__ == '__main__':
+    unittest.main()
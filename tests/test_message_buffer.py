@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the spilling decisions of buffers sharing a memory budget """
+
+import sys
+import unittest
+from telegram_messages_dump.message_buffer import MemoryBudget
+from telegram_messages_dump.message_buffer import MessageBuffer
+
+BUDGET_BYTES = 64 * 1024
+
+
+def _make_lines(count, length):
+    return ['x' * length + str(number) for number in range(count)]
+
+
+def _get_size(lines):
+    return sum(map(sys.getsizeof, lines))
+
+
+class MessageBufferTest(unittest.TestCase):
+
+    def test_small_buffer_is_not_spilled_by_large_one(self):
+        budget = MemoryBudget(BUDGET_BYTES)
+        large, small = MessageBuffer(budget), MessageBuffer(budget)
+        small.extend(_make_lines(10, 100))
+        self.assertFalse(small.is_full())
+
+        large.extend(_make_lines(100, 1000))
+        self.assertGreaterEqual(budget.buffered_bytes, BUDGET_BYTES)
+        self.assertEqual(budget.active_buffers_count, 2)
+        self.assertTrue(large.is_full())
+        self.assertFalse(small.is_full())
+
+        lines, _ = large.take()
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(budget.active_buffers_count, 1)
+        self.assertEqual(budget.buffered_bytes, small.size_in_bytes)
+        self.assertFalse(small.is_full())
+
+    def test_buffers_of_equal_shares_are_spilled(self):
+        budget = MemoryBudget(BUDGET_BYTES)
+        buffers = [MessageBuffer(budget), MessageBuffer(budget)]
+        for buffer in buffers:
+            buffer.extend(_make_lines(20, 1000))
+            self.assertFalse(buffer.is_full())
+        buffers[0].extend(_make_lines(20, 1000))
+        buffers[1].extend(_make_lines(20, 1000))
+        self.assertTrue(all(buffer.is_full() for buffer in buffers))
+
+    def test_budget_accounting(self):
+        budget = MemoryBudget(BUDGET_BYTES)
+        buffer = MessageBuffer(budget)
+        lines = _make_lines(3, 10)
+        buffer.extend(lines)
+        self.assertEqual(budget.buffered_bytes, _get_size(lines))
+        buffer.pop()
+        buffer.pop()
+        self.assertEqual(budget.active_buffers_count, 1)
+        buffer.pop()
+        self.assertEqual(budget.buffered_bytes, 0)
+        self.assertEqual(budget.active_buffers_count, 0)
+        buffer.extend([])
+        buffer.clear()
+        self.assertEqual(budget.active_buffers_count, 0)
+
+    def test_no_budget(self):
+        budget = MemoryBudget()
+        small, large = MessageBuffer(budget), MessageBuffer(budget)
+        small.extend(_make_lines(10, 10))
+        large.extend(_make_lines(MemoryBudget.DEFAULT_SPILL_SIZE, 10))
+        self.assertTrue(large.is_full())
+        self.assertFalse(small.is_full())
+
+
+if __name__ == '__main__':
+    unittest.main()
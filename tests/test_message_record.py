@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Memory footprint of MessageRecord pages against the Telethon message ones,
+    and the size of the pages sent to formatting worker processes
+"""
+
+import pickle
+import unittest
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from telethon.tl.patched import Message
+from telethon.tl.types import User, PeerChannel
+from telegram_messages_dump.exporters.common import MessageRecord
+from telegram_messages_dump.exporters.jsonl import jsonl
+from telegram_messages_dump.exporter_context import ExporterContext
+
+MESSAGES_COUNT = 2000
+
+SENDERS_COUNT = 50
+
+# Messages per request, i.e. per page
+PAGE_SIZE = 100
+
+# Upper bounds of MessageRecord memory per message (the measured values are
+# ~2000 B per Telethon message and ~140 B per record)
+MAX_RECORD_BYTES = 400
+MAX_RECORD_TO_MESSAGE_RATIO = 0.2
+
+# Upper bound of a pickled page minus its texts, per message (~50 B measured)
+MAX_PICKLED_OVERHEAD_BYTES = 100
+
+
+def _make_messages():
+    """ :return list of Telethon messages with their sender entities attached, newest first """
+    senders = {user_id: User(user_id, access_hash=user_id * 7919, username='user%d' % user_id,
+                             first_name='First%d' % user_id, last_name='Last')
+               for user_id in range(1, SENDERS_COUNT + 1)}
+    start_date = datetime(2020, 1, 31, 18, 42, 5, tzinfo=timezone.utc)
+    messages = []
+    for msg_id in range(MESSAGES_COUNT, 0, -1):
+        msg = Message(msg_id, to_id=PeerChannel(1), date=start_date + timedelta(seconds=msg_id),
+                      from_id=msg_id % SENDERS_COUNT + 1,
+                      reply_to_msg_id=msg_id - 1 if msg_id % 5 == 0 else None,
+                      message='text of message number %d. ' % msg_id * 3)
+        msg._finish_init(None, senders, None)  # pylint: disable=protected-access
+        messages.append(msg)
+    return messages
+
+
+def _traced(make):
+    """ :return (result of make(), bytes allocated by it and still alive) """
+    tracemalloc.start()
+    try:
+        result = make()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+class MessageRecordTest(unittest.TestCase):
+
+    def test_records_are_smaller_than_messages(self):
+        messages, messages_size = _traced(_make_messages)
+        records, records_size = _traced(
+            lambda: [MessageRecord.from_message(msg) for msg in messages])
+        self.assertEqual(len(records), MESSAGES_COUNT)
+        self.assertEqual(records[0].sender_name, messages[0].sender.username)
+
+        self.assertLess(records_size / MESSAGES_COUNT, MAX_RECORD_BYTES)
+        self.assertLess(records_size / messages_size, MAX_RECORD_TO_MESSAGE_RATIO)
+
+    def test_pickled_page_size(self):
+        messages = _make_messages()
+        for page_start in range(0, MESSAGES_COUNT, PAGE_SIZE * 5):
+            page = [MessageRecord.from_message(msg)
+                    for msg in messages[page_start:page_start + PAGE_SIZE]]
+            texts_size = sum(len(record.content.encode('utf-8')) for record in page)
+            # The arguments FormattingPool.submit sends to a worker along with every page
+            pickled_size = len(pickle.dumps((jsonl(), ExporterContext(), page, False)))
+            with self.subTest(page_start=page_start):
+                self.assertLess((pickled_size - texts_size) / PAGE_SIZE,
+                                MAX_PICKLED_OVERHEAD_BYTES)
+
+
+if __name__ == '__main__':
+    unittest.main()
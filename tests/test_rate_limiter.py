@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the bounds of the adaptive rate limiter """
+
+import unittest
+from telegram_messages_dump.rate_limiter import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_max_rate_below_initial_rate(self):
+        limiter = RateLimiter(max_rate=0.2)
+        self.assertEqual(limiter.rate, 0.2)
+        for _ in range(50):
+            limiter.reserve()
+            limiter.on_success()
+            self.assertLessEqual(limiter.rate, 0.2)
+        self.assertLessEqual(limiter.peak_rate, 0.2)
+
+    def test_requests_are_paced_by_max_rate(self):
+        limiter = RateLimiter(max_rate=0.2)
+        self.assertEqual(limiter.reserve(), 0)
+        limiter.on_success()
+        # Two requests in a row are 1 / max_rate seconds apart
+        self.assertAlmostEqual(limiter.reserve(), 1 / 0.2, places=2)
+
+    def test_rate_stays_within_bounds(self):
+        limiter = RateLimiter(rate=10, max_rate=3, min_rate=0.5)
+        self.assertEqual(limiter.rate, 3)
+        for _ in range(10):
+            limiter.on_flood_wait(0, 0)
+            self.assertGreaterEqual(limiter.rate, 0.5)
+        for _ in range(200):
+            limiter.on_success()
+            self.assertLessEqual(limiter.rate, 3)
+        self.assertEqual(limiter.lowest_rate, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
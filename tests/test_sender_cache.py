@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the resolution of message senders through the sender cache """
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from benchmarks.synthetic import SyntheticMessage
+from benchmarks.synthetic import SyntheticUser
+from telegram_messages_dump.sender_cache import SenderCache
+from telegram_messages_dump.exporters.common import common
+
+_DATE = datetime(2020, 1, 31, 18, 42, 5, tzinfo=timezone.utc)
+
+
+def _make_message(msg_id, sender):
+    return SyntheticMessage(msg_id, _DATE, sender, None, 'text', None)
+
+
+class SenderCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='tmd-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_renamed_sender_of_previous_run(self):
+        senders_file = os.path.join(self.work_dir, 'out.log.senders')
+        previous_cache = SenderCache()
+        previous_cache.put(7, 'old_name', False)
+        previous_cache.save(senders_file)
+
+        sender_cache = SenderCache()
+        sender_cache.load(senders_file)
+        sender_cache.set_exporter_form(7, 'csv', '"old_name"')
+        renamed = SyntheticUser(7, 'new_name', None, None, False)
+        self.assertEqual(common.get_message_sender(_make_message(1, renamed), sender_cache),
+                         ('new_name', False))
+        self.assertEqual(sender_cache.get(7), ('new_name', False))
+        self.assertIsNone(sender_cache.get_exporter_form(7, 'csv'))
+
+        sender_cache.save(senders_file)
+        sender_cache = SenderCache()
+        sender_cache.load(senders_file)
+        self.assertEqual(sender_cache.get(7), ('new_name', False))
+
+    def test_message_without_sender_entity(self):
+        sender_cache = SenderCache()
+        sender_cache.put(7, 'cached_name', True)
+        msg = _make_message(1, SyntheticUser(7, 'name', None, None, False))
+        msg.sender = None
+        self.assertEqual(common.get_message_sender(msg, sender_cache), ('cached_name', True))
+
+        msg.from_id = 8
+        self.assertEqual(common.get_message_sender(msg, sender_cache), ('???', None))
+        self.assertIsNone(sender_cache.get(8))
+
+    def test_unchanged_sender_keeps_exporter_forms(self):
+        sender_cache = SenderCache()
+        sender = SyntheticUser(7, 'name', None, None, False)
+        common.get_message_sender(_make_message(1, sender), sender_cache)
+        sender_cache.set_exporter_form(7, 'csv', '"name"')
+        common.get_message_sender(_make_message(2, sender), sender_cache)
+        self.assertEqual(sender_cache.get_exporter_form(7, 'csv'), '"name"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the upserts of the sqlite exporter """
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from telegram_messages_dump.exporters.sqlite import sqlite
+from telegram_messages_dump.exporters.common import MessageRecord
+from telegram_messages_dump.exporter_context import ExporterContext
+
+_DATE = datetime(2020, 1, 31, 18, 42, 5, tzinfo=timezone.utc)
+
+
+def _make_record(msg_id, from_id, sender_name, media_type=None):
+    return MessageRecord(msg_id, _DATE, from_id, None, sender_name, False, 'text %d' % msg_id,
+                         media_type, 'caption %d' % msg_id if media_type else None, None)
+
+
+class SqliteExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='tmd-test-')
+        self.db_file = os.path.join(self.work_dir, 'out.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _dump(self, records, is_continue_mode=False):
+        exporter = sqlite()
+        context = ExporterContext()
+        context.is_continue_mode = is_continue_mode
+        sink = exporter.open_sink(self.db_file, context)
+        sink.write_lines(exporter.format_batch(records, context))
+        sink.close()
+
+    def _query(self, statement):
+        conn = sqlite3.connect(self.db_file)
+        try:
+            return conn.execute(statement).fetchall()
+        finally:
+            conn.close()
+
+    def test_channel_post_author(self):
+        self._dump([_make_record(1, None, 'channel_name'), _make_record(2, 7, 'user7')])
+        self.assertEqual(self._query('SELECT message_id, from_id, author FROM messages'
+                                     ' ORDER BY message_id'),
+                         [(1, None, 'channel_name'), (2, 7, 'user7')])
+        self.assertEqual(self._query('SELECT from_id, name FROM senders'), [(7, 'user7')])
+
+    def test_removed_media_is_deleted(self):
+        self._dump([_make_record(1, 7, 'user7', 'MessageMediaPhoto'),
+                    _make_record(2, 7, 'user7', 'MessageMediaDocument')])
+        self._dump([_make_record(1, 7, 'user7'),
+                    _make_record(2, 7, 'user7', 'MessageMediaPhoto')], is_continue_mode=True)
+        self.assertEqual(self._query('SELECT message_id, type, caption FROM media'),
+                         [(2, 'MessageMediaPhoto', 'caption 2')])
+        self.assertEqual(self._query('SELECT COUNT(*) FROM messages'), [(2,)])
+
+    def test_new_dump_overwrites_database(self):
+        self._dump([_make_record(1, 7, 'user7', 'MessageMediaPhoto'), _make_record(2, 8, 'user8')])
+        self._dump([_make_record(3, 9, 'user9')])
+        self.assertEqual(self._query('SELECT message_id FROM messages'), [(3,)])
+        self.assertEqual(self._query('SELECT from_id FROM senders'), [(9,)])
+        self.assertEqual(self._query('SELECT COUNT(*) FROM media'), [(0,)])
+        self.assertEqual(self._query("SELECT value FROM meta WHERE key = 'latest_message_id'"),
+                         [(3,)])
+
+    def test_database_without_author_column(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('CREATE TABLE messages (message_id INTEGER PRIMARY KEY, date INTEGER,'
+                     ' from_id INTEGER, reply_id INTEGER, content TEXT)')
+        conn.execute("INSERT INTO messages VALUES (1, 0, NULL, NULL, 'old')")
+        conn.commit()
+        conn.close()
+
+        self._dump([_make_record(2, None, 'channel_name')], is_continue_mode=True)
+        self.assertEqual(self._query('SELECT message_id, content, author FROM messages'
+                                     ' ORDER BY message_id'),
+                         [(1, 'old', None), (2, 'text 2', 'channel_name')])
+
+
+if __name__ == '__main__':
+    unittest.main()
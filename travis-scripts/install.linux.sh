@@ -10,12 +10,13 @@ pyinstaller -F -n telegram-messages-dump \
 -c ./telegram_messages_dump/__main__.py \
 --hidden-import telegram_messages_dump.exporters.text \
 --hidden-import telegram_messages_dump.exporters.jsonl \
---hidden-import telegram_messages_dump.exporters.csv
+--hidden-import telegram_messages_dump.exporters.csv \
+--hidden-import telegram_messages_dump.exporters.sqlite
 
 #Setup build env for Windows: pyinstaller+telethon
 # wine pip install -I telethon==1.6.2
 # wine pip install pyinstaller
-# wine pyinstaller -n telegram-messages-dump.exe --onefile --clean --win-private-assemblies -c --noconfirm --log-level=WARN ./telegram_messages_dump/__main__.py --hidden-import telegram_messages_dump.exporters.text --hidden-import telegram_messages_dump.exporters.jsonl --hidden-import telegram_messages_dump.exporters.csv
+# wine pyinstaller -n telegram-messages-dump.exe --onefile --clean --win-private-assemblies -c --noconfirm --log-level=WARN ./telegram_messages_dump/__main__.py --hidden-import telegram_messages_dump.exporters.text --hidden-import telegram_messages_dump.exporters.jsonl --hidden-import telegram_messages_dump.exporters.csv --hidden-import telegram_messages_dump.exporters.sqlite
 
 #Package for distribution
 cd ./dist
@@ -6,6 +6,7 @@ pyinstaller -n telegram-messages-dump --noconsole --onefile \
 --hidden-import telegram_messages_dump.exporters.text \
 --hidden-import telegram_messages_dump.exporters.jsonl \
 --hidden-import telegram_messages_dump.exporters.csv \
+--hidden-import telegram_messages_dump.exporters.sqlite \
  ./telegram_messages_dump/__main__.py
 
 #Package for distribution